@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.core.cache import cache
 from .models import Account, UserProfile
 from agent.models import ChatMessage
+from agent.ratelimit import reset_user
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
 
@@ -9,8 +9,7 @@ from django.utils.html import format_html
 @admin.action(description="Reset chat message limit for selected users")
 def reset_chat_limit(modeladmin, request, queryset):
     for user in queryset:
-        cache.delete(f"chat_limit_user_{user.id}")
-        cache.delete(f"chat_blocked_{user.id}")
+        reset_user(user.id)
         # Optionally clear old messages to avoid confusion
         ChatMessage.objects.filter(user=user).delete()
     modeladmin.message_user(request, "Chat limits reset for selected users.")
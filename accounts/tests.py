@@ -1,3 +1,48 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.db import DatabaseError
 from django.test import TestCase
+from django.urls import reverse
+
+from carts import services
+from carts.models import Cart
+from category.models import Category
+from store.models import Product
+from .models import Account
+
+
+class LoginCartMergeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user('Ann', 'Lee', 'ann', 'ann@example.com', 'pw12345', '1234567890')
+        cls.user.is_active = True
+        cls.user.save()
+        category = Category.objects.create(category_name='Plants', slug='plants')
+        cls.fern = Product.objects.create(
+            product_name='Fern', slug='fern', description='A fern', price=Decimal('10.00'), stock=10, category=category,
+        )
+
+    def setUp(self):
+        session = self.client.session
+        session.save()
+        self.cart = Cart.objects.create(cart_id=session.session_key)
+        services.add_item(self.fern.id, quantity=2, cart=self.cart)
+
+    def login(self):
+        return self.client.post(reverse('login'), {'email': 'ann@example.com', 'password': 'pw12345'})
+
+    def test_session_cart_moves_to_the_user(self):
+        self.login()
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.id)
+        self.assertEqual([line.quantity for line in services.owner_lines(user=self.user)], [2])
+        self.assertFalse(services.owner_lines(cart=self.cart).exists())
 
-# Create your tests here.
+    def test_failed_merge_is_logged_and_login_succeeds(self):
+        with mock.patch('accounts.views.merge_session_cart', side_effect=DatabaseError('deadlock')), \
+                self.assertLogs('accounts.views', 'ERROR') as logs:
+            self.login()
+        self.assertIn(f"Merging session cart {self.cart.id} into user {self.user.id} failed", logs.output[0])
+        self.assertIn('deadlock', logs.output[0])
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.id)
+        self.assertEqual([line.quantity for line in services.owner_lines(cart=self.cart)], [2])
@@ -3,8 +3,8 @@ from .forms import RegistrationForm, UserForm, UserProfileForm
 from .models import Account, UserProfile
 from django.contrib import messages, auth
 from django.contrib.auth.decorators import login_required
-from carts.models import Cart, CartItem
-from carts.views import _cart_id
+from carts.services import merge_session_cart, session_cart
+from django.db import DatabaseError
 import requests
 from orders.models import Order, OrderProduct
 
@@ -14,6 +14,10 @@ from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import EmailMessage
+import logging
+
+logger = logging.getLogger(__name__)
+
 # Create your views here.
 def register(request):
     if request.method == 'POST':
@@ -67,46 +71,14 @@ def login(request):
         user = auth.authenticate(email=email, password=password)
 
         if user is not None:
-            try:
-                cart = Cart.objects.get(cart_id=_cart_id(request))
-                is_cart_item_exist = CartItem.objects.filter(cart=cart).exists()
-                if is_cart_item_exist:
-                    cart_item = CartItem.objects.filter(cart=cart)
-                    
-                    #getting product variation by cart id
-                    product_variation = []
-                    for item in cart_item:
-                        variation = item.variation.all()
-                        product_variation.append(list(variation))
-
-                    #get cart items from user to access his product variation
-                    cart_item = CartItem.objects.filter(user = user)
-                    ex_var_list=[]
-                    id = []
-                    for item in cart_item:
-                        existing_variation = item.variation.all()
-                        ex_var_list.append(list(existing_variation))
-                        id.append(item.id)
-
-                    # let product_variation = [1, 2, 3, 4, 6]
-                    # and ex_var_list=[4, 6, 3, 5]
-                    # now we have to check common in both list
-                    for pr in product_variation:
-                        if pr in ex_var_list:
-                            index = ex_var_list.index(pr)
-                            item_id = id[index]
-                            item = CartItem.objects.get(id = item_id)
-                            item.quantity += 1
-                            item.user = user
-                            item.save()
-                        else:
-                            cart_item = CartItem.objects.filter(cart=cart)
-                            for item in cart_item:
-                                item.user = user
-                                item.save()
-
-            except:
-                pass
+            # Bring the anonymous cart along: one transaction and a fixed number of queries
+            cart = session_cart(request, create=False)
+            if cart is not None:
+                try:
+                    merge_session_cart(cart, user)
+                except DatabaseError:
+                    # The login still succeeds, the lines stay in the session cart
+                    logger.exception("Merging session cart %s into user %s failed", cart.id, user.id)
             auth.login(request, user)
             # messsages.success(request, 'You are now logged in.')
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.db.models import Max
-from .models import ChatMessage, ChatSession, ChatImage
+from .models import ChatMessage, ChatSession, ChatImage, PlantIdentification, AgentTask, AgentTrace
 
 class UserChatSummaryAdmin(admin.ModelAdmin):
     list_display = ('user', 'concatenated_messages', 'latest_timestamp')
@@ -45,4 +45,37 @@ class UserChatSummaryAdmin(admin.ModelAdmin):
 
 admin.site.register(ChatMessage, UserChatSummaryAdmin)
 admin.site.register(ChatSession)
-admin.site.register(ChatImage)
\ No newline at end of file
+admin.site.register(ChatImage)
+
+@admin.register(AgentTrace)
+class AgentTraceAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'wall_ms', 'tokens_in', 'tokens_out', 'cost', 'llm_calls', 'tool_calls', 'db_queries', 'slowest_node')
+    search_fields = ('user__email', 'thread_id')
+    list_filter = ('user',)
+    date_hierarchy = 'created_at'
+    exclude = ('nodes',)
+    readonly_fields = ('user', 'thread_id', 'turn_id', 'created_at', 'wall_ms', 'tokens_in', 'tokens_out', 'llm_calls', 'tool_calls', 'db_queries', 'cost', 'node_breakdown')
+
+    def node_breakdown(self, obj):
+        # Slowest node first
+        lines = []
+        for node, stats in sorted(obj.nodes.items(), key=lambda item: -item[1].get('wall_ms', 0)):
+            lines.append(
+                f"{node}: {stats.get('wall_ms', 0)} ms, tokens {stats.get('tokens_in', 0)}/{stats.get('tokens_out', 0)}, "
+                f"LLM calls {stats.get('llm_calls', 0)}, tool calls {stats.get('tool_calls', 0)}, queries {stats.get('db_queries', 0)}"
+            )
+        return "\n".join(lines)
+    node_breakdown.short_description = "Per-node breakdown"
+
+@admin.register(PlantIdentification)
+class PlantIdentificationAdmin(admin.ModelAdmin):
+    list_display = ('plant_name', 'hits', 'created_at', 'last_hit_at')
+    search_fields = ('plant_name',)
+    readonly_fields = ('image_hash', 'hash_band0', 'hash_band1', 'hash_band2', 'hash_band3', 'chat_image', 'hits', 'created_at', 'last_hit_at')
+
+@admin.register(AgentTask)
+class AgentTaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'locked_by', 'created_at', 'finished_at')
+    list_filter = ('name', 'status')
+    exclude = ('data',)
+    readonly_fields = ('name', 'payload', 'status', 'result', 'error', 'attempts', 'run_after', 'locked_by', 'locked_at', 'created_at', 'finished_at')
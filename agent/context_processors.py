@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+
+def chat_widget(request):
+    """
+    Whether the chat widget streams replies from /agent/ask/stream/. Only when this page was
+    served over ASGI: under WSGI the streamed response is buffered, so the widget uses /agent/ask/.
+    """
+    return {
+        'agent_streaming': settings.AGENT_STREAMING and isinstance(request, ASGIRequest),
+    }
@@ -1,58 +1,54 @@
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.tools import tool
 from langchain_tavily import TavilySearch
 from langgraph.prebuilt import create_react_agent
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.types import interrupt, Command
+from langgraph.utils.runnable import RunnableCallable
 from typing import Annotated, TypedDict, List, Dict, Any
 from dotenv import load_dotenv
+from .checkpointer import build_checkpointer
+from .router import ROUTES, ROUTING_EXAMPLES, SIDE_EFFECT_ROUTES, fast_route, independent_intents, split_intents, router_stats
+from .research_cache import QuestionCache
+from .image_hash import dhash
+from .image_pipeline import process_upload
+from .tracing import TurnTrace, record_llm_usage, task_scope, traced
+from agent.tasks import TaskFailed, TaskFuture, enqueue
+from agent.ratelimit import RateLimitExceeded, limit_upstream
 from .tools import get_cart_items, add_to_cart, remove_cart_item, get_my_orders_url, get_orders_by_date, get_order_details_by_id, get_checkout_url, get_most_recent_order, recommend_products_for_plant, list_product_variations
-from category.models import Category
-from store.models import Product
-from PIL import Image
-import io
-import base64
+from store.catalog import get_catalog
 from openai import OpenAI
 from django.core.files.base import ContentFile
-from agent.models import ChatImage
+import io
+import base64
+from PIL import Image
+from agent.models import ChatImage, PlantIdentification
+from django.db.models import F
 from django.utils import timezone
 from accounts.models import Account
-import difflib
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from contextvars import copy_context
+from functools import partial, wraps
+from django.conf import settings
+from django.db import close_old_connections
 from langchain_core.messages.utils import trim_messages, count_tokens_approximately
 
 load_dotenv()
 
-# Create SQLite-based checkpointer for short-term memory
-checkpointer = InMemorySaver()
+# Checkpointer for short-term memory (Postgres-backed by default, see settings.AGENT_CHECKPOINTER)
+checkpointer = build_checkpointer()
 
 # --- Plant Identification Function ---
-def resize_image_if_needed(image_file, max_size=1024):
-    image = Image.open(image_file)
-    if max(image.size) > max_size:
-        image.thumbnail((max_size, max_size))
-        output = io.BytesIO()
-        image.save(output, format=image.format)
-        output.seek(0)
-        return output, image.format
-    else:
-        image_file.seek(0)
-        return image_file, image.format
-
-def identify_plant_from_image(image_file) -> str:
+def identify_plant_from_image(image_url: str) -> str:
     """
-    Identify plant from uploaded image.
+    Identify plant from an uploaded image, given as a data URL (see image_pipeline.process_upload).
     Returns the plant name or "Unknown" if identification fails.
     """
     try:
-        # Resize and prepare the image for OpenAI API (old logic)
-        resized_file, img_format = resize_image_if_needed(image_file)
-        image_bytes = resized_file.read()
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-        mime_type = f"image/{img_format.lower()}"
-        image_url = f"data:{mime_type};base64,{image_b64}"
-
         client = OpenAI()
         response = client.responses.create(
             model="gpt-4.1-nano-2025-04-14",
@@ -72,6 +68,8 @@ def identify_plant_from_image(image_file) -> str:
             temperature=0.1,
             top_p=1,
         )
+        if response.usage:
+            record_llm_usage(response.model, response.usage.input_tokens, response.usage.output_tokens)
         # Use output_text as in the old code
         plant_name = response.output_text.strip()
         # Clean up the response
@@ -89,24 +87,128 @@ def identify_plant_from_image(image_file) -> str:
         print(f"Error in plant identification: {str(e)}")
         return "Unknown"
 
+def identify_plant_cached(image, image_url: str, chat_image=None) -> str:
+    """
+    identify_plant_from_image behind a perceptual-hash cache: an image within
+    AGENT_PLANT_ID_MAX_DISTANCE bits (dHash) of an earlier identified upload
+    reuses that result without calling the vision model.
+    """
+    try:
+        image_hash = dhash(image)
+        cached = PlantIdentification.objects.nearest(image_hash, settings.AGENT_PLANT_ID_MAX_DISTANCE)
+    except Exception as e:
+        print(f"Error in plant identification cache: {str(e)}")
+        return identify_plant_from_image(image_url)
+    if cached:
+        PlantIdentification.objects.filter(pk=cached.pk).update(hits=F("hits") + 1, last_hit_at=timezone.now())
+        print(f"[PLANT-ID] Image matched cached identification: {cached.plant_name}")
+        return cached.plant_name
+    plant_name = identify_plant_from_image(image_url)
+    # Failed identifications are not cached, they may be transient API errors
+    if plant_name and plant_name != "Unknown":
+        PlantIdentification.objects.remember(image_hash, plant_name, chat_image)
+    return plant_name
+
+def store_chat_image(user_id: int, image_file) -> tuple:
+    """
+    Decode an upload once and store its chat thumbnail (on the request path, so the image is in
+    the chat history whether or not a worker runs). Returns (chat_image, processed image).
+    """
+    processed = process_upload(
+        image_file,
+        max_size=settings.AGENT_IMAGE_MAX_SIZE,
+        model_format=settings.AGENT_IMAGE_MODEL_FORMAT,
+        quality=settings.AGENT_IMAGE_MODEL_QUALITY,
+    )
+    stats = processed.stats
+    print(
+        f"[IMAGE] decode {stats['decode_ms']:.1f}ms, encode {stats['encode_ms']:.1f}ms, "
+        f"{stats['original_bytes']} -> {stats['model_bytes']} bytes to model (saved {stats['bytes_saved']})"
+    )
+
+    # Save resized image to DB
+    filename = f"user_{user_id}_chat_{timezone.now().strftime('%Y%m%d%H%M%S')}.{processed.stored_ext}"
+    chat_image = ChatImage.objects.create(user_id=user_id)
+    chat_image.image.save(filename, ContentFile(processed.stored_bytes), save=True)
+    return chat_image, processed
+
+def process_chat_image(payload: dict, data: bytes) -> dict:
+    """
+    Background task (agent.tasks, "identify_chat_image"): identify the plant in a stored chat
+    image from its model payload (`data`, of type payload "model_mime"), which also feeds the
+    perceptual hash. Its usage is traced as the "identify_plant" node of the turn that uploaded
+    the image (payload "turn_id").
+    """
+    with task_scope(payload.get("turn_id", ""), payload["user_id"], "identify_plant"):
+        image = Image.open(io.BytesIO(data))
+        image_url = f"data:{payload['model_mime']};base64,{base64.b64encode(data).decode('utf-8')}"
+        chat_image = ChatImage.objects.filter(pk=payload["chat_image_id"]).first()
+        # Identify plant from image (cached by perceptual hash)
+        plant_name = identify_plant_cached(image, image_url, chat_image)
+        return {"plant_name": plant_name, "chat_image_id": payload["chat_image_id"]}
+
+def resolve_identified_plant(state, wait: bool = True) -> str:
+    """
+    Plant identified from this turn's upload. The identification runs as a background task;
+    only nodes that need the plant wait for it. With wait=False an unfinished task gives "".
+    """
+    task_id = state.get("plant_id_task")
+    if not task_id:
+        return state.get("identified_plant", "")
+    future = TaskFuture(task_id)
+    if not wait and not future.done():
+        return ""
+    try:
+        result = future.result(timeout=settings.AGENT_PLANT_ID_TIMEOUT)
+    except (TaskFailed, TimeoutError) as e:
+        print(f"Error in plant identification: {str(e)}")
+        return "Unknown"
+    return (result or {}).get("plant_name") or "Unknown"
+
+def remember_identified_plant(state, identified_plant: str) -> dict:
+    """
+    State update recording this turn's identification for later turns: the plant goes into state
+    and into the turn's message ("Image uploaded: Yes. Plant identified: X."), which is replaced
+    in the checkpointed history, so a follow-up like "how often should I water it?" still has it.
+    """
+    if not state.get("plant_id_task") or not identified_plant or identified_plant == "Unknown":
+        return {}
+    message = state["messages"][-1]
+    if not isinstance(message, HumanMessage) or "Plant identified:" in message.content:
+        return {"identified_plant": identified_plant}
+    content = message.content.replace("Image uploaded: Yes. ", f"Image uploaded: Yes. Plant identified: {identified_plant}. ", 1)
+    return {"identified_plant": identified_plant, "messages": [HumanMessage(content=content, id=message.id)]}
+
 # --- State Definitions ---
 class InputState(TypedDict):
     messages: Annotated[List, add_messages]
     user_id: int
     image_b64: str
+    plant_id_task: int  # AgentTask id of this turn's image identification, 0 without an upload
 
 class OutputState(TypedDict):
     messages: Annotated[List, add_messages]
     response: str
 
+def merge_intermediate_results(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Parallel agent branches each add their own entry; an empty update (sent by the supervisor) resets it"""
+    if not update:
+        return {}
+    return {**(current or {}), **update}
+
+def latest_plant(current: str, update: str) -> str:
+    """Parallel branches may both record the (same) identified plant"""
+    return update or current or ""
+
 class OverallState(TypedDict):
     messages: Annotated[List, add_messages]
     user_id: int
     image_b64: str
     agent_type: List[str]
-    intermediate_results: Dict[str, Any]
+    intermediate_results: Annotated[Dict[str, Any], merge_intermediate_results]
     response: str
-    identified_plant: str
+    identified_plant: Annotated[str, latest_plant]  # kept across turns, see remember_identified_plant
+    plant_id_task: int
     pending_variation_selection: Dict[str, Any]  # For HIL variation selection
 
 def pre_model_hook(state):
@@ -121,10 +223,38 @@ def pre_model_hook(state):
     return {"llm_input_messages": trimmed_messages}
 
 # --- LLMs and Agents ---
-supervisor_llm = ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.3)
-web_search = TavilySearch(max_results=2)
+supervisor_llm = ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.3, stream_usage=True)
+tavily_search = TavilySearch(max_results=2)
+
+# Care questions repeat across users: cache final research answers (per identified plant)
+# and raw search results (per query) so repeats skip both the LLM and Tavily.
+research_cache = QuestionCache(
+    ttl=settings.AGENT_RESEARCH_CACHE_TTL,
+    max_entries=settings.AGENT_RESEARCH_CACHE_SIZE,
+)
+search_cache = QuestionCache(
+    ttl=settings.AGENT_RESEARCH_CACHE_TTL,
+    max_entries=settings.AGENT_RESEARCH_CACHE_SIZE,
+)
 
-cart_agent_llm = ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.7)
+@tool
+def web_search(query: str):
+    """
+    Search the web for up-to-date plant care information. Returns the top search results.
+    """
+    cached = search_cache.get(query)
+    if cached is not None:
+        return cached
+    try:
+        limit_upstream("tavily")
+    except RateLimitExceeded:
+        return "Web search is busy right now. Answer from your own plant care knowledge."
+    started = time.perf_counter()
+    results = tavily_search.invoke({"query": query})
+    search_cache.put(query, results, cost_seconds=time.perf_counter() - started)
+    return results
+
+cart_agent_llm = ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.7, stream_usage=True)
 cart_agent = create_react_agent(
     model=cart_agent_llm,
     tools=[get_cart_items, add_to_cart, remove_cart_item, list_product_variations],
@@ -146,7 +276,7 @@ cart_agent = create_react_agent(
 )
 
 research_agent = create_react_agent(
-    model=ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.7),
+    model=ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.7, stream_usage=True),
     tools=[web_search],
     prompt="""You are a plant research assistant.
     You answer ONLY questions about plant care, watering frequency, soil type, nutrients, sunlight, pests, diseases, and any other plant-related information.
@@ -162,7 +292,7 @@ research_agent = create_react_agent(
 )
 
 order_agent = create_react_agent(
-    model=ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.7),
+    model=ChatOpenAI(model="gpt-4.1-nano-2025-04-14", temperature=0.7, stream_usage=True),
     tools=[get_order_details_by_id, get_my_orders_url, get_orders_by_date, get_checkout_url, get_most_recent_order],
     prompt="""You are a helpful plant store assistant. You can ONLY help users with:
     1. Redirecting them to the 'My Orders' page. Use the get_my_orders_url tool. Always share the link in a clear and user-friendly way.
@@ -184,12 +314,11 @@ def extract_category_llm(user_prompt: str, llm) -> str:
     return response.content.strip()
 
 def fetch_products_by_category(category_name: str) -> list:
-    try:
-        category = Category.objects.get(category_name__iexact=category_name)
-        products = Product.objects.filter(category=category)
-        return list(products)
-    except Category.DoesNotExist:
+    catalog = get_catalog()
+    category = catalog.category(category_name)
+    if category is None:
         return []
+    return list(catalog.by_category.get(category.id, []))
 
 def format_products_for_llm(products: list) -> str:
     if not products:
@@ -281,13 +410,14 @@ def variation_selection_node(state: OverallState) -> OverallState:
 
 def recommendation_node(state: OverallState) -> OverallState:
     user_prompt = state["messages"][-1].content
-    identified_plant = state.get("identified_plant", "")
+    identified_plant = resolve_identified_plant(state)
+    plant_update = remember_identified_plant(state, identified_plant)
     
     # If we have an identified plant, use the specialized recommendation tool
     if identified_plant and identified_plant != "Unknown":
         try:
             recommendation = recommend_products_for_plant(identified_plant, user_prompt)
-            return {"intermediate_results": {"recommendation": recommendation}}
+            return {**plant_update, "intermediate_results": {"recommendation": recommendation}}
         except Exception as e:
             print(f"Error in plant-specific recommendation: {e}")
             # Fall back to general recommendation
@@ -297,14 +427,12 @@ def recommendation_node(state: OverallState) -> OverallState:
     products = fetch_products_by_category(category)
     product_list = format_products_for_llm(products)
     recommendation = recommend_products_llm(user_prompt, product_list, supervisor_llm)
-    return {"intermediate_results": {"recommendation": recommendation}}
+    return {**plant_update, "intermediate_results": {"recommendation": recommendation}}
 
 def get_best_product_match(user_product_name):
-    from store.models import Product
-    all_names = list(Product.objects.values_list('product_name', flat=True))
-    matches = difflib.get_close_matches(user_product_name, all_names, n=1, cutoff=0.6)
-    if matches:
-        return matches[0]
+    match = get_catalog().matcher.best(user_product_name, cutoff=0.6)
+    if match:
+        return match[2]
     return None
 
 def cart_agent_node(state: OverallState) -> OverallState:
@@ -316,7 +444,7 @@ def cart_agent_node(state: OverallState) -> OverallState:
     context_messages[-1] = HumanMessage(content=f"User ID: {user_id}. {context_messages[-1].content}")
     result = cart_agent.invoke({"messages": context_messages})
 
-    from store.models import Product, Variation
+    catalog = get_catalog()
     # Extract tool_calls from all AIMessage objects in result["messages"]
     tool_calls = []
     from langchain_core.messages import AIMessage
@@ -326,9 +454,9 @@ def cart_agent_node(state: OverallState) -> OverallState:
     product_name = None
     found_variation_needed = False
     variations_data = None
-    allowed_types = []
     # Prioritize add_to_cart, but also check list_product_variations
     import json
+    named_calls = []
     for call in tool_calls:
         tool_name = call.get("function", {}).get("name")
         args_str = call.get("function", {}).get("arguments", "{}")
@@ -337,32 +465,22 @@ def cart_agent_node(state: OverallState) -> OverallState:
         except Exception:
             args = {}
         if "product_name" in args:
-            candidate_name = args["product_name"]
-            product_qs = Product.objects.filter(product_name__iexact=candidate_name)
-            if product_qs.exists():
-                product = product_qs.first()
-                allowed = product.allowed_variations
-                if allowed:
-                    allowed_types = [x.strip() for x in allowed.split(",") if x.strip()]
-                    has_variations = Variation.objects.filter(product=product, variation_category__in=allowed_types, is_active=True).exists()
-                    if has_variations:
-                        # If add_to_cart, prioritize this
-                        if tool_name == "add_to_cart":
-                            product_name = candidate_name
-                            found_variation_needed = True
-                            variations_data = {}
-                            for var_type in allowed_types:
-                                values = Variation.objects.filter(product=product, variation_category__iexact=var_type, is_active=True).values_list('variation_value', flat=True).distinct()
-                                variations_data[var_type.lower()] = list(values)
-                            break  # Prioritize add_to_cart
-                        # Otherwise, if not set yet, use list_product_variations
-                        elif not found_variation_needed and tool_name == "list_product_variations":
-                            product_name = candidate_name
-                            found_variation_needed = True
-                            variations_data = {}
-                            for var_type in allowed_types:
-                                values = Variation.objects.filter(product=product, variation_category__iexact=var_type, is_active=True).values_list('variation_value', flat=True).distinct()
-                                variations_data[var_type.lower()] = list(values)
+            named_calls.append((tool_name, args["product_name"]))
+    # Resolve the variations of every mentioned product in one pass
+    matrix = catalog.variation_matrix(name for _, name in named_calls)
+    for tool_name, candidate_name in named_calls:
+        if candidate_name in matrix:
+            # If add_to_cart, prioritize this
+            if tool_name == "add_to_cart":
+                product_name = candidate_name
+                found_variation_needed = True
+                variations_data = matrix[candidate_name]
+                break  # Prioritize add_to_cart
+            # Otherwise, if not set yet, use list_product_variations
+            elif not found_variation_needed and tool_name == "list_product_variations":
+                product_name = candidate_name
+                found_variation_needed = True
+                variations_data = matrix[candidate_name]
     if found_variation_needed and product_name and variations_data:
         return {
             "intermediate_results": {"cart": f"Please select variations for '{product_name}'."},
@@ -382,9 +500,17 @@ def cart_agent_node(state: OverallState) -> OverallState:
     ai_msg = extract_ai_message(result)
     return {"intermediate_results": {"cart": ai_msg or "Sorry, I couldn't generate a proper response."}}
 
+def research_scope(identified_plant) -> str:
+    """
+    Cache scope of a research question: the identified plant, so a care answer is shared by every
+    user asking the same question about it (questions referring back to the conversation are never cached).
+    """
+    return identified_plant.strip().lower() if identified_plant and identified_plant != "Unknown" else ""
+
 def research_agent_node(state: OverallState) -> OverallState:
     user_id = state["user_id"]
-    identified_plant = state.get("identified_plant", "")
+    identified_plant = resolve_identified_plant(state)
+    plant_update = remember_identified_plant(state, identified_plant)
     # Use trimmed messages if available, else fallback to full messages
     context_messages = state.get("llm_input_messages") or list(state["messages"])
     # Only pass the last agent message (if present) and the latest user message
@@ -392,14 +518,29 @@ def research_agent_node(state: OverallState) -> OverallState:
         context_messages = [context_messages[-2], context_messages[-1]]
     else:
         context_messages = [context_messages[-1]]
+    question = context_messages[-1].content
+    plant_scope = research_scope(identified_plant)
+    cached = research_cache.get(question, scope=plant_scope)
+    if cached is not None:
+        return {**plant_update, "intermediate_results": {"research": cached["answer"]}}
     # Enhance the latest user message with user_id and plant identification
     if identified_plant and identified_plant != "Unknown":
         context_messages[-1] = HumanMessage(content=f"User ID: {user_id}. Plant identified: {identified_plant}. {context_messages[-1].content}")
     else:
         context_messages[-1] = HumanMessage(content=f"User ID: {user_id}. {context_messages[-1].content}")
+    started = time.perf_counter()
     result = research_agent.invoke({"messages": context_messages})
     ai_msg = extract_ai_message(result)
-    return {"intermediate_results": {"research": ai_msg or ""}}
+    # Only answers grounded in a web search are reused for other users
+    search_results = [msg.content for msg in result.get("messages", []) if isinstance(msg, ToolMessage)]
+    if ai_msg and search_results:
+        research_cache.put(
+            question,
+            {"answer": ai_msg, "search_results": search_results},
+            scope=plant_scope,
+            cost_seconds=time.perf_counter() - started,
+        )
+    return {**plant_update, "intermediate_results": {"research": ai_msg or ""}}
 
 def order_agent_node(state: OverallState) -> OverallState:
     user_id = state["user_id"]
@@ -413,16 +554,35 @@ def order_agent_node(state: OverallState) -> OverallState:
     ai_msg = extract_ai_message(result)
     return {"intermediate_results": {"order": ai_msg or ""}}
 
+MULTI_INTENT_RULE = "IMPORTANT: Only if the message contains several separate requests for different agents, respond with each of those agents, comma separated (e.g. \"cart, order\").\n"
+
 def supervisor_node(state: OverallState) -> OverallState:
+    # Every routing decision starts a turn, so it also clears the previous turn's agent results
     # If resuming from a variation selection, force cart agent
     if state.get("pending_variation_selection") and state.get("pending_variation_selection") != {}:
-        return {"agent_type": ["cart"]}
+        return {"agent_type": ["cart"], "intermediate_results": {}}
     messages = state["messages"]
-    image_b64 = state.get("image_b64", "")
-    identified_plant = state.get("identified_plant", "")
+    image_uploaded = bool(state.get("image_b64") or state.get("plant_id_task"))
+    # Routing does not wait for the identification, it only uses it when already finished
+    identified_plant = resolve_identified_plant(state, wait=False)
     user_prompt = messages[-1].content.lower()
-    
-    # Use LLM to decide which single agent to route to
+
+    # Deterministic fast path for obvious intents, the LLM only sees ambiguous messages
+    started = time.perf_counter()
+    if settings.AGENT_MULTI_INTENT:
+        # Several clearly phrased requests fan out to parallel agent branches
+        routes = split_intents(messages[-1].content, settings.AGENT_FAST_ROUTE_THRESHOLD)
+        if len(routes) > 1:
+            elapsed = (time.perf_counter() - started) / len(routes)
+            for route in routes:
+                router_stats.record_fast(route, elapsed)
+            return {"agent_type": routes, "intermediate_results": {}}
+    route = fast_route(messages[-1].content, settings.AGENT_FAST_ROUTE_THRESHOLD)
+    if route:
+        router_stats.record_fast(route, time.perf_counter() - started)
+        return {"agent_type": [route], "intermediate_results": {}}
+
+    # Use LLM to decide which agent(s) to route to
     system_prompt = """You are a supervisor that routes user queries to the most appropriate agent.
 
 Available agents:
@@ -432,44 +592,38 @@ Available agents:
 4. RESEARCH_AGENT - For plant care, watering, sunlight, soil, diseases, general plant questions
 
 IMPORTANT: Choose only ONE agent that best fits the user's request. Respond with exactly one of: cart, order, recommendation, research
-IMPORTANT: If the previous agent response was a product recommendation and the user now says things like "add that to my cart", "buy this", "add to cart", etc., route to the cart agent.
+{multi_intent_rule}IMPORTANT: If the previous agent response was a product recommendation and the user now says things like "add that to my cart", "buy this", "add to cart", etc., route to the cart agent.
 
 Examples:
-- "What's in my cart" → cart
-- "Add maize seeds" → cart  
-- "My recent orders" → order
-- "Recommend indoor plants" → recommendation
-- "How to water succulents" → research
-- "Show me fertilizers" → recommendation
-- "Order status" → order
-- "Suggest fertilizer for my rose" → recommendation
-- "How to care for my rose" → research
 """
+    system_prompt = system_prompt.replace("{multi_intent_rule}", MULTI_INTENT_RULE if settings.AGENT_MULTI_INTENT else "")
+    system_prompt += "\n".join(f'- "{text}" → {route}' for text, route in ROUTING_EXAMPLES) + "\n"
     
     # Add image and plant identification context if present
-    if image_b64 and identified_plant and identified_plant != "Unknown":
+    if image_uploaded and identified_plant and identified_plant != "Unknown":
         system_prompt += f"\n\nNOTE: User has uploaded an image of a {identified_plant}. Use this information to route appropriately:"
         system_prompt += f"\n- If they ask for fertilizer, similar plants, or want to buy products for their {identified_plant} → RECOMMENDATION_AGENT"
         system_prompt += f"\n- If they ask for care tips, watering, sunlight, or general care for their {identified_plant} → RESEARCH_AGENT"
-    elif image_b64:
-        system_prompt += "\n\nNOTE: User has uploaded an image but plant identification failed. Route based on their text query."
+    elif image_uploaded:
+        system_prompt += "\n\nNOTE: User has uploaded an image but the plant is not identified. Route based on their text query."
     
     decision_messages = [
         SystemMessage(content=system_prompt),
         messages[-1]
     ]
     
+    started = time.perf_counter()
     response = supervisor_llm.invoke(decision_messages)
     raw_decision = response.content.strip().lower()
     
-    # Extract the agent type from the response
-    agent_type = "research"  # default
-    for agent in ["cart", "order", "recommendation", "research"]:
-        if agent in raw_decision:
-            agent_type = agent
-            break
-    
-    return {"agent_type": [agent_type]}
+    # Extract the agent type(s) from the response, in the order the LLM gave them
+    agent_types = sorted((agent for agent in ROUTES if agent in raw_decision), key=raw_decision.index)
+    agent_types = independent_intents(agent_types) if settings.AGENT_MULTI_INTENT else agent_types[:1]
+    agent_types = agent_types or ["research"]  # default
+
+    usage = getattr(response, "usage_metadata", None) or {}
+    router_stats.record_llm(agent_types[0], time.perf_counter() - started, usage.get("total_tokens", 0))
+    return {"agent_type": agent_types, "intermediate_results": {}}
 
 def response_node(state: OverallState) -> OverallState:
     priority_order = ["cart", "order", "recommendation", "research", "variation_selection"]
@@ -480,6 +634,63 @@ def response_node(state: OverallState) -> OverallState:
     response = "\n\n".join([c for c in combined if c]) or "Sorry, I couldn't generate a proper response."
     return {"response": response}
 
+# --- Async execution ---
+# Blocking work of streamed turns (graph nodes with their ORM and tool calls, chat history
+# writes) runs on this bounded pool, so open streams do not each hold a thread.
+agent_executor = ThreadPoolExecutor(max_workers=settings.AGENT_ASYNC_WORKERS, thread_name_prefix="agent")
+
+# Nodes whose LLM tokens are user-facing answers and get streamed to the chat widget
+STREAMED_NODES = {"cart_agent", "order_agent", "research_agent"}
+
+def _run_with_connection(func, *args, **kwargs):
+    # Pool threads outlive requests, so recycle their database connection like a request would
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking (ORM/LLM) call on agent_executor, keeping context variables such as the LangGraph config"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(agent_executor, copy_context().run, partial(_run_with_connection, func, *args, **kwargs))
+
+def offloaded(node, route: str = None):
+    """
+    Wrap a sync node so async graph runs execute it on agent_executor (sync runs call it directly).
+    Agent branches pass their `route`: read-only ones are cut off after settings.AGENT_BRANCH_TIMEOUTS[route]
+    seconds and answer with a short apology, so one slow branch does not hold back the others.
+    Branches with side effects (SIDE_EFFECT_ROUTES) always run to completion: an abandoned call keeps
+    running, and must not change the cart or orders after the turn has answered.
+    Every node is also timed and accounted for in the turn's trace (tracing.node_scope).
+    """
+    node = traced(node)
+    timeout = settings.AGENT_BRANCH_TIMEOUTS.get(route) if route and route not in SIDE_EFFECT_ROUTES else None
+    if not timeout:
+        async def anode(state):
+            return await run_blocking(node, state)
+        return RunnableCallable(node, wraps(node)(anode), name=node.__name__, trace=False)
+
+    def timed_out():
+        print(f"[AGENT] {route} branch timed out after {timeout}s")
+        return {"intermediate_results": {route: f"Sorry, the {route} request took too long. Please try asking again."}}
+
+    def run(state):
+        # The abandoned call finishes in the background, its result is dropped
+        future = agent_executor.submit(copy_context().run, partial(_run_with_connection, node, state))
+        try:
+            return future.result(timeout=timeout)
+        except FuturesTimeoutError:
+            return timed_out()
+
+    async def anode(state):
+        try:
+            return await asyncio.wait_for(run_blocking(node, state), timeout)
+        except asyncio.TimeoutError:
+            return timed_out()
+
+    return RunnableCallable(wraps(node)(run), wraps(node)(anode), name=node.__name__, trace=False)
+
 # --- Graph Construction ---
 def create_supervisor_agent():
     workflow = StateGraph(
@@ -487,13 +698,13 @@ def create_supervisor_agent():
         input=InputState,
         output=OutputState,
     )
-    workflow.add_node("supervisor", supervisor_node)
-    workflow.add_node("cart_agent", cart_agent_node)
-    workflow.add_node("variation_selection", variation_selection_node)
-    workflow.add_node("research_agent", research_agent_node)
-    workflow.add_node("recommendation_agent", recommendation_node)
-    workflow.add_node("order_agent", order_agent_node)
-    workflow.add_node("response", response_node)
+    workflow.add_node("supervisor", offloaded(supervisor_node))
+    workflow.add_node("cart_agent", offloaded(cart_agent_node, "cart"))
+    workflow.add_node("variation_selection", offloaded(variation_selection_node))
+    workflow.add_node("research_agent", offloaded(research_agent_node, "research"))
+    workflow.add_node("recommendation_agent", offloaded(recommendation_node, "recommendation"))
+    workflow.add_node("order_agent", offloaded(order_agent_node, "order"))
+    workflow.add_node("response", offloaded(response_node))
     workflow.set_entry_point("supervisor")
     
     def route_to_agents(state: OverallState) -> List[str]:
@@ -524,58 +735,44 @@ def create_supervisor_agent():
 supervisor_agent = create_supervisor_agent()
 
 # --- Entrypoint ---
-def run_supervisor_agent(user_id: int, message: str, thread_id: str = None, image_file=None, resume_data=None, messages=None) -> dict:
+def prepare_turn(user_id: int, message: str, thread_id: str = None, image_file=None, resume_data=None, history=None):
+    """
+    Build the graph input and config for one conversation turn (image upload and
+    plant identification included). Returns (inputs, config, error) where error is
+    a ready response dict when the turn cannot run.
+    """
     
-    image_b64 = ""
-    identified_plant = ""
+    plant_id_task = 0
+    thread_id = thread_id or f"user_{user_id}"
+    # Per-node timings, tokens, tool calls and queries of this turn (see tracing.py)
+    trace = TurnTrace(user_id, thread_id) if settings.AGENT_TRACE_KEEP else None
     
     if image_file is not None:
         try:
-            # Resize image if needed
-            image = Image.open(image_file)
-            max_size = 1024
-            if max(image.size) > max_size:
-                image.thumbnail((max_size, max_size))
-                output = io.BytesIO()
-                image.save(output, format=image.format)
-                output.seek(0)
-                resized_file = output
-            else:
-                image_file.seek(0)
-                resized_file = image_file
-
-            # Save resized image to DB
-            resized_file.seek(0)
-            django_file = ContentFile(resized_file.read())
-            ext = image.format.lower() if image.format else 'jpg'
-            filename = f"user_{user_id}_chat_{timezone.now().strftime('%Y%m%d%H%M%S')}.{ext}"
-            
             try:
-                user_obj = Account.objects.get(id=user_id)
+                Account.objects.only("id").get(id=user_id)
             except Account.DoesNotExist:
-                return {"response": "Sorry, the user account was not found. Please contact support."}
-            
-            chat_image = ChatImage.objects.create(user=user_obj)
-            chat_image.image.save(filename, django_file, save=True)
-
-            # For base64 encoding and plant identification
-            resized_file.seek(0)
-            image_bytes = resized_file.read()
-            image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-            
-            # Identify plant from image
-            resized_file.seek(0)
-            identified_plant = identify_plant_from_image(resized_file)
-            if identified_plant and identified_plant != "Unknown":
-                print(f"[PLANT-ID] Image recognized by LLM: {identified_plant}")
-            else:
-                print(f"[PLANT-ID] Image NOT recognized by LLM.")
-
-            # Always add plant/image context to the user message
-            if identified_plant and identified_plant != "Unknown":
-                message = f"Image uploaded: Yes. Plant identified: {identified_plant}. {message}"
-            else:
-                message = f"Image uploaded: Yes. {message}"
+                return None, None, {"response": "Sorry, the user account was not found. Please contact support."}
+
+            # The thumbnail is stored right away; only the identification runs off the request path
+            # (agent/tasks.py), the graph gets the task id and the nodes that need the plant wait for it
+            image_file.seek(0)
+            started = time.perf_counter()
+            chat_image, processed = store_chat_image(user_id, image_file)
+            if trace:
+                trace.add("store_image", calls=1, wall_ms=(time.perf_counter() - started) * 1000)
+            future = enqueue(
+                "identify_chat_image",
+                payload={
+                    "user_id": user_id,
+                    "chat_image_id": chat_image.id,
+                    "model_mime": processed.model_mime,
+                    "turn_id": trace.turn_id if trace else "",
+                },
+                data=processed.model_bytes,
+            )
+            plant_id_task = future.id
+            message = f"Image uploaded: Yes. {message}"
             
         except Exception as e:
             print(f"Error processing image: {e}")
@@ -587,59 +784,131 @@ def run_supervisor_agent(user_id: int, message: str, thread_id: str = None, imag
         # The graph will use the previous state, but we want to ensure agent_type is ['cart']
         # This is handled in the state update logic of the graph (if needed, can patch in the node)
     else:
-        # Use provided messages if available, else default to latest message
-        if messages is not None:
-            context_messages = messages
-        else:
-            from langchain_core.messages import HumanMessage
-            context_messages = [HumanMessage(content=message)]
+        context_messages = list(history or []) + [HumanMessage(content=message)]
         inputs = {
             "messages": context_messages,
             "user_id": user_id,
-            "image_b64": image_b64,
+            "image_b64": "",
+            "plant_id_task": plant_id_task,
             "agent_type": [],
             "intermediate_results": {},
             "response": "",
-            "identified_plant": identified_plant,
             "pending_variation_selection": {}
         }
     
     config = {
         "configurable": {
-            "thread_id": thread_id or f"user_{user_id}"
+            "thread_id": thread_id
         }
     }
+    if trace is not None:
+        config["callbacks"] = [trace]
+    return inputs, config, None
+
+def turn_result(result: dict) -> dict:
+    """Map the graph output to the response dict the views return"""
+    # Check if there's an interrupt
+    if "__interrupt__" in result:
+        return {
+            "interrupt": True,
+            "interrupt_data": result["__interrupt__"][0].value,
+            "response": "Waiting for user input..."
+        }
+    return {
+        "interrupt": False,
+        "response": result.get("response") or "Sorry, I couldn't generate a proper response."
+    }
+
+def save_trace(config):
+    for handler in (config or {}).get("callbacks", ()):
+        if isinstance(handler, TurnTrace):
+            try:
+                handler.save()
+            except Exception as e:
+                print(f"Error saving agent trace: {e}")
+
+def run_supervisor_agent(user_id: int, message: str, thread_id: str = None, image_file=None, resume_data=None, history=None) -> dict:
+    """
+    Run one conversation turn. Only the new message is sent to the graph, the
+    checkpointer already holds earlier turns. Pass `history` (prior messages)
+    only when rebuilding a thread the checkpointer does not know about.
+    """
+    inputs, config, error = prepare_turn(user_id, message, thread_id, image_file, resume_data, history)
+    if error:
+        return error
     
     try:
         result = supervisor_agent.invoke(inputs, config=config)
+        return turn_result(result)
         
-        # Check if there's an interrupt
-        if "__interrupt__" in result:
-            return {
-                "interrupt": True,
-                "interrupt_data": result["__interrupt__"][0].value,
-                "response": "Waiting for user input..."
-            }
-        
+    except Exception as e:
+        print(f"Exception occurred: {str(e)}")
         return {
             "interrupt": False,
-            "response": result.get("response") or "Sorry, I couldn't generate a proper response."
+            "response": f"Sorry, there was an error processing your request: {str(e)}"
         }
-        
+    finally:
+        save_trace(config)
+
+async def astream_supervisor_agent(user_id: int, message: str, thread_id: str = None, image_file=None, resume_data=None, history=None):
+    """
+    Async counterpart of run_supervisor_agent for the streaming endpoint. Yields events while the graph runs:
+    {"type": "progress", "node"} when a node finishes, {"type": "token", "node", "text"} for sub-agent
+    answer tokens, and finally {"type": "done", ...} carrying the dict run_supervisor_agent would return.
+    """
+    inputs, config, error = await run_blocking(prepare_turn, user_id, message, thread_id, image_file, resume_data, history)
+    if error:
+        yield {"type": "done", "interrupt": False, **error}
+        return
+
+    result = {}
+    try:
+        # subgraphs=True so tokens of the react agents invoked inside nodes are streamed too
+        async for namespace, mode, chunk in supervisor_agent.astream(
+            inputs, config=config, stream_mode=["updates", "messages"], subgraphs=True
+        ):
+            node = namespace[0].split(":")[0] if namespace else None
+            if mode == "messages":
+                message_chunk, metadata = chunk
+                node = node or metadata.get("langgraph_node")
+                if node in STREAMED_NODES and isinstance(message_chunk, AIMessageChunk) and isinstance(message_chunk.content, str) and message_chunk.content:
+                    yield {"type": "token", "node": node, "text": message_chunk.content}
+            elif not namespace:
+                for name, update in chunk.items():
+                    if name == "__interrupt__":
+                        result["__interrupt__"] = update
+                    else:
+                        if name == "response" and update:
+                            result["response"] = update.get("response")
+                        yield {"type": "progress", "node": name}
+        yield {"type": "done", **turn_result(result)}
+
     except Exception as e:
         print(f"Exception occurred: {str(e)}")
-        return {
+        yield {
+            "type": "done",
             "interrupt": False,
             "response": f"Sorry, there was an error processing your request: {str(e)}"
         }
+    # After the reply went out, so the client does not wait for it
+    await run_blocking(save_trace, config)
 
 # --- Memory Management ---
+def has_thread(user_id: int, thread_id: str = None) -> bool:
+    """Check whether the checkpointer already holds state for this user/thread"""
+    try:
+        if thread_id is None:
+            thread_id = f"user_{user_id}"
+        return checkpointer.get_tuple({"configurable": {"thread_id": thread_id}}) is not None
+    except Exception as e:
+        print(f"Error checking conversation thread: {str(e)}")
+        return False
+
 def clear_user_memory(user_id: int, thread_id: str = None) -> bool:
     try:
         if thread_id is None:
             thread_id = f"user_{user_id}"
-        if hasattr(checkpointer, "clear"):
-            checkpointer.clear({"configurable": {"thread_id": thread_id}})
+        checkpointer.delete_thread(thread_id)
         return True
     except Exception as e:
         print(f"Error clearing memory: {str(e)}")
@@ -653,23 +922,16 @@ def get_conversation_history(user_id: int, thread_id: str = None) -> list:
         
         # Get the checkpoint for this thread
         checkpoint = checkpointer.get({"configurable": {"thread_id": thread_id}})
-        if checkpoint and "messages" in checkpoint:
-            return checkpoint["messages"]
+        if checkpoint:
+            return checkpoint.get("channel_values", {}).get("messages", [])
         return []
     except Exception as e:
         print(f"Error getting conversation history: {str(e)}")
         return []
 
 def is_variation_exist(product_name: str) -> bool:
-    from store.models import Product, Variation
-    product_qs = Product.objects.filter(product_name__icontains=product_name)
-    if not product_qs.exists():
-        return False
-    product = product_qs.first()
-    allowed = product.allowed_variations
-    if not allowed:
-        return False
-    allowed_types = [x.strip() for x in allowed.split(",") if x.strip()]
-    if not allowed_types:
+    catalog = get_catalog()
+    matches = catalog.filter_name(product_name)
+    if not matches:
         return False
-    return Variation.objects.filter(product=product, variation_category__in=allowed_types, is_active=True).exists()
\ No newline at end of file
+    return bool(catalog.required_variations(matches[0]))
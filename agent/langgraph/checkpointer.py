@@ -0,0 +1,324 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Iterator, Optional, Sequence
+
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agent.models import AgentCheckpoint, AgentCheckpointWrite
+
+CHECKPOINT_TABLE = AgentCheckpoint._meta.db_table
+WRITES_TABLE = AgentCheckpointWrite._meta.db_table
+
+
+class PostgresCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer backed by the project's Postgres database.
+
+    Connections are taken from a small thread-safe pool built from the
+    DATABASES[db_alias] settings, so graph runs in any worker (and LangGraph's
+    background writer threads) share state without holding a Django connection
+    per thread. Checkpoints are stored as msgpack blobs, only the newest `keep`
+    checkpoints of a thread are retained and every row expires after `ttl`.
+    Nothing is cached in process, so worker memory stays flat.
+    """
+
+    def __init__(self, *, serde=None, db_alias: str = 'default', ttl: int = 7 * 24 * 60 * 60,
+                 keep: int = 3, minconn: int = 1, maxconn: int = 8, sweep_interval: int = 600):
+        super().__init__(serde=serde)
+        self.db_alias = db_alias
+        self.ttl = timedelta(seconds=ttl)
+        self.keep = max(1, keep)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.sweep_interval = sweep_interval
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # The pool raises instead of waiting when exhausted, so gate access to it.
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_sweep = 0.0
+
+    # --- Connection handling ---
+    def _get_pool(self) -> ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    params = connections[self.db_alias].get_connection_params()
+                    self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **params)
+        return self._pool
+
+    @contextmanager
+    def _cursor(self):
+        """Yield a cursor inside a transaction on a pooled connection."""
+        with self._slots:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            broken = False
+            try:
+                with conn:
+                    with conn.cursor() as cur:
+                        yield cur
+            except (psycopg2.InterfaceError, psycopg2.OperationalError):
+                broken = True
+                raise
+            finally:
+                pool.putconn(conn, close=broken or conn.closed != 0)
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    # --- Helpers ---
+    def _expires_at(self):
+        return timezone.now() + self.ttl
+
+    def _load_writes(self, cur, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        cur.execute(
+            f"SELECT task_id, channel, value_type, value FROM {WRITES_TABLE} "
+            "WHERE thread_id = %s AND checkpoint_ns = %s AND checkpoint_id = %s "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return [
+            (task_id, channel, self.serde.loads_typed((value_type, bytes(value))))
+            for task_id, channel, value_type, value in cur.fetchall()
+        ]
+
+    def _make_tuple(self, cur, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((checkpoint_type, bytes(checkpoint))),
+            metadata=self.serde.loads_typed((metadata_type, bytes(metadata))),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=self._load_writes(cur, thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def _prune(self, cur, thread_id: str, checkpoint_ns: str) -> None:
+        """Drop checkpoints older than the newest `keep` ones, and expired rows."""
+        cur.execute(
+            f"SELECT checkpoint_id FROM {CHECKPOINT_TABLE} "
+            "WHERE thread_id = %s AND checkpoint_ns = %s "
+            "ORDER BY checkpoint_id DESC OFFSET %s LIMIT 1",
+            (thread_id, checkpoint_ns, self.keep - 1),
+        )
+        row = cur.fetchone()
+        if row:
+            for table in (CHECKPOINT_TABLE, WRITES_TABLE):
+                cur.execute(
+                    f"DELETE FROM {table} WHERE thread_id = %s AND checkpoint_ns = %s AND checkpoint_id < %s",
+                    (thread_id, checkpoint_ns, row[0]),
+                )
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            for table in (CHECKPOINT_TABLE, WRITES_TABLE):
+                cur.execute(f"DELETE FROM {table} WHERE expires_at < %s", (timezone.now(),))
+
+    # --- BaseCheckpointSaver API ---
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = (
+            f"SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata "
+            f"FROM {CHECKPOINT_TABLE} WHERE thread_id = %s AND checkpoint_ns = %s AND expires_at > %s"
+        )
+        params = [thread_id, checkpoint_ns, timezone.now()]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = %s"
+            params.append(checkpoint_id)
+        query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._cursor() as cur:
+            cur.execute(query, params)
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return self._make_tuple(cur, thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            f"SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, "
+            f"metadata_type, metadata FROM {CHECKPOINT_TABLE} WHERE expires_at > %s"
+        )
+        params = [timezone.now()]
+        if config:
+            query += " AND thread_id = %s"
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = %s"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = %s"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < %s"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+        results = []
+        with self._cursor() as cur:
+            cur.execute(query, params)
+            for thread_id, checkpoint_ns, *row in cur.fetchall():
+                item = self._make_tuple(cur, thread_id, checkpoint_ns, row)
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(item)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {CHECKPOINT_TABLE} (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                "checkpoint_type, checkpoint, metadata_type, metadata, created_at, expires_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+                "ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id) DO UPDATE SET "
+                "checkpoint_type = EXCLUDED.checkpoint_type, checkpoint = EXCLUDED.checkpoint, "
+                "metadata_type = EXCLUDED.metadata_type, metadata = EXCLUDED.metadata, expires_at = EXCLUDED.expires_at",
+                (
+                    thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                    checkpoint_type, psycopg2.Binary(checkpoint_blob), metadata_type, psycopg2.Binary(metadata_blob),
+                    timezone.now(), self._expires_at(),
+                ),
+            )
+            self._prune(cur, thread_id, checkpoint_ns)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if not writes:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        expires_at = self._expires_at()
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_blob = self.serde.dumps_typed(value)
+            rows.append((
+                thread_id, checkpoint_ns, checkpoint_id, task_id, task_path,
+                WRITES_IDX_MAP.get(channel, idx), channel, value_type, psycopg2.Binary(value_blob), expires_at,
+            ))
+        # Special writes (errors, interrupts) replace earlier ones, regular writes are never overwritten.
+        if all(channel in WRITES_IDX_MAP for channel, _ in writes):
+            on_conflict = "DO UPDATE SET channel = EXCLUDED.channel, value_type = EXCLUDED.value_type, value = EXCLUDED.value"
+        else:
+            on_conflict = "DO NOTHING"
+        with self._cursor() as cur:
+            execute_values(
+                cur,
+                f"INSERT INTO {WRITES_TABLE} (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, "
+                f"channel, value_type, value, expires_at) VALUES %s "
+                f"ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id, task_id, idx) {on_conflict}",
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._cursor() as cur:
+            for table in (CHECKPOINT_TABLE, WRITES_TABLE):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = %s", (thread_id,))
+
+    # --- Async API (used by astream/ainvoke) ---
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path="") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def build_checkpointer() -> BaseCheckpointSaver:
+    """
+    Create the checkpointer selected by settings.AGENT_CHECKPOINTER.
+    Accepts 'postgres', 'memory' or a dotted path to a BaseCheckpointSaver subclass.
+    """
+    backend = getattr(settings, 'AGENT_CHECKPOINTER', 'postgres')
+    if backend == 'memory':
+        return InMemorySaver()
+    if backend == 'postgres':
+        return PostgresCheckpointSaver(
+            ttl=getattr(settings, 'AGENT_CHECKPOINT_TTL', 7 * 24 * 60 * 60),
+            keep=getattr(settings, 'AGENT_CHECKPOINT_KEEP', 3),
+            maxconn=getattr(settings, 'AGENT_CHECKPOINT_POOL_SIZE', 8),
+        )
+    try:
+        return import_string(backend)()
+    except ImportError as e:
+        raise ImproperlyConfigured(f"Invalid AGENT_CHECKPOINTER '{backend}': {e}")
@@ -0,0 +1,39 @@
+from PIL import Image
+
+HASH_BITS = 64
+BAND_BITS = 16
+BANDS = HASH_BITS // BAND_BITS
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """
+    Difference hash of a PIL image: shrink to (size + 1) x size grayscale pixels and set
+    one bit per pixel that is brighter than its right neighbour. Resizing, re-encoding
+    and small edits keep most bits, so near-identical photos are a few bits apart.
+    """
+    pixels = list(image.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def bands(value: int) -> list:
+    """Split a 64-bit hash into four 16-bit bands. Hashes at most 3 bits apart share at least one band."""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & mask for i in range(BANDS)]
+
+
+def to_signed(value: int) -> int:
+    """Store an unsigned 64-bit hash in a signed BIGINT column"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
@@ -0,0 +1,90 @@
+import base64
+import io
+import time
+
+from PIL import Image
+
+# Formats the model payload may be converted to, with their MIME types
+MODEL_FORMATS = {"webp": ("WEBP", "image/webp"), "avif": ("AVIF", "image/avif")}
+
+
+class ProcessedImage:
+    """
+    One decoded chat upload: the downscaled PIL image, the bytes stored as the chat
+    thumbnail, the (possibly re-encoded) payload sent to the vision model, and timing stats.
+    """
+
+    def __init__(self, image, stored_bytes, stored_ext, model_bytes, model_mime, stats):
+        self.image = image
+        self.stored_bytes = stored_bytes
+        self.stored_ext = stored_ext
+        self.model_bytes = model_bytes
+        self.model_mime = model_mime
+        self.stats = stats
+
+    @property
+    def model_b64(self) -> str:
+        return base64.b64encode(self.model_bytes).decode("utf-8")
+
+    @property
+    def model_data_url(self) -> str:
+        return f"data:{self.model_mime};base64,{self.model_b64}"
+
+
+def _encode(image, image_format, **params) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=image_format, **params)
+    return output.getvalue()
+
+
+def process_upload(image_file, max_size: int = 1024, model_format: str = "", quality: int = 80) -> ProcessedImage:
+    """
+    Decode an uploaded image once and derive everything the chat turn needs from it.
+
+    JPEGs are decoded with `draft()`, which lets libjpeg scale by 1/2, 1/4 or 1/8 while
+    decoding instead of building the full-resolution bitmap first. The stored copy keeps
+    the upload's format and is only re-encoded when the image had to shrink. The model
+    payload is converted to `model_format` ("webp" or "avif") when set and smaller,
+    otherwise it reuses the stored bytes.
+    """
+    started = time.perf_counter()
+    raw = image_file.read()
+    image = Image.open(io.BytesIO(raw))
+    source_format = image.format or "JPEG"
+    original_size = image.size
+    if source_format == "JPEG":
+        image.draft(image.mode, (max_size, max_size))
+    image.load()
+    if max(image.size) > max_size:
+        image.thumbnail((max_size, max_size))
+    decoded = time.perf_counter()
+
+    if image.size == original_size:
+        stored_bytes = raw
+    else:
+        stored_bytes = _encode(image, source_format)
+    stored_ext = source_format.lower()
+    model_bytes, model_mime = stored_bytes, Image.MIME.get(source_format, "image/jpeg")
+
+    target = MODEL_FORMATS.get((model_format or "").lower())
+    if target:
+        converted = image if image.mode in ("RGB", "RGBA", "L") else image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        try:
+            candidate = _encode(converted, target[0], quality=quality)
+        except (KeyError, OSError) as e:
+            # Pillow built without this encoder, keep the stored bytes
+            print(f"[IMAGE] {target[0]} encoding unavailable: {e}")
+        else:
+            if len(candidate) < len(model_bytes):
+                model_bytes, model_mime = candidate, target[1]
+    encoded = time.perf_counter()
+
+    stats = {
+        "decode_ms": (decoded - started) * 1000,
+        "encode_ms": (encoded - decoded) * 1000,
+        "original_bytes": len(raw),
+        "stored_bytes": len(stored_bytes),
+        "model_bytes": len(model_bytes),
+        "bytes_saved": len(raw) - len(model_bytes),
+    }
+    return ProcessedImage(image, stored_bytes, stored_ext, model_bytes, model_mime, stats)
@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .router import CONTEXT_PREFIX, TOKEN_RE, tokenize
+
+USER_PREFIX = re.compile(r"^User ID:\s*\d+\.\s*", re.IGNORECASE)
+FILLER_WORDS = {"should", "do", "does", "can", "could", "would", "you", "your", "we", "tell", "about", "with", "on", "at", "are", "be"}
+# Words that point back at earlier turns: the question means something else in another conversation
+REFERENCE_WORDS = {"it", "its", "this", "that", "these", "those", "they", "them", "their", "one", "ones", "same", "above"}
+
+
+def normalize_tokens(text: str) -> list:
+    """Lowercase word tokens without context prefixes, stopwords or plural 's'"""
+    text = CONTEXT_PREFIX.sub("", USER_PREFIX.sub("", text or ""))
+    return [
+        t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+        for t in tokenize(text)
+        if t not in FILLER_WORDS
+    ]
+
+
+def is_context_dependent(text: str) -> bool:
+    """True when the text refers back to earlier turns ("how often should I water it")"""
+    text = CONTEXT_PREFIX.sub("", USER_PREFIX.sub("", text or ""))
+    return any(word in REFERENCE_WORDS for word in TOKEN_RE.findall(text.lower()))
+
+
+class QuestionCache:
+    """
+    Process-local cache for expensive answers keyed on a normalized question.
+
+    A question is reduced to its content words in order (case, punctuation,
+    context prefixes, stopwords, filler words and plural 's' dropped), and only
+    an identical normalized question hits, so "How should I water ferns in
+    winter?" and "how should i water fern in winter" share an entry while
+    "winter" never matches "summer". Questions with fewer than `min_tokens`
+    content words or referring back to earlier turns are neither served nor
+    stored. Entries expire after `ttl` seconds and the least recently used
+    entry is evicted past `max_entries`. `scope` partitions entries (e.g. by
+    identified plant).
+    """
+
+    def __init__(self, ttl: int = 24 * 60 * 60, max_entries: int = 1000, min_tokens: int = 3):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, cost_seconds)
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def _key(self, scope: str, text: str):
+        """Normalized (scope, question) key of a cacheable text, None for short or context-dependent ones"""
+        tokens = normalize_tokens(text)
+        if len(tokens) < self.min_tokens or is_context_dependent(text):
+            return None
+        return ((scope or "").strip().lower(), " ".join(tokens))
+
+    def get(self, text: str, scope: str = ""):
+        key = self._key(scope, text)
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            _, value, cost = entry
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.seconds_saved += cost
+            return value
+
+    def put(self, text: str, value, scope: str = "", cost_seconds: float = 0.0):
+        key = self._key(scope, text)
+        if key is None or value is None:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value, cost_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": self.seconds_saved,
+            }
@@ -0,0 +1,197 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+ROUTES = ("cart", "order", "recommendation", "research")
+
+# Labelled examples shared by the supervisor prompt and the lexical classifier
+ROUTING_EXAMPLES = [
+    ("What's in my cart", "cart"),
+    ("Add maize seeds", "cart"),
+    ("My recent orders", "order"),
+    ("Recommend indoor plants", "recommendation"),
+    ("How to water succulents", "research"),
+    ("Show me fertilizers", "recommendation"),
+    ("Order status", "order"),
+    ("Suggest fertilizer for my rose", "recommendation"),
+    ("How to care for my rose", "research"),
+]
+
+# (pattern, route, weight) - high precision phrases that settle a route on their own
+RULES = [
+    (r"\bcart\b", "cart", 2.0),
+    (r"^\s*(please\s+)?add\b", "cart", 2.0),
+    (r"\b(add|put)\b.*\b(cart|basket)\b", "cart", 2.0),
+    (r"\b(add|buy)\s+(that|this|it|them)\b", "cart", 2.0),
+    (r"\b(remove|delete)\b.*\b(cart|basket)\b", "cart", 2.0),
+    (r"\borders?\b", "order", 1.5),
+    (r"\border\s+(id|number|no|#)", "order", 2.0),
+    (r"\b(my|recent|last|latest|previous|past)\s+orders?\b", "order", 2.0),
+    (r"\b(order|delivery|shipping)\s+status\b", "order", 2.0),
+    (r"\b(track|tracking)\b", "order", 1.5),
+    (r"\bcheckout\b", "order", 2.0),
+    (r"\b(recommend|suggest)\w*", "recommendation", 2.0),
+    (r"\bfertili[sz]ers?\b", "recommendation", 1.5),
+    (r"\bshow me\b", "recommendation", 1.0),
+    (r"\b(what|which)\s+(should|can)\s+i\s+buy\b", "recommendation", 2.0),
+    (r"\bhow\s+(to|do|should|often|much|can)\b", "research", 1.5),
+    (r"\bwhy\s+(is|are|does|do)\b", "research", 1.5),
+    (r"\b(water|watering|sunlight|light|soil|prune|pruning|repot\w*|pests?|diseases?|fungus|yellow\w*|wilt\w*|care)\b", "research", 1.0),
+]
+COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), route, weight) for pattern, route, weight in RULES]
+
+# Context prefix added by run_supervisor_agent for image uploads
+CONTEXT_PREFIX = re.compile(r"^Image uploaded: Yes\.\s*(Plant identified: [^.]*\.\s*)?", re.IGNORECASE)
+TOKEN_RE = re.compile(r"[a-z]+")
+STOPWORDS = {"a", "an", "the", "to", "for", "of", "in", "is", "it", "and", "i", "me", "my", "s", "what", "please"}
+
+# How much the lexical classifier counts next to the rule table
+CLASSIFIER_WEIGHT = 1.0
+
+
+def tokenize(text: str) -> list:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalClassifier:
+    """Multinomial naive Bayes over word tokens, trained on ROUTING_EXAMPLES."""
+
+    def __init__(self, examples):
+        self.word_counts = {route: Counter() for route in ROUTES}
+        self.totals = Counter()
+        for text, route in examples:
+            tokens = tokenize(text)
+            self.word_counts[route].update(tokens)
+            self.totals[route] += len(tokens)
+        self.vocab_size = len({w for counts in self.word_counts.values() for w in counts}) or 1
+
+    def predict_proba(self, tokens: list) -> dict:
+        log_scores = {}
+        for route in ROUTES:
+            denominator = self.totals[route] + self.vocab_size
+            log_scores[route] = sum(math.log((self.word_counts[route][t] + 1) / denominator) for t in tokens)
+        top = max(log_scores.values())
+        exp_scores = {route: math.exp(score - top) for route, score in log_scores.items()}
+        total = sum(exp_scores.values())
+        return {route: score / total for route, score in exp_scores.items()}
+
+
+classifier = LexicalClassifier(ROUTING_EXAMPLES)
+
+
+def classify(text: str):
+    """
+    Score a user message against the rule table and the lexical classifier.
+    Returns (route, confidence) where confidence is the route's share of the combined score.
+    """
+    text = CONTEXT_PREFIX.sub("", text).strip()
+    scores = defaultdict(float)
+    for pattern, route, weight in COMPILED_RULES:
+        if pattern.search(text):
+            scores[route] += weight
+    if not scores:
+        # Without a rule hit the classifier alone is not trusted for the fast path
+        return None, 0.0
+    for route, prob in classifier.predict_proba(tokenize(text)).items():
+        scores[route] += CLASSIFIER_WEIGHT * prob
+    route = max(scores, key=scores.get)
+    return route, scores[route] / sum(scores.values())
+
+
+def fast_route(text: str, threshold: float):
+    """Return the route for a message when it is confident enough to skip the LLM, else None."""
+    route, confidence = classify(text)
+    if route and confidence >= threshold:
+        return route
+    return None
+
+
+# Clause boundaries of compound messages ("what's in my cart and where is my last order")
+CLAUSE_SPLIT = re.compile(r"\s*(?:[;?!]|,\s*(?:and\s+)?|\b(?:and also|and then|also|plus|and)\b)\s*", re.IGNORECASE)
+
+
+# Routes whose agents write (cart lines, orders). They may act on what another branch of the
+# same turn produces ("recommend a fern and add it to my cart"), so they never fan out with it.
+SIDE_EFFECT_ROUTES = {"cart", "order"}
+# Routes that produce products a side-effect request may refer to
+PRODUCING_ROUTES = {"recommendation"}
+
+
+def independent_intents(routes: list) -> list:
+    """
+    The routes that can run as parallel branches. When a side-effect route comes with a route it
+    may depend on, the message is handled one step at a time: only the first route is kept.
+    """
+    if len(routes) > 1 and set(routes) & SIDE_EFFECT_ROUTES and set(routes) & PRODUCING_ROUTES:
+        return routes[:1]
+    return routes
+
+
+def split_intents(text: str, threshold: float) -> list:
+    """
+    Routes of the separately phrased requests in a compound message, in order of appearance.
+    A clause only counts when it routes confidently on its own; a message with a single
+    intent (or none that is clear) returns at most one route. Dependent requests are not
+    split (see independent_intents).
+    """
+    text = CONTEXT_PREFIX.sub("", text).strip()
+    routes = []
+    for clause in CLAUSE_SPLIT.split(text):
+        # Fragments such as "and fertilizer" belong to the previous request
+        if len(clause.split()) < 3:
+            continue
+        route = fast_route(clause, threshold)
+        if route and route not in routes:
+            routes.append(route)
+    return independent_intents(routes)
+
+
+class RouterStats:
+    """
+    In-process counters for the routing fast path. Time and tokens saved are
+    estimated from the average cost of the LLM classifications seen so far.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fast_hits = Counter()
+        self.fast_seconds = Counter()
+        self.llm_calls = Counter()
+        self.llm_seconds = 0.0
+        self.llm_tokens = 0
+
+    def record_fast(self, route: str, elapsed: float):
+        with self._lock:
+            self.fast_hits[route] += 1
+            self.fast_seconds[route] += elapsed
+
+    def record_llm(self, route: str, elapsed: float, tokens: int = 0):
+        with self._lock:
+            self.llm_calls[route] += 1
+            self.llm_seconds += elapsed
+            self.llm_tokens += tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total_llm = sum(self.llm_calls.values())
+            total_fast = sum(self.fast_hits.values())
+            avg_llm_seconds = self.llm_seconds / total_llm if total_llm else 0.0
+            avg_llm_tokens = self.llm_tokens / total_llm if total_llm else 0.0
+            routes = {}
+            for route in ROUTES:
+                hits = self.fast_hits[route]
+                routes[route] = {
+                    "fast_hits": hits,
+                    "llm_calls": self.llm_calls[route],
+                    "seconds_saved": max(0.0, hits * avg_llm_seconds - self.fast_seconds[route]),
+                    "tokens_saved": int(hits * avg_llm_tokens),
+                }
+            return {
+                "hit_rate": total_fast / (total_fast + total_llm) if (total_fast + total_llm) else 0.0,
+                "avg_llm_seconds": avg_llm_seconds,
+                "routes": routes,
+            }
+
+
+router_stats = RouterStats()
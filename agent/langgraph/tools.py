@@ -1,11 +1,16 @@
-from store.models import Product, Variation
+from store.catalog import get_catalog
+from store.search import search_products
+from store.rankings import bestseller_ids
 from carts.models import CartItem
+from carts.services import add_item, remove_items
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from langchain_core.tools import tool
-from category.models import Category
 from orders.models import Order, OrderProduct
 from dateutil import parser as date_parser
 
+SEARCH_PRODUCT_LIMIT = 20
+
 def extract_user_id(user_id) -> int:
     """
     Helper function to extract user_id from either int or enhanced string format.
@@ -43,20 +48,21 @@ def search_product(product_name: str = "", category_name: str = "") -> str:
     Search for a product by name and/or category. Returns product information including ID and available variations.
     """
     try:
-        products = Product.objects.all()
-        if product_name:
-            products = products.filter(product_name__icontains=product_name)
+        category_id = None
         if category_name:
-            try:
-                category = Category.objects.get(category_name__iexact=category_name)
-                products = products.filter(category=category)
-            except Category.DoesNotExist:
+            category = get_catalog().category(category_name)
+            if category is None:
                 return f"No category found with name '{category_name}'"
-        if not products.exists():
+            category_id = category.id
+        # Same full-text engine as the storefront search, best matches first
+        results = search_products(product_name, category=category_id, per_page=SEARCH_PRODUCT_LIMIT, facets=False)
+        if not results.count:
             return f"No products found matching '{product_name}' in category '{category_name}'"
         result = []
-        for product in products:
+        for product in results.page:
             result.append(f"Product ID: {product.id}, Name: {product.product_name}, Category: {product.category.category_name}")
+        if results.count > len(result):
+            result.append(f"({results.count - len(result)} more matches, refine the search to see them)")
         return "\n".join(result)
     except Exception as e:
         return f"Error searching for product: {str(e)}"
@@ -70,33 +76,29 @@ def recommend_products_for_plant(plant_name: str, user_query: str = "") -> str:
     try:
         plant_name = plant_name.lower().strip()
         user_query = user_query.lower().strip()
+        catalog = get_catalog()
         
         # Search for products that might be suitable for this plant
         recommended_products = []
         
+        # Best sellers of the last 30 days first (precomputed, see store/rankings.py)
+        sales_rank = {product_id: rank for rank, product_id in enumerate(bestseller_ids(window=30))}
+        by_sales = lambda product: sales_rank.get(product.id, len(sales_rank))
+
         # First, look for fertilizers and plant care products
         if any(word in user_query for word in ['fertilizer', 'fertiliser', 'nutrient', 'feed', 'care']):
-            care_products = Product.objects.filter(
-                category__category_name__in=['Plant Care', 'Fertilizer'],
-                is_available=True
-            )
+            care_products = sorted(catalog.in_categories(['Plant Care', 'Fertilizer']), key=by_sales)
             for product in care_products:
                 recommended_products.append(f"🌱 {product.product_name} - {product.description[:100]}... (₹{product.price})")
         
         # Look for similar plants (same category or similar names)
-        similar_plants = Product.objects.filter(
-            product_name__icontains=plant_name,
-            is_available=True
-        )
+        similar_plants = [p for p in catalog.filter_name(plant_name) if p.is_available]
         for product in similar_plants:
             recommended_products.append(f"🌿 {product.product_name} - {product.description[:100]}... (₹{product.price})")
         
         # If no direct matches, look for general plant care products
         if not recommended_products:
-            general_care = Product.objects.filter(
-                category__category_name__in=['Plant Care', 'Fertilizer'],
-                is_available=True
-            )[:5]  # Limit to 5 products
+            general_care = sorted(catalog.in_categories(['Plant Care', 'Fertilizer']), key=by_sales)[:5]  # Limit to 5 products
             for product in general_care:
                 recommended_products.append(f"🌱 {product.product_name} - {product.description[:100]}... (₹{product.price})")
         
@@ -127,13 +129,14 @@ def add_to_cart(user_id: int, product_name: str, variation_dict: dict = None) ->
         orig_variation_dict = variation_dict.copy()
         User = get_user_model()
         current_user = User.objects.get(id=user_id)
-        # Search for product by name (case-insensitive, partial match)
-        products = Product.objects.filter(product_name__icontains=product_name)
-        if not products.exists():
+        # Search for product by name (case-insensitive, partial match) in the catalog snapshot
+        catalog = get_catalog()
+        product, products = catalog.resolve(product_name)
+        if product is None:
             # Try to suggest similar products
-            similar_products = Product.objects.filter(product_name__icontains=product_name.split()[0])
-            if similar_products.exists():
-                names = ", ".join([p.product_name for p in similar_products[:5]])
+            similar_products = catalog.matcher.top_k(product_name, k=5, cutoff=0.5)
+            if similar_products:
+                names = ", ".join([name for _, _, name in similar_products])
                 return (
                     f"No product found with name '{product_name}'. "
                     f"Did you mean: {names}? Please specify the exact product name."
@@ -143,28 +146,14 @@ def add_to_cart(user_id: int, product_name: str, variation_dict: dict = None) ->
                 "Would you like to see the available options or try adding a different plant?"
             )
         # Prefer exact match if available
-        exact_matches = products.filter(product_name__iexact=product_name)
-        if exact_matches.exists():
-            product = exact_matches.first()
-        elif products.count() == 1:
-            product = products.first()
-        else:
-            product = products.first()
+        if catalog.get(product_name) is None and len(products) > 1:
             similar_names = ", ".join([p.product_name for p in products[:5]])
             return (
                 f"Multiple products found matching '{product_name}': {similar_names}. "
                 f"Adding '{product.product_name}' to your cart. If this is not correct, please specify the exact product name."
             )
-        # Check if product requires variations
-        allowed = product.allowed_variations
-        required_variations = []
-        if allowed:
-            allowed_types = [x.strip() for x in allowed.split(",") if x.strip()]
-            if allowed_types:
-                # Check if there is at least one active variation for this product
-                has_variations = Variation.objects.filter(product=product, variation_category__in=allowed_types, is_active=True).exists()
-                if has_variations:
-                    required_variations = allowed_types
+        # Check if product requires variations (allowed types with at least one active value)
+        required_variations = catalog.required_variations(product)
         # --- PATCH: Normalize user keys to match required_variations (case-insensitive) ---
         norm_variation_dict = {}
         for req in required_variations:
@@ -184,27 +173,12 @@ def add_to_cart(user_id: int, product_name: str, variation_dict: dict = None) ->
         product_variation = []
         # Extract variations
         for key, value in variation_dict.items():
-            try:
-                variation = Variation.objects.get(
-                    product=product,
-                    variation_category__iexact=key,
-                    variation_value__iexact=value
-                )
-                product_variation.append(variation)
-            except Variation.DoesNotExist:
-                continue
-        cart_items = CartItem.objects.filter(product=product, user=current_user)
-        for item in cart_items:
-            existing_variation = list(item.variation.all())
-            if set(existing_variation) == set(product_variation):
-                item.quantity += 1
-                item.save()
-                return f"Increased quantity of {product.product_name} with selected variations."
-        # If no matching variation, create new item
-        new_item = CartItem.objects.create(product=product, quantity=1, user=current_user)
-        if product_variation:
-            new_item.variation.set(product_variation)
-        new_item.save()
+            variation_id = catalog.find_variation(product, key, value)
+            if variation_id is not None:
+                product_variation.append(variation_id)
+        # One indexed upsert on (user, product, variation signature)
+        if not add_item(product.id, product_variation, user=current_user):
+            return f"Increased quantity of {product.product_name} with selected variations."
         return f"Added {product.product_name} to cart."
     except ValueError as e:
         return f"Error: {str(e)}"
@@ -224,29 +198,15 @@ def remove_cart_item(user_id: int, product_name: str) -> str:
         User = get_user_model()
         current_user = User.objects.get(id=user_id)
         
-        # Get cart items for the user
-        cart_items = CartItem.objects.select_related('product').filter(user=current_user)
-        if not cart_items.exists():
+        if not CartItem.objects.filter(user=current_user).exists():
             return "Your cart is empty."
-        
-        # Search for the product in cart items
-        matching_items = []
-        for item in cart_items:
-            if product_name.lower() in item.product.product_name.lower():
-                matching_items.append(item)
-        
-        if not matching_items:
-            return f"No product found in cart with name '{product_name}'."
-        
+
         # Remove all matching items
-        removed_count = 0
-        removed_names = []
-        
-        for item in matching_items:
-            removed_names.append(item.product.product_name)
-            item.delete()
-            removed_count += 1
-        
+        removed_names = remove_items(Q(product__product_name__icontains=product_name), user=current_user)
+        if not removed_names:
+            return f"No product found in cart with name '{product_name}'."
+        removed_count = len(removed_names)
+
         if removed_count == 1:
             return f"Removed {removed_names[0]} from your cart."
         else:
@@ -360,28 +320,18 @@ def list_product_variations(product_name: str) -> str:
     List all available variation categories and values for a given product name.
     """
     try:
-        products = Product.objects.filter(product_name__icontains=product_name)
-        if not products.exists():
+        catalog = get_catalog()
+        # Prefer exact match if available, else the first partial match
+        product, _ = catalog.resolve(product_name)
+        if product is None:
             return f"No product found with name '{product_name}'."
-        # Prefer exact match if available
-        exact_matches = products.filter(product_name__iexact=product_name)
-        if exact_matches.exists():
-            product = exact_matches.first()
-        elif products.count() == 1:
-            product = products.first()
-        else:
-            product = products.first()
-        allowed = product.allowed_variations
-        if not allowed:
-            return f"'{product.product_name}' does not have any selectable variations."
-        allowed_types = [x.strip() for x in allowed.split(",") if x.strip()]
-        if not allowed_types:
+        if not product.allowed_variations:
             return f"'{product.product_name}' does not have any selectable variations."
+        values = catalog.variation_values(product)
         result = [f"Available variations for '{product.product_name}':"]
-        for var_type in allowed_types:
-            values = Variation.objects.filter(product=product, variation_category__iexact=var_type, is_active=True).values_list('variation_value', flat=True).distinct()
-            if values:
-                result.append(f"- {var_type.capitalize()}: {', '.join(sorted(set(values)))}")
+        for var_type in product.allowed_variations:
+            if values.get(var_type.lower()):
+                result.append(f"- {var_type.capitalize()}: {', '.join(sorted(set(values[var_type.lower()])))}")
         if len(result) == 1:
             return f"No active variations found for '{product.product_name}'."
         return "\n".join(result)
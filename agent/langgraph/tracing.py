@@ -0,0 +1,233 @@
+"""
+Per-turn cost and latency accounting for the chat agent.
+
+A `TurnTrace` is passed to the graph as a LangChain callback handler. Every
+node wrapped by `agent.offloaded` looks it up from the LangGraph config and
+runs inside `node_scope`, which times the node and marks it as the current
+node for everything it calls (LLMs, tools, the ORM, also on tool threads,
+since LangGraph copies context variables into them). The handler adds LLM
+token usage and tool calls to that node; database queries are counted by an
+execute wrapper installed on every connection (see `install_query_counter`).
+When the turn ends one compact `AgentTrace` row is written with the totals
+and the per-node breakdown; the table keeps the last `AGENT_TRACE_KEEP` turns.
+
+Work a turn hands to a background task (the plant identification) is traced
+with `task_scope`: the task gets the turn's `turn_id` in its payload, and its
+usage is merged into the same row under its own node, whether the task
+finishes before or after the turn.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.config import get_config
+
+# (TurnTrace, node name) while a traced node runs
+_current_node = ContextVar("agent_trace_node", default=None)
+
+OUTSIDE_NODE = "-"
+COUNTERS = ("calls", "wall_ms", "tokens_in", "tokens_out", "llm_calls", "tool_calls", "db_queries")
+# Prune old rows once every this many saved turns
+PRUNE_EVERY = 100
+
+
+def token_cost(model: str, tokens_in: int, tokens_out: int) -> Decimal:
+    """USD cost from settings.AGENT_TOKEN_PRICES, matched on the model name prefix"""
+    for prefix, (price_in, price_out) in settings.AGENT_TOKEN_PRICES.items():
+        if (model or "").startswith(prefix):
+            return (Decimal(str(price_in)) * tokens_in + Decimal(str(price_out)) * tokens_out) / 1_000_000
+    return Decimal(0)
+
+
+def llm_usage(response):
+    """(model, input tokens, output tokens) of an LLMResult"""
+    tokens_in = tokens_out = 0
+    model = ""
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                tokens_in += usage.get("input_tokens", 0)
+                tokens_out += usage.get("output_tokens", 0)
+                model = model or message.response_metadata.get("model_name", "")
+    output = response.llm_output or {}
+    if not tokens_in and not tokens_out:
+        usage = output.get("token_usage") or {}
+        tokens_in, tokens_out = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return output.get("model_name") or model, tokens_in, tokens_out
+
+
+class TurnTrace(BaseCallbackHandler):
+    """Counters of one conversation turn, per graph node"""
+
+    run_inline = True
+
+    def __init__(self, user_id: int, thread_id: str = "", turn_id: str = "", background: bool = False):
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.turn_id = turn_id or uuid.uuid4().hex
+        # Background traces only add node counters to their turn, the turn's wall time is its own
+        self.background = background
+        self.nodes = {}
+        self.cost = Decimal(0)
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, node: str, **counts):
+        with self._lock:
+            stats = self.nodes.setdefault(node, dict.fromkeys(COUNTERS, 0))
+            for name, value in counts.items():
+                stats[name] += value
+
+    def record_llm(self, node: str, model: str, tokens_in: int, tokens_out: int):
+        self.add(node, llm_calls=1, tokens_in=tokens_in, tokens_out=tokens_out)
+        with self._lock:
+            self.cost += token_cost(model, tokens_in, tokens_out)
+
+    # --- LangChain callbacks ---
+    def on_llm_end(self, response, **kwargs):
+        scope = _current_node.get()
+        self.record_llm(scope[1] if scope else OUTSIDE_NODE, *llm_usage(response))
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        scope = _current_node.get()
+        self.add(scope[1] if scope else OUTSIDE_NODE, tool_calls=1)
+
+    def totals(self) -> dict:
+        with self._lock:
+            return {name: sum(stats[name] for stats in self.nodes.values()) for name in COUNTERS if name not in ("calls", "wall_ms")}
+
+    def save(self):
+        """
+        Store the counters in the turn's AgentTrace row (skipped when settings.AGENT_TRACE_KEEP is 0).
+        The turn and its background tasks save in any order, each adding to the row.
+        """
+        keep = settings.AGENT_TRACE_KEEP
+        if not keep:
+            return None
+        from agent.models import AgentTrace
+        wall_ms = round((time.perf_counter() - self.started) * 1000)
+        with self._lock:
+            nodes = {node: {k: round(v) for k, v in stats.items() if v} for node, stats in self.nodes.items()}
+            cost = self.cost
+        totals = self.totals()
+        with transaction.atomic():
+            trace, created = AgentTrace.objects.get_or_create(turn_id=self.turn_id, defaults={'user_id': self.user_id})
+            if not created:
+                trace = AgentTrace.objects.select_for_update().get(pk=trace.pk)
+            for name, value in totals.items():
+                setattr(trace, name, getattr(trace, name) + value)
+            for node, stats in nodes.items():
+                merged = trace.nodes.setdefault(node, {})
+                for name, value in stats.items():
+                    merged[name] = merged.get(name, 0) + value
+            trace.cost += cost
+            if not self.background:
+                trace.wall_ms = wall_ms
+                trace.thread_id = self.thread_id
+            trace.save()
+        label = "background task" if self.background else "turn"
+        print(f"[TRACE] {label} {wall_ms}ms, tokens {totals['tokens_in']}/{totals['tokens_out']}, "
+              f"tools {totals['tool_calls']}, queries {totals['db_queries']}")
+        if created and trace.pk % PRUNE_EVERY == 0:
+            AgentTrace.objects.filter(pk__lte=trace.pk - keep).delete()
+        return trace
+
+
+def current_trace():
+    """The TurnTrace among the callbacks of the running graph, if any"""
+    try:
+        callbacks = get_config().get("callbacks")
+    except RuntimeError:
+        return None
+    for handler in getattr(callbacks, "handlers", None) or callbacks or ():
+        if isinstance(handler, TurnTrace):
+            return handler
+    return None
+
+
+@contextmanager
+def node_scope(node: str):
+    """Time a node and attribute the LLM, tool and database work done inside it"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    # Connections opened before this module was imported missed the signal below
+    install_query_counter(None, connection)
+    token = _current_node.set((trace, node))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(node, calls=1, wall_ms=(time.perf_counter() - started) * 1000)
+        _current_node.reset(token)
+
+
+@contextmanager
+def task_scope(turn_id: str, user_id: int, node: str):
+    """
+    Trace a background task started by the turn `turn_id` as the graph node `node` of that turn
+    (a no-op without a turn id, e.g. when tracing is off). Its usage is saved when the task ends.
+    """
+    if not turn_id:
+        yield
+        return
+    trace = TurnTrace(user_id, turn_id=turn_id, background=True)
+    install_query_counter(None, connection)
+    token = _current_node.set((trace, node))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(node, calls=1, wall_ms=(time.perf_counter() - started) * 1000)
+        _current_node.reset(token)
+        try:
+            trace.save()
+        except Exception as e:
+            print(f"Error saving agent trace: {e}")
+
+
+def traced(node):
+    """Run a sync graph node inside node_scope, named after its graph node"""
+    @wraps(node)
+    def run(state):
+        try:
+            name = get_config().get("metadata", {}).get("langgraph_node") or node.__name__
+        except RuntimeError:
+            return node(state)
+        with node_scope(name):
+            return node(state)
+    return run
+
+
+def record_llm_usage(model: str, tokens_in: int, tokens_out: int):
+    """Report usage of an LLM call made outside LangChain (e.g. the raw OpenAI client)"""
+    scope = _current_node.get()
+    if scope:
+        scope[0].record_llm(scope[1], model, tokens_in, tokens_out)
+
+
+def count_query(execute, sql, params, many, context):
+    scope = _current_node.get()
+    if scope:
+        scope[0].add(scope[1], db_queries=1)
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # Connections are per thread, so the wrapper is attached to each one as it connects
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+connection_created.connect(install_query_counter, dispatch_uid="agent_trace_query_counter")
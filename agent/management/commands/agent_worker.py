@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from agent.tasks import run_worker
+
+
+class Command(BaseCommand):
+    help = "Run queued agent background tasks (plant identification, chat image storage)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+        parser.add_argument('--lease', type=int, default=300, help="Seconds before a running task is assumed abandoned")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Agent worker started")
+        try:
+            run_worker(sleep=options['sleep'], once=options['once'], lease_seconds=options['lease'])
+        except KeyboardInterrupt:
+            self.stdout.write("Agent worker stopped")
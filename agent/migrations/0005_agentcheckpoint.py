@@ -0,0 +1,53 @@
+# Generated by Django 4.2.21 on 2026-10-17 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0004_chatimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thread_id', models.CharField(max_length=150)),
+                ('checkpoint_ns', models.CharField(blank=True, default='', max_length=150)),
+                ('checkpoint_id', models.CharField(max_length=64)),
+                ('parent_checkpoint_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('checkpoint_type', models.CharField(max_length=20)),
+                ('checkpoint', models.BinaryField()),
+                ('metadata_type', models.CharField(max_length=20)),
+                ('metadata', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AgentCheckpointWrite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thread_id', models.CharField(max_length=150)),
+                ('checkpoint_ns', models.CharField(blank=True, default='', max_length=150)),
+                ('checkpoint_id', models.CharField(max_length=64)),
+                ('task_id', models.CharField(max_length=64)),
+                ('task_path', models.CharField(blank=True, default='', max_length=255)),
+                ('idx', models.IntegerField()),
+                ('channel', models.CharField(max_length=150)),
+                ('value_type', models.CharField(max_length=20)),
+                ('value', models.BinaryField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='agentcheckpointwrite',
+            constraint=models.UniqueConstraint(fields=('thread_id', 'checkpoint_ns', 'checkpoint_id', 'task_id', 'idx'), name='agent_checkpoint_write_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='agentcheckpoint',
+            constraint=models.UniqueConstraint(fields=('thread_id', 'checkpoint_ns', 'checkpoint_id'), name='agent_checkpoint_unique'),
+        ),
+    ]
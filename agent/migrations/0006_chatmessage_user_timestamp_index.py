@@ -0,0 +1,17 @@
+# Generated by Django 4.2.21 on 2026-10-17 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0005_agentcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['user', 'timestamp'], name='agent_chat_user_ts_idx'),
+        ),
+    ]
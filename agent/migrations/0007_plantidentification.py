@@ -0,0 +1,30 @@
+# Generated by Django 4.2.21 on 2026-10-17 22:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0006_chatmessage_user_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantIdentification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_hash', models.BigIntegerField()),
+                ('hash_band0', models.IntegerField(db_index=True)),
+                ('hash_band1', models.IntegerField(db_index=True)),
+                ('hash_band2', models.IntegerField(db_index=True)),
+                ('hash_band3', models.IntegerField(db_index=True)),
+                ('plant_name', models.CharField(max_length=100)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('chat_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='agent.chatimage')),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('agent', '0008_agenttask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thread_id', models.CharField(blank=True, max_length=150)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wall_ms', models.PositiveIntegerField(default=0)),
+                ('tokens_in', models.PositiveIntegerField(default=0)),
+                ('tokens_out', models.PositiveIntegerField(default=0)),
+                ('llm_calls', models.PositiveIntegerField(default=0)),
+                ('tool_calls', models.PositiveIntegerField(default=0)),
+                ('db_queries', models.PositiveIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=6, default=0, max_digits=10)),
+                ('nodes', models.JSONField(blank=True, default=dict)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='agent_trace_user_ts_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0009_agenttrace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200)),
+                ('window_start', models.BigIntegerField()),
+                ('hits', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ratelimitcounter',
+            constraint=models.UniqueConstraint(fields=('key', 'window_start'), name='agent_ratelimit_unique'),
+        ),
+    ]
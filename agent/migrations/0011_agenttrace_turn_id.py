@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0010_ratelimitcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agenttrace',
+            name='turn_id',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from .langgraph.image_hash import bands, hamming, to_signed, to_unsigned
 # Create your models here.
 class ChatMessage(models.Model):
     user = models.ForeignKey('accounts.Account', on_delete=models.CASCADE)
@@ -7,6 +9,11 @@ class ChatMessage(models.Model):
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='agent_chat_user_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} ({self.role}): {self.message[:30]}"
     
@@ -24,3 +31,170 @@ class ChatImage(models.Model):
 
     def __str__(self):
         return f"Image by {self.user} at {self.uploaded_at}"
+
+class PlantIdentificationManager(models.Manager):
+    def nearest(self, image_hash, max_distance):
+        """
+        Closest stored identification within max_distance bits of image_hash (a 64-bit dHash), else None.
+        Candidates share at least one exact 16-bit band with the hash (max_distance must stay below 4),
+        so the lookup uses the band indexes instead of scanning the table.
+        """
+        query = models.Q()
+        for i, band in enumerate(bands(image_hash)):
+            query |= models.Q(**{f'hash_band{i}': band})
+        best, best_distance = None, max_distance + 1
+        for entry in self.filter(query).only('id', 'image_hash', 'plant_name'):
+            distance = hamming(image_hash, to_unsigned(entry.image_hash))
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    def remember(self, image_hash, plant_name, chat_image=None):
+        band_values = bands(image_hash)
+        return self.create(
+            image_hash=to_signed(image_hash),
+            hash_band0=band_values[0], hash_band1=band_values[1],
+            hash_band2=band_values[2], hash_band3=band_values[3],
+            plant_name=plant_name,
+            chat_image=chat_image,
+        )
+
+# Plant identification results keyed by the perceptual hash of the uploaded image,
+# so re-uploads and near-identical photos skip the vision model call.
+class PlantIdentification(models.Model):
+    image_hash = models.BigIntegerField()  # 64-bit dHash stored as signed
+    hash_band0 = models.IntegerField(db_index=True)
+    hash_band1 = models.IntegerField(db_index=True)
+    hash_band2 = models.IntegerField(db_index=True)
+    hash_band3 = models.IntegerField(db_index=True)
+    plant_name = models.CharField(max_length=100)
+    chat_image = models.ForeignKey(ChatImage, on_delete=models.SET_NULL, null=True, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PlantIdentificationManager()
+
+    def __str__(self):
+        return f"{self.plant_name} ({self.hits} hits)"
+
+# Local background job queue (see agent/tasks.py and the agent_worker management command).
+# Input bytes travel in the row, so web processes and workers only need to share the database.
+class AgentTask(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    data = models.BinaryField(null=True, blank=True)  # e.g. the uploaded image, cleared once processed
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='agent_task_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+# Hit counters of the sliding-window rate limiter (see agent/ratelimit.py), one row per key and fixed window
+class RateLimitCounter(models.Model):
+    key = models.CharField(max_length=200)  # e.g. "user:42:ask:3600" or "upstream:openai:60"
+    window_start = models.BigIntegerField()  # window number: unix time // window length
+    hits = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'window_start'], name='agent_ratelimit_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} @ {self.window_start}: {self.hits}"
+
+# One row per chat turn with its cost and latency counters (see agent/langgraph/tracing.py).
+# `nodes` holds the same counters per graph node; only the last AGENT_TRACE_KEEP turns are kept.
+class AgentTrace(models.Model):
+    user = models.ForeignKey('accounts.Account', on_delete=models.CASCADE)
+    thread_id = models.CharField(max_length=150, blank=True)
+    turn_id = models.CharField(max_length=32, unique=True, null=True, blank=True)  # shared with the turn's background tasks
+    created_at = models.DateTimeField(auto_now_add=True)
+    wall_ms = models.PositiveIntegerField(default=0)
+    tokens_in = models.PositiveIntegerField(default=0)
+    tokens_out = models.PositiveIntegerField(default=0)
+    llm_calls = models.PositiveIntegerField(default=0)
+    tool_calls = models.PositiveIntegerField(default=0)
+    db_queries = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=10, decimal_places=6, default=0)  # USD, see AGENT_TOKEN_PRICES
+    nodes = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='agent_trace_user_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} turn at {self.created_at} ({self.wall_ms} ms)"
+
+    def slowest_node(self):
+        if not self.nodes:
+            return ''
+        return max(self.nodes, key=lambda node: self.nodes[node].get('wall_ms', 0))
+
+# Durable LangGraph checkpoints (short-term conversation memory).
+# Rows are written through the pooled saver in agent/langgraph/checkpointer.py,
+# these models only own the schema so it is managed by migrations.
+class AgentCheckpoint(models.Model):
+    thread_id = models.CharField(max_length=150)
+    checkpoint_ns = models.CharField(max_length=150, blank=True, default='')
+    checkpoint_id = models.CharField(max_length=64)
+    parent_checkpoint_id = models.CharField(max_length=64, blank=True, null=True)
+    checkpoint_type = models.CharField(max_length=20)
+    checkpoint = models.BinaryField()
+    metadata_type = models.CharField(max_length=20)
+    metadata = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['thread_id', 'checkpoint_ns', 'checkpoint_id'], name='agent_checkpoint_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.thread_id} @ {self.checkpoint_id}"
+
+class AgentCheckpointWrite(models.Model):
+    thread_id = models.CharField(max_length=150)
+    checkpoint_ns = models.CharField(max_length=150, blank=True, default='')
+    checkpoint_id = models.CharField(max_length=64)
+    task_id = models.CharField(max_length=64)
+    task_path = models.CharField(max_length=255, blank=True, default='')
+    idx = models.IntegerField()
+    channel = models.CharField(max_length=150)
+    value_type = models.CharField(max_length=20)
+    value = models.BinaryField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['thread_id', 'checkpoint_ns', 'checkpoint_id', 'task_id', 'idx'], name='agent_checkpoint_write_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.thread_id} @ {self.checkpoint_id} [{self.channel}]"
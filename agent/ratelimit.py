@@ -0,0 +1,118 @@
+"""
+Sliding-window rate limiting backed by the database.
+
+Each limit is a (requests, window seconds) pair. Hits are counted per fixed
+window in `RateLimitCounter` rows with a single atomic upsert, so every worker
+shares the same counters and concurrent requests cannot both slip under the
+limit. The current window's count is blended with the previous window's,
+weighted by how much of the previous window still overlaps the sliding one
+("sliding window counter"), which smooths out bursts at window edges without
+storing a row per request. Rejected requests are not counted.
+
+Limits are configured in settings.AGENT_RATE_LIMITS (per user and endpoint)
+and settings.AGENT_UPSTREAM_RATE_LIMITS (per upstream API, across all users).
+An upstream is charged per call it will receive, and `limit_request` takes
+back the endpoint hit when the upstream rejects, so a request turned away
+for a busy upstream does not use up the user's quota.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .models import RateLimitCounter
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, scope: str, retry_after: int):
+        super().__init__(f"Rate limit exceeded for {scope}, retry in {retry_after}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def _increment(key: str, window_start: int, amount: int = 1) -> int:
+    qn = connection.ops.quote_name
+    table, key_col, window_col, hits_col = (qn(name) for name in (RateLimitCounter._meta.db_table, 'key', 'window_start', 'hits'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({key_col}, {window_col}, {hits_col}) VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({key_col}, {window_col}) DO UPDATE SET {hits_col} = {table}.{hits_col} + EXCLUDED.{hits_col} "
+            f"RETURNING {hits_col}",
+            [key, window_start, amount],
+        )
+        return cursor.fetchone()[0]
+
+
+def hit(key: str, limit: int, window: int, amount: int = 1):
+    """
+    Count `amount` requests against `key` if they fit in `limit` requests per sliding `window` seconds.
+    Returns (allowed, retry_after seconds, receipt); the receipt takes the hits back (see release).
+    """
+    now = time.time()
+    current = int(now // window)
+    key = f"{key}:{window}"
+    hits = _increment(key, current, amount)
+    if hits == amount:
+        # First hit of a new window; windows before the previous one no longer matter
+        RateLimitCounter.objects.filter(key=key, window_start__lt=current - 1).delete()
+    previous = RateLimitCounter.objects.filter(key=key, window_start=current - 1).values_list('hits', flat=True).first() or 0
+    elapsed = now - current * window
+    if previous * (1 - elapsed / window) + hits <= limit:
+        return True, 0, (key, current, amount)
+    _increment(key, current, -amount)
+    return False, max(1, math.ceil(window - elapsed)), None
+
+
+def release(receipt):
+    """Take back the hits of an allowed request that did not go ahead after all"""
+    if receipt:
+        _increment(*receipt[:2], -receipt[2])
+
+
+def check(key: str, rule, amount: int = 1):
+    """
+    Raise RateLimitExceeded when `rule` ((requests, window) or None for no limit) rejects `amount`
+    more requests. Returns the receipt of the counted hits (None without a rule).
+    """
+    if not rule:
+        return None
+    allowed, retry_after, receipt = hit(key, *rule, amount=amount)
+    if not allowed:
+        raise RateLimitExceeded(key, retry_after)
+    return receipt
+
+
+def client_key(request) -> str:
+    if request.user.is_authenticated:
+        return f"user:{request.user.id}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def limit_endpoint(client: str, endpoint: str):
+    """Per-client limit of an endpoint (settings.AGENT_RATE_LIMITS[endpoint])"""
+    return check(f"{client}:{endpoint}", settings.AGENT_RATE_LIMITS.get(endpoint))
+
+
+def limit_upstream(name: str, calls: int = 1):
+    """Shared limit of an upstream API (settings.AGENT_UPSTREAM_RATE_LIMITS[name]), charged per call"""
+    return check(f"upstream:{name}", settings.AGENT_UPSTREAM_RATE_LIMITS.get(name), amount=calls)
+
+
+def limit_request(client: str, endpoint: str, upstream: str, calls: int = 1):
+    """
+    Endpoint limit of the client plus `calls` calls to the upstream API. When the upstream
+    rejects, the endpoint hit is taken back, so the client's quota is only used by requests that run.
+    """
+    receipt = limit_endpoint(client, endpoint)
+    try:
+        limit_upstream(upstream, calls)
+    except RateLimitExceeded:
+        release(receipt)
+        raise
+
+
+def reset_user(user_id: int) -> int:
+    """Clear every endpoint counter of a user"""
+    deleted, _ = RateLimitCounter.objects.filter(key__startswith=f"user:{user_id}:").delete()
+    return deleted
@@ -0,0 +1,173 @@
+"""
+Local, database-backed task queue.
+
+`enqueue()` stores a task row and returns a `TaskFuture`. Tasks are executed by
+`python manage.py agent_worker` processes, which claim rows with an atomic
+UPDATE, so several workers can run side by side without an external broker.
+A caller that needs a result and finds the task still unclaimed after a grace
+period (settings.AGENT_TASK_INLINE_AFTER) runs it itself (see
+`TaskFuture.result`), so nothing stalls when no worker is running. Tasks
+nobody waits for are always left to the workers.
+"""
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import AgentTask
+
+# Task name -> dotted path of the handler, called as handler(payload, data) and returning a JSON-serializable result
+TASK_HANDLERS = {
+    'identify_chat_image': 'agent.langgraph.agent.process_chat_image',
+}
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 10  # seconds, multiplied by the attempt number
+
+
+class TaskFailed(Exception):
+    pass
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(name: str, payload: dict = None, data: bytes = None) -> 'TaskFuture':
+    if name not in TASK_HANDLERS:
+        raise ValueError(f"Unknown task: {name}")
+    task = AgentTask.objects.create(name=name, payload=payload or {}, data=data)
+    return TaskFuture(task.pk)
+
+
+def claim(task_id: int, worker: str) -> bool:
+    """Atomically move a queued task to running; only one caller can win"""
+    now = timezone.now()
+    return AgentTask.objects.filter(pk=task_id, status=AgentTask.QUEUED, run_after__lte=now).update(
+        status=AgentTask.RUNNING, locked_by=worker, locked_at=now,
+    ) == 1
+
+
+def claim_next(worker: str):
+    """Claim the oldest runnable task, or return None when the queue is empty"""
+    candidates = AgentTask.objects.filter(
+        status=AgentTask.QUEUED, run_after__lte=timezone.now(),
+    ).order_by('run_after', 'id').values_list('id', flat=True)[:10]
+    for task_id in candidates:
+        if claim(task_id, worker):
+            return AgentTask.objects.get(pk=task_id)
+    return None
+
+
+def execute(task: AgentTask):
+    """Run a claimed task and record its result, scheduling a retry on failure"""
+    task.attempts += 1
+    started = time.perf_counter()
+    try:
+        handler = import_string(TASK_HANDLERS[task.name])
+        data = bytes(task.data) if task.data is not None else None
+        result = handler(task.payload, data)
+    except Exception as e:
+        print(f"[TASK] {task} failed (attempt {task.attempts}): {e}")
+        task.error = traceback.format_exc()
+        if task.attempts < MAX_ATTEMPTS:
+            task.status = AgentTask.QUEUED
+            task.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * task.attempts)
+        else:
+            task.status = AgentTask.FAILED
+            task.finished_at = timezone.now()
+        task.save(update_fields=['status', 'error', 'attempts', 'run_after', 'finished_at'])
+        return
+    task.status = AgentTask.DONE
+    task.result = result
+    task.data = None
+    task.finished_at = timezone.now()
+    task.save(update_fields=['status', 'result', 'data', 'attempts', 'finished_at'])
+    print(f"[TASK] {task} done in {time.perf_counter() - started:.2f}s")
+
+
+def requeue_stale(lease_seconds: int) -> int:
+    """Return tasks whose worker died mid-run to the queue"""
+    return AgentTask.objects.filter(
+        status=AgentTask.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=lease_seconds),
+    ).update(status=AgentTask.QUEUED, locked_by='', locked_at=None)
+
+
+def purge_finished(retention_seconds: int) -> int:
+    deleted, _ = AgentTask.objects.filter(
+        status__in=[AgentTask.DONE, AgentTask.FAILED],
+        finished_at__lt=timezone.now() - timedelta(seconds=retention_seconds),
+    ).delete()
+    return deleted
+
+
+class TaskFuture:
+    """
+    Handle on a queued task, referenced by id so it can live in checkpointed graph state.
+    """
+
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, task_id: int):
+        self.id = task_id
+
+    def _row(self):
+        return AgentTask.objects.filter(pk=self.id).values('status', 'result', 'error').first()
+
+    def done(self) -> bool:
+        row = self._row()
+        return row is None or row['status'] in (AgentTask.DONE, AgentTask.FAILED)
+
+    def run_if_queued(self) -> bool:
+        """Run the task in the calling thread when no worker has claimed it; returns whether it ran here"""
+        if not claim(self.id, f"inline:{worker_name()}"):
+            return False
+        execute(AgentTask.objects.get(pk=self.id))
+        return True
+
+    def result(self, timeout: float = None):
+        """
+        Wait for the task and return its result. A task still queued after
+        settings.AGENT_TASK_INLINE_AFTER seconds is run by the caller instead.
+        Raises TaskFailed when the task failed for good, TimeoutError after `timeout`.
+        """
+        started = time.monotonic()
+        while True:
+            row = self._row()
+            if row is None:
+                raise TaskFailed(f"Task {self.id} no longer exists")
+            if row['status'] == AgentTask.DONE:
+                return row['result']
+            if row['status'] == AgentTask.FAILED:
+                raise TaskFailed(row['error'].strip().splitlines()[-1] if row['error'] else f"Task {self.id} failed")
+            elapsed = time.monotonic() - started
+            if row['status'] == AgentTask.QUEUED and elapsed >= settings.AGENT_TASK_INLINE_AFTER and self.run_if_queued():
+                continue
+            if timeout is not None and elapsed >= timeout:
+                raise TimeoutError(f"Task {self.id} did not finish within {timeout}s")
+            time.sleep(self.POLL_INTERVAL)
+
+
+def run_worker(sleep: float = 1.0, once: bool = False, lease_seconds: int = 300, retention_seconds: int = 24 * 60 * 60):
+    """Claim and execute tasks until interrupted (or until the queue is empty with once=True)"""
+    worker = worker_name()
+    last_maintenance = 0.0
+    while True:
+        close_old_connections()
+        if time.monotonic() - last_maintenance > 60:
+            requeue_stale(lease_seconds)
+            purge_finished(retention_seconds)
+            last_maintenance = time.monotonic()
+        task = claim_next(worker)
+        if task is None:
+            if once:
+                return
+            time.sleep(sleep)
+            continue
+        execute(task)
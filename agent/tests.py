@@ -1,3 +1,187 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .langgraph.image_hash import bands, hamming, to_signed, to_unsigned
+from .langgraph.research_cache import QuestionCache, is_context_dependent
+from .langgraph.router import independent_intents, split_intents
+from .models import PlantIdentification, RateLimitCounter
+from . import ratelimit
+from .ratelimit import RateLimitExceeded
+
+
+@override_settings(
+    AGENT_RATE_LIMITS={'ask': (3, 60)},
+    AGENT_UPSTREAM_RATE_LIMITS={'openai': (4, 60)},
+)
+class RateLimitTests(TestCase):
+    def at(self, seconds):
+        return mock.patch('agent.ratelimit.time.time', return_value=seconds)
+
+    def test_limit_within_a_window(self):
+        with self.at(6000):
+            for _ in range(3):
+                allowed, retry_after, receipt = ratelimit.hit('user:1:ask', 3, 60)
+                self.assertTrue(allowed)
+            allowed, retry_after, receipt = ratelimit.hit('user:1:ask', 3, 60)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 60)
+        self.assertIsNone(receipt)
+        # Rejected hits are not counted
+        self.assertEqual(RateLimitCounter.objects.get(key='user:1:ask:60').hits, 3)
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        with self.at(6000):
+            for _ in range(3):
+                ratelimit.hit('user:1:ask', 3, 60)
+        # Half-way through the next window the previous three count for 1.5
+        with self.at(6090):
+            self.assertTrue(ratelimit.hit('user:1:ask', 3, 60)[0])
+            allowed, retry_after, _ = ratelimit.hit('user:1:ask', 3, 60)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 30)
+        # In the window after that the first one no longer counts and its row is gone
+        with self.at(6150):
+            self.assertTrue(ratelimit.hit('user:1:ask', 3, 60)[0])
+        self.assertEqual(
+            sorted(RateLimitCounter.objects.filter(key='user:1:ask:60').values_list('window_start', 'hits')),
+            [(101, 1), (102, 1)],
+        )
+
+    def test_keys_are_separate(self):
+        with self.at(6000):
+            for _ in range(3):
+                ratelimit.hit('user:1:ask', 3, 60)
+            self.assertTrue(ratelimit.hit('user:2:ask', 3, 60)[0])
+
+    def test_release_and_amount(self):
+        with self.at(6000):
+            allowed, _, receipt = ratelimit.hit('upstream:openai', 4, 60, amount=3)
+            self.assertTrue(allowed)
+            self.assertFalse(ratelimit.hit('upstream:openai', 4, 60, amount=2)[0])
+            ratelimit.release(receipt)
+            self.assertTrue(ratelimit.hit('upstream:openai', 4, 60, amount=4)[0])
+
+    def test_limit_endpoint(self):
+        with self.at(6000):
+            for _ in range(3):
+                ratelimit.limit_endpoint('user:1', 'ask')
+            with self.assertRaises(RateLimitExceeded) as raised:
+                ratelimit.limit_endpoint('user:1', 'ask')
+            # Endpoints without a configured limit are not limited
+            self.assertIsNone(ratelimit.limit_endpoint('user:1', 'other'))
+        self.assertEqual(raised.exception.scope, 'user:1:ask')
+        self.assertEqual(raised.exception.retry_after, 60)
+
+    def test_upstream_rejection_gives_back_the_endpoint_hit(self):
+        with self.at(6000):
+            ratelimit.limit_request('user:1', 'ask', 'openai', calls=3)
+            with self.assertRaises(RateLimitExceeded) as raised:
+                ratelimit.limit_request('user:1', 'ask', 'openai', calls=3)
+        self.assertEqual(raised.exception.scope, 'upstream:openai')
+        self.assertEqual(RateLimitCounter.objects.get(key='user:1:ask:60').hits, 1)
+        self.assertEqual(RateLimitCounter.objects.get(key='upstream:openai:60').hits, 3)
+
+    def test_reset_user(self):
+        with self.at(6000):
+            ratelimit.limit_endpoint('user:1', 'ask')
+            ratelimit.limit_endpoint('user:2', 'ask')
+        self.assertEqual(ratelimit.reset_user(1), 1)
+        self.assertEqual(list(RateLimitCounter.objects.values_list('key', flat=True)), ['user:2:ask:60'])
+
+
+class PlantIdentificationTests(TestCase):
+    HASH = 0xF0E1_D2C3_B4A5_9687
+
+    def flip(self, value, *bits):
+        for bit in bits:
+            value ^= 1 << bit
+        return value
+
+    def test_hash_helpers(self):
+        self.assertEqual(to_unsigned(to_signed(self.HASH)), self.HASH)
+        self.assertLess(to_signed(self.HASH), 0)
+        self.assertEqual(bands(self.HASH), [0x9687, 0xB4A5, 0xD2C3, 0xF0E1])
+        self.assertEqual(hamming(self.HASH, self.flip(self.HASH, 0, 63)), 2)
+
+    def test_exact_match(self):
+        fern = PlantIdentification.objects.remember(self.HASH, 'Fern')
+        self.assertEqual(PlantIdentification.objects.nearest(self.HASH, 3), fern)
+
+    def test_near_match_within_max_distance(self):
+        fern = PlantIdentification.objects.remember(self.HASH, 'Fern')
+        # Three flipped bits in three different bands still share the fourth band
+        self.assertEqual(PlantIdentification.objects.nearest(self.flip(self.HASH, 1, 20, 40), 3), fern)
+        self.assertIsNone(PlantIdentification.objects.nearest(self.flip(self.HASH, 1, 20, 40), 2))
+        self.assertIsNone(PlantIdentification.objects.nearest(self.flip(self.HASH, 1, 2, 3, 4), 3))
+
+    def test_closest_entry_wins(self):
+        PlantIdentification.objects.remember(self.flip(self.HASH, 1, 2), 'Far')
+        close = PlantIdentification.objects.remember(self.flip(self.HASH, 5), 'Close')
+        self.assertEqual(PlantIdentification.objects.nearest(self.HASH, 3), close)
+        self.assertIsNone(PlantIdentification.objects.nearest(~self.HASH & (2 ** 64 - 1), 3))
+
+
+class SplitIntentsTests(SimpleTestCase):
+    def split(self, text):
+        return split_intents(text, settings.AGENT_FAST_ROUTE_THRESHOLD)
+
+    def test_independent_requests(self):
+        self.assertEqual(self.split("what's in my cart and where is my last order"), ['cart', 'order'])
+        self.assertEqual(self.split("how do I water my fern and what's in my cart"), ['research', 'cart'])
+
+    def test_dependent_requests_are_not_split(self):
+        self.assertEqual(self.split("Can you recommend a plant and add it to my cart"), ['recommendation'])
+
+    def test_single_intent(self):
+        self.assertLessEqual(len(self.split("What's in my cart")), 1)
+
+    def test_independent_intents(self):
+        self.assertEqual(independent_intents(['research', 'cart']), ['research', 'cart'])
+        self.assertEqual(independent_intents(['recommendation', 'cart']), ['recommendation'])
+        self.assertEqual(independent_intents(['order']), ['order'])
+
+
+class QuestionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = QuestionCache(ttl=60, max_entries=2)
+
+    def test_hit_after_normalization(self):
+        self.cache.put("How should I water ferns in winter", "Sparingly", cost_seconds=2.0)
+        self.assertEqual(self.cache.get("how should i water fern in winter?"), "Sparingly")
+        self.assertEqual(self.cache.get("User ID: 7. How should I water ferns in winter"), "Sparingly")
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertEqual(self.cache.stats()['seconds_saved'], 4.0)
+
+    def test_different_question_misses(self):
+        self.cache.put("How should I water ferns in winter", "Sparingly")
+        self.assertIsNone(self.cache.get("How should I water ferns in summer"))
+        self.assertIsNone(self.cache.get("How should I water ferns"))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (0, 2, 0.0))
+
+    def test_scopes_are_separate(self):
+        self.cache.put("How should I water ferns in winter", "Sparingly", scope="fern")
+        self.assertIsNone(self.cache.get("How should I water ferns in winter", scope="cactus"))
+        self.assertEqual(self.cache.get("How should I water ferns in winter", scope="Fern"), "Sparingly")
+
+    def test_context_dependent_and_short_questions_are_not_cached(self):
+        self.assertTrue(is_context_dependent("how often should I water it"))
+        self.cache.put("how often should I water it", "Weekly")
+        self.cache.put("water fern", "Weekly")
+        self.assertEqual(self.cache.stats()['entries'], 0)
+        self.assertIsNone(self.cache.get("how often should I water it"))
+
+    def test_expiry_and_eviction(self):
+        self.cache.put("How should I water ferns in winter", "Sparingly")
+        with mock.patch('agent.langgraph.research_cache.time.time', return_value=10 ** 12):
+            self.assertIsNone(self.cache.get("How should I water ferns in winter"))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+        self.cache.put("How should I water ferns in winter", "Sparingly")
+        self.cache.put("How should I repot cactus in spring", "Carefully")
+        self.cache.get("How should I water ferns in winter")
+        self.cache.put("Which soil suits orchids best", "Bark")
+        self.assertIsNone(self.cache.get("How should I repot cactus in spring"))
+        self.assertEqual(self.cache.get("How should I water ferns in winter"), "Sparingly")
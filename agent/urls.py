@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import ask_agent, clear_chat, get_chat_history, stt, tts, greet_agent, handle_variation_selection
+from .views import ask_agent, ask_agent_stream, clear_chat, get_chat_history, stt, tts, greet_agent, handle_variation_selection
 
 urlpatterns = [
     path('ask/', ask_agent, name='ask-agent'),
+    path('ask/stream/', ask_agent_stream, name='ask-agent-stream'),
     path('clear_chat/', clear_chat, name='clear_chat'),
     path('get_chat_history/', get_chat_history, name='get_chat_history'),
     path('stt/', stt, name='stt'),
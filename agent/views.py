@@ -1,22 +1,38 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from .models import ChatMessage, ChatImage
-from .langgraph.agent import run_supervisor_agent, clear_user_memory
-import json, os
+from .ratelimit import RateLimitExceeded, client_key, limit_request
+from .langgraph.agent import run_supervisor_agent, astream_supervisor_agent, run_blocking, clear_user_memory, has_thread
+import json, math, os
 from django.views.decorators.http import require_POST
 import logging
 from elevenlabs.client import ElevenLabs
 from dotenv import load_dotenv
-from django.core.cache import cache
 from langchain_core.messages import HumanMessage, AIMessage
 from django.utils import timezone
+from django.conf import settings
 load_dotenv()
 elevenlabs = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
 
 # Create your views here.
 
+def _recent_history(user, limit=None):
+    """
+    Load the last `limit` chat messages of a user as LangChain messages (oldest first).
+    Used only to rebuild a conversation thread the checkpointer no longer has.
+    """
+    limit = limit or settings.AGENT_HISTORY_WINDOW
+    recent = ChatMessage.objects.filter(user=user).order_by("-timestamp").only("role", "message")[:limit]
+    history = []
+    for msg in reversed(recent):
+        if msg.role == "user":
+            history.append(HumanMessage(content=msg.message))
+        else:
+            history.append(AIMessage(content=msg.message))
+    return history
+
 @login_required(login_url='login')
 def chat_interface(request):
     name = request.user.full_name
@@ -59,6 +75,87 @@ def get_chat_history(request):
         "user_name": request.user.full_name()  # Add user name to response
     })
 
+def _retry_text(seconds):
+    if seconds < 60:
+        return f"{seconds} seconds"
+    minutes = math.ceil(seconds / 60)
+    return "1 minute" if minutes == 1 else f"{minutes} minutes"
+
+def _rate_limit_reply(e):
+    return f"You are sending messages too quickly. Please try again in {_retry_text(e.retry_after)}."
+
+def _too_many_requests(e):
+    response = JsonResponse({"error": _rate_limit_reply(e)}, status=429)
+    response["Retry-After"] = str(e.retry_after)
+    return response
+
+def _parse_ask_request(request):
+    """
+    Read message, image, resume_data and save_only from a multipart or JSON ask request.
+    Returns (fields, error) where error is a (payload, status) pair.
+    """
+    resume_data = None
+    message = ""
+    image = None
+    save_only = False
+    content_type = request.content_type or ''
+    if content_type.startswith('multipart/form-data'):
+        message = request.POST.get("message", "")
+        image = request.FILES.get("image")
+        # Validate image type/size if present
+        if image:
+            if not image.content_type.startswith('image/'):
+                return None, ({"error": "Invalid file type. Only images are allowed."}, 400)
+            if image.size > 5 * 1024 * 1024:
+                return None, ({"error": "Image file too large (max 5MB)."}, 400)
+        if 'resume_data' in request.FILES:
+            resume_data = json.loads(request.FILES['resume_data'].read().decode())
+        elif 'resume_data' in request.POST:
+            resume_data = json.loads(request.POST['resume_data'])
+        save_only = request.POST.get('save_only', 'false') == 'true'
+    elif content_type == 'application/json':
+        data = json.loads(request.body)
+        message = data.get("message", "")
+        resume_data = data.get('resume_data')
+        save_only = data.get('save_only', False)
+    else:
+        return None, ({"error": "Unsupported content type."}, 400)
+    return {"message": message, "image": image, "resume_data": resume_data, "save_only": save_only}, None
+
+def _turn_llm_calls(image_uploaded=False) -> int:
+    """Estimated OpenAI calls of one chat turn (routing, agent steps, plant identification)"""
+    return settings.AGENT_TURN_LLM_CALLS + (1 if image_uploaded else 0)
+
+def _start_turn(user, fields):
+    """
+    Handle the parts of an ask request that come before the graph runs.
+    Returns (reply, history): reply is a final payload when the graph must not run.
+    """
+    # Save only mode (for agent messages)
+    if fields["save_only"]:
+        ChatMessage.objects.create(user=user, role="agent", message=fields["message"])
+        return {"response": fields["message"], "interrupt": False, "saved_only": True}, None
+    # New messages count as "ask", resumed variation selections as "variation_selection"
+    try:
+        limit_request(
+            f"user:{user.id}", "ask" if fields["resume_data"] is None else "variation_selection",
+            "openai", calls=_turn_llm_calls(fields["image"] is not None),
+        )
+    except RateLimitExceeded as e:
+        return {"response": _rate_limit_reply(e), "interrupt": False}, None
+    # The checkpointer keeps the conversation, so only the new turn is sent.
+    # A cold thread (expired or cleared) is rebuilt from the most recent messages.
+    history = None
+    if fields["resume_data"] is None and not has_thread(user.id):
+        history = _recent_history(user)
+    return None, history
+
+def _finish_turn(user, message, result):
+    """Store the turn in the chat history"""
+    ChatMessage.objects.create(user=user, role="user", message=message)
+    if not result.get("interrupt", False):
+        ChatMessage.objects.create(user=user, role="agent", message=result["response"])
+
 @csrf_exempt
 @login_required(login_url='login')
 def ask_agent(request):
@@ -66,91 +163,81 @@ def ask_agent(request):
         return JsonResponse({"error": "Invalid request method."}, status=405)
 
     try:
-        # Unified input parsing
-        resume_data = None
-        message = ""
-        image = None
-        save_only = False
-        data = None
-        content_type = request.content_type or ''
-        if content_type.startswith('multipart/form-data'):
-            message = request.POST.get("message", "")
-            image = request.FILES.get("image")
-            # Validate image type/size if present
-            if image:
-                if not image.content_type.startswith('image/'):
-                    return JsonResponse({"error": "Invalid file type. Only images are allowed."}, status=400)
-                if image.size > 5 * 1024 * 1024:
-                    return JsonResponse({"error": "Image file too large (max 5MB)."}, status=400)
-            if 'resume_data' in request.FILES:
-                resume_data = json.loads(request.FILES['resume_data'].read().decode())
-            elif 'resume_data' in request.POST:
-                resume_data = json.loads(request.POST['resume_data'])
-            save_only = request.POST.get('save_only', 'false') == 'true'
-        elif content_type == 'application/json':
-            data = json.loads(request.body)
-            message = data.get("message", "")
-            resume_data = data.get('resume_data')
-            save_only = data.get('save_only', False)
-        else:
-            return JsonResponse({"error": "Unsupported content type."}, status=400)
+        fields, error = _parse_ask_request(request)
+        if error:
+            return JsonResponse(error[0], status=error[1])
 
-        user_id = request.user.id
-        limit_key = f"chat_limit_user_{user_id}"
-        block_key = f"chat_blocked_{user_id}"
-        # Check if user is already blocked
-        if cache.get(block_key):
-            return JsonResponse({"response": "You have reached the maximum of 10 messages and are now blocked from chatting."})
-        # Get and check current count
-        message_count = cache.get(limit_key, 0)
-        if message_count >= 10:
-            cache.set(block_key, True, None)  # Block permanently until reset
-            return JsonResponse({"response": "You have reached the maximum of 10 messages and are now blocked from chatting."})
+        reply, history = _start_turn(request.user, fields)
+        if reply is not None:
+            return JsonResponse(reply)
 
-        # Save only mode (for agent messages)
-        if save_only:
-            ChatMessage.objects.create(user=request.user, role="agent", message=message)
-            return JsonResponse({"response": message, "interrupt": False, "saved_only": True})
-
-        # Fetch full conversation history for context
-        chat_history_qs = ChatMessage.objects.filter(user=request.user).order_by("timestamp")
-        messages = []
-        for msg in chat_history_qs:
-            if msg.role == "user":
-                messages.append(HumanMessage(content=msg.message))
-            else:
-                messages.append(AIMessage(content=msg.message))
-        # Add the new user message to the context
-        messages.append(HumanMessage(content=message))
-
-        # Run agent logic with full context
-        if resume_data is not None:
-            result = run_supervisor_agent(user_id, message, thread_id=None, resume_data=resume_data, messages=messages)
-        elif image:
-            result = run_supervisor_agent(user_id, message, thread_id=None, image_file=image, messages=messages)
-        else:
-            result = run_supervisor_agent(user_id, message, thread_id=None, messages=messages)
+        # Run agent logic
+        message = fields["message"]
+        result = run_supervisor_agent(
+            request.user.id, message, thread_id=None, image_file=fields["image"],
+            resume_data=fields["resume_data"], history=history,
+        )
+        _finish_turn(request.user, message, result)
 
         # Handle interrupt response
         if result.get("interrupt", False):
-            ChatMessage.objects.create(user=request.user, role="user", message=message)
             return JsonResponse({
                 "interrupt": True,
                 "interrupt_data": result["interrupt_data"],
                 "response": result["response"]
             })
-        else:
-            reply = result["response"]
-            ChatMessage.objects.create(user=request.user, role="user", message=message)
-            ChatMessage.objects.create(user=request.user, role="agent", message=reply)
-            if message:
-                cache.set(limit_key, message_count + 1, None)
-            return JsonResponse({"response": reply, "interrupt": False})
+        return JsonResponse({"response": result["response"], "interrupt": False})
 
     except Exception as e:
         logging.exception("Error in ask_agent")
         return JsonResponse({"response": f"Sorry, there was an error: {str(e)}", "interrupt": False}, status=500)
 
+def _sse(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+async def ask_agent_stream(request):
+    """
+    Streaming variant of ask_agent, meant to be served over ASGI (plantae/asgi.py).
+    Takes the same input and answers with Server-Sent Events: node progress and answer
+    tokens while the graph runs, then a "done" event with the payload ask_agent returns.
+    Blocking work runs on the agent's bounded thread pool, never on the event loop.
+    """
+    # login_required/csrf_exempt are sync-only in Django 4.2; CSRF is checked by the middleware
+    if request.method != 'POST':
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+    user = await run_blocking(lambda: request.user if request.user.is_authenticated else None)
+    if user is None:
+        return JsonResponse({"error": "Authentication required."}, status=401)
+    try:
+        fields, error = _parse_ask_request(request)
+    except ValueError:
+        return JsonResponse({"error": "Invalid request body."}, status=400)
+    if error:
+        return JsonResponse(error[0], status=error[1])
+
+    async def events():
+        try:
+            reply, history = await run_blocking(_start_turn, user, fields)
+            if reply is not None:
+                yield _sse({"type": "done", **reply})
+                return
+            message = fields["message"]
+            async for event in astream_supervisor_agent(
+                user.id, message, thread_id=None, image_file=fields["image"],
+                resume_data=fields["resume_data"], history=history,
+            ):
+                if event["type"] == "done":
+                    await run_blocking(_finish_turn, user, message, event)
+                yield _sse(event)
+        except Exception as e:
+            logging.exception("Error in ask_agent_stream")
+            yield _sse({"type": "done", "response": f"Sorry, there was an error: {str(e)}", "interrupt": False})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # let nginx pass events through unbuffered
+    return response
+
 @csrf_exempt
 @require_POST
 @login_required(login_url='login')
@@ -159,6 +246,10 @@ def handle_variation_selection(request):
     Handle variation selection from frontend and resume the agent execution.
     """
     try:
+        try:
+            limit_request(client_key(request), "variation_selection", "openai", calls=_turn_llm_calls())
+        except RateLimitExceeded as e:
+            return JsonResponse({"response": _rate_limit_reply(e), "interrupt": False})
         data = json.loads(request.body)
         user_id = request.user.id
         selected_variations = data.get("variations", {})
@@ -222,6 +313,10 @@ def stt(request):
     audio_file = request.FILES.get("audio")
     if not audio_file:
         return JsonResponse({"error": "No audio file provided"}, status=400)
+    try:
+        limit_request(client_key(request), "stt", "elevenlabs")
+    except RateLimitExceeded as e:
+        return _too_many_requests(e)
     
     try:
         transcription = elevenlabs.speech_to_text.convert(
@@ -243,6 +338,10 @@ def tts(request):
     text = request.POST.get("text")
     if not text:
         return JsonResponse({"error": "No text provided"}, status=400)
+    try:
+        limit_request(client_key(request), "tts", "elevenlabs")
+    except RateLimitExceeded as e:
+        return _too_many_requests(e)
     try:
         audio = elevenlabs.text_to_speech.convert(
             text=text,
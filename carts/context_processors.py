@@ -1,20 +1,7 @@
-from .models import Cart, CartItem
-from carts.views import _cart_id
+from plantae.navigation import navigation
 
 def counter(request):
-    cart_count = 0
     if 'admin' in request.path:
-        return()
-    else:
-        try:
-            cart = Cart.objects.filter(cart_id=_cart_id(request))
-            if request.user.is_authenticated:
-                cart_items = CartItem.objects.all().filter(user=request.user)
-            else:
-                cart_items = CartItem.objects.all().filter(cart=cart[:1])
-            for cart_item in cart_items:
-                cart_count += cart_item.quantity
-        except Cart.DoesNotExist:
-            cart_count = 0
-    
-    return dict(cart_count=cart_count)
\ No newline at end of file
+        return {}
+    # One cached Sum per user/session cart, never creates a session (plantae/navigation.py)
+    return dict(cart_count=navigation(request)['cart_count'])
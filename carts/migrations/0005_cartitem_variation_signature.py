@@ -0,0 +1,63 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:16
+
+import hashlib
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def _signature(variation_ids):
+    # Same hash as carts.signatures.signature_of, frozen for this migration
+    return hashlib.sha1(",".join(map(str, sorted(set(variation_ids)))).encode()).hexdigest()
+
+
+def _rebuild_signatures(model, owner):
+    """Store every line's signature and merge lines that turn out to be duplicates (same owner, product and signature)"""
+    rows = list(model.objects.order_by('id'))
+    through = model.variation.through
+    line_column = through._meta.get_field(model._meta.model_name).attname
+    variations = defaultdict(list)
+    for line_id, variation_id in through.objects.values_list(line_column, 'variation_id'):
+        variations[line_id].append(variation_id)
+    kept, duplicates = {}, []
+    for line in rows:
+        line.variation_signature = _signature(variations.get(line.id, ()))
+        key = (owner(line), line.product_id, line.variation_signature)
+        if key in kept:
+            kept[key].quantity += line.quantity
+            duplicates.append(line.id)
+        else:
+            kept[key] = line
+    model.objects.bulk_update(list(kept.values()), ['variation_signature', 'quantity'], batch_size=500)
+    if duplicates:
+        model.objects.filter(id__in=duplicates).delete()
+
+
+def backfill_signatures(apps, schema_editor):
+    CartItem = apps.get_model("carts", "CartItem")
+    # Lines of a user's cart are unique per user, the others per session cart
+    _rebuild_signatures(CartItem, owner=lambda line: ('user', line.user_id) if line.user_id else ('cart', line.cart_id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0004_rename_variations_cartitem_variation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='variation_signature',
+            field=models.CharField(default='da39a3ee5e6b4b0d3255bfef95601890afd80709', editable=False, max_length=40),
+        ),
+        migrations.RunPython(backfill_signatures, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'product', 'variation_signature'), name='carts_cartitem_user_line'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('cart__isnull', False), ('user__isnull', True)), fields=('cart', 'product', 'variation_signature'), name='carts_cartitem_cart_line'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from store.models import Product, Variation
 from accounts.models import Account
+from .signatures import EMPTY_SIGNATURE
 
 # Create your models here.
 class Cart(models.Model):
@@ -17,6 +18,23 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, models.CASCADE, null=True)
     quantity = models.IntegerField()
     is_active = models.BooleanField(default = True)
+    # Hash of the sorted variation ids (see carts/signatures.py)
+    variation_signature = models.CharField(max_length=40, default=EMPTY_SIGNATURE, editable=False)
+
+    class Meta:
+        constraints = [
+            # One line per product and variations in a user's cart, or in an anonymous session cart
+            models.UniqueConstraint(
+                fields=['user', 'product', 'variation_signature'],
+                condition=models.Q(user__isnull=False),
+                name='carts_cartitem_user_line',
+            ),
+            models.UniqueConstraint(
+                fields=['cart', 'product', 'variation_signature'],
+                condition=models.Q(user__isnull=True, cart__isnull=False),
+                name='carts_cartitem_cart_line',
+            ),
+        ]
 
     def sub_total(self):
         return self.product.price * self.quantity
@@ -0,0 +1,75 @@
+"""
+Cart pricing shared by the cart, checkout, payments and place_order views.
+
+`price_cart` loads a cart's lines with their product (and its category, for
+`get_url`) and a prefetch of their variations, then totals them in the
+database with `Sum(F('quantity') * F('product__price'))`, all in Decimal.
+The totals are cached under the cart's version, a hash of its lines'
+ids, quantities and prices. Any change to the cart or to a price gives a new
+version, so the cache needs no invalidation and every view charges exactly
+the numbers the cart page showed.
+"""
+import hashlib
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+from plantae.cache import Namespace
+from .services import owner_lines
+
+cart_cache = Namespace('cart')
+
+TAX_PERCENT = Decimal(18)
+TOTALS_TIMEOUT = 60 * 60
+CENT = Decimal('0.01')
+
+CartPricing = namedtuple('CartPricing', ['lines', 'quantity', 'total', 'tax', 'grand_total', 'version'])
+EMPTY_CART = CartPricing([], 0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00'), '')
+
+
+def _money(value) -> Decimal:
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def cart_version(lines) -> str:
+    rows = sorted((line.id, line.quantity, line.product_id, str(line.product.price)) for line in lines)
+    return hashlib.sha1(repr(rows).encode()).hexdigest()
+
+
+def _totals(lines):
+    totals = lines.aggregate(
+        units=Coalesce(Sum('quantity'), 0),
+        amount=Coalesce(
+            Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Decimal(0), output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+    total = _money(totals['amount'])
+    tax = _money(total * TAX_PERCENT / 100)
+    return totals['units'], total, tax, total + tax
+
+
+def price_cart(user=None, cart=None) -> CartPricing:
+    """Active lines and totals of a user's cart, or of an anonymous session `cart` (EMPTY_CART for none)"""
+    if user is None and cart is None:
+        return EMPTY_CART
+    active = owner_lines(user, cart).filter(is_active=True)
+    lines = list(active.select_related('product__category').prefetch_related('variation').order_by('id'))
+    if not lines:
+        return EMPTY_CART
+    version = cart_version(lines)
+    key = f"totals:{version}"
+    totals = cart_cache.get(key)
+    if totals is None:
+        totals = _totals(active)
+        if totals[0] == sum(line.quantity for line in lines):
+            cart_cache.set(key, totals, TOTALS_TIMEOUT)
+        else:
+            # The cart changed between the two queries, price the lines that were loaded
+            total = _money(sum(line.sub_total() for line in lines))
+            tax = _money(total * TAX_PERCENT / 100)
+            totals = (sum(line.quantity for line in lines), total, tax, total + tax)
+    quantity, total, tax, grand_total = totals
+    return CartPricing(lines, quantity, total, tax, grand_total, version)
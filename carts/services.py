@@ -0,0 +1,203 @@
+"""
+Cart operations shared by the cart views, login and the agent tools.
+
+A cart belongs to a user, or to an anonymous session `Cart` when there is no
+user. Its lines are identified by product and variation signature (see
+carts/signatures.py), which the unique constraints on CartItem enforce.
+
+Every operation runs in one transaction that first locks the owner row
+(`select_for_update` on the Account or Cart), so concurrent requests on the
+same cart queue instead of losing increments or creating duplicate lines.
+Lines are then read once, and written with `bulk_update`, `bulk_create` and
+queryset deletes, so an operation takes the same number of queries however
+many lines it touches. The cached cart counter is dropped on commit.
+"""
+from functools import lru_cache
+
+from django.db import transaction
+
+from accounts.models import Account
+from plantae.navigation import invalidate_cart_counts_on_commit
+from store.models import Variation
+from .models import Cart, CartItem
+from .signatures import signature_of
+
+
+def owner_lines(user=None, cart=None):
+    """Lines of a user's cart, or of an anonymous session cart"""
+    if user is not None:
+        return CartItem.objects.filter(user=user)
+    return CartItem.objects.filter(cart=cart, user__isnull=True)
+
+
+@lru_cache(maxsize=1024)
+def session_key_of(cart_id):
+    """Session key of a Cart row (never changes, so it is cached for the process)"""
+    return Cart.objects.filter(pk=cart_id).values_list('cart_id', flat=True).first()
+
+
+def _lock_owner(user=None, cart=None):
+    if user is not None:
+        list(Account.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+    else:
+        list(Cart.objects.select_for_update().filter(pk=cart.pk).values_list('pk', flat=True))
+
+
+def _changed(user=None, cart=None):
+    # Bulk writes send no post_save/post_delete, drop the cached cart counter here
+    user_id = user.pk if user is not None else None
+    session_key = cart.cart_id if cart is not None else None
+    invalidate_cart_counts_on_commit(user_id, session_key)
+
+
+def _variation_ids(variations) -> list:
+    return sorted({int(getattr(variation, 'pk', variation)) for variation in variations})
+
+
+def _delete_lines(line_ids):
+    if line_ids:
+        CartItem.objects.filter(pk__in=line_ids).delete()
+
+
+def session_cart(request, create=True):
+    """The anonymous Cart of the request's session (created with the session when missing and `create`)"""
+    session_key = request.session.session_key
+    if not session_key:
+        if not create:
+            return None
+        request.session.create()
+        session_key = request.session.session_key
+    cart = Cart.objects.filter(cart_id=session_key).first()
+    if cart is None and create:
+        cart = Cart.objects.create(cart_id=session_key)
+    return cart
+
+
+def variations_for(product_id, choices) -> list:
+    """Ids of a product's variations matching {variation category: value} choices (case-insensitive), in one query"""
+    wanted = {(str(key).lower(), str(value).lower()) for key, value in choices.items()}
+    return [
+        variation_id
+        for variation_id, category, value in Variation.objects.filter(product_id=product_id).values_list('id', 'variation_category', 'variation_value')
+        if (category.lower(), value.lower()) in wanted
+    ]
+
+
+def add_items(items, user=None, cart=None) -> int:
+    """
+    Add (product_id, variations, quantity) items to the user's cart, or to the session `cart` when
+    there is no user. Variations are Variation instances or ids. Returns the number of new lines.
+    """
+    wanted = {}
+    for product_id, variations, quantity in items:
+        variation_ids = _variation_ids(variations)
+        entry = wanted.setdefault((int(product_id), signature_of(variation_ids)), [variation_ids, 0])
+        entry[1] += quantity
+    if not wanted:
+        return 0
+    with transaction.atomic():
+        _lock_owner(user, cart)
+        existing = {
+            (line.product_id, line.variation_signature): line
+            for line in owner_lines(user, cart).select_for_update().filter(
+                product_id__in={product_id for product_id, _ in wanted},
+                variation_signature__in={signature for _, signature in wanted},
+            )
+        }
+        updated, created = [], []
+        for (product_id, signature), (variation_ids, quantity) in wanted.items():
+            line = existing.get((product_id, signature))
+            if line is not None:
+                line.quantity += quantity
+                updated.append(line)
+            else:
+                created.append((CartItem(
+                    product_id=product_id,
+                    quantity=quantity,
+                    user=user,
+                    cart=None if user is not None else cart,
+                    variation_signature=signature,
+                ), variation_ids))
+        if updated:
+            CartItem.objects.bulk_update(updated, ['quantity'])
+        if created:
+            CartItem.objects.bulk_create([line for line, _ in created])
+            through = CartItem.variation.through
+            through.objects.bulk_create([
+                through(cartitem_id=line.id, variation_id=variation_id)
+                for line, variation_ids in created for variation_id in variation_ids
+            ])
+        _changed(user, cart)
+    return len(created)
+
+
+def add_item(product_id, variations=(), quantity=1, user=None, cart=None) -> bool:
+    """Add one product to the cart (see add_items). Returns True when a new line was created."""
+    return add_items([(product_id, variations, quantity)], user=user, cart=cart) > 0
+
+
+def set_quantity(line_id, quantity, user=None, cart=None):
+    """
+    Set the quantity of one of the cart's lines, removing it at 0. `quantity` can be a function of the
+    current quantity. Returns the new quantity, or None when the cart has no such line.
+    """
+    with transaction.atomic():
+        _lock_owner(user, cart)
+        line = owner_lines(user, cart).select_for_update().filter(pk=line_id).first()
+        if line is None:
+            return None
+        new_quantity = max(quantity(line.quantity) if callable(quantity) else quantity, 0)
+        if new_quantity:
+            owner_lines(user, cart).filter(pk=line_id).update(quantity=new_quantity)
+        else:
+            _delete_lines([line_id])
+        _changed(user, cart)
+    return new_quantity
+
+
+def remove_items(matcher, user=None, cart=None) -> list:
+    """Remove the cart's lines matching `matcher` (a Q object); returns the removed lines' product names"""
+    with transaction.atomic():
+        _lock_owner(user, cart)
+        matched = list(
+            owner_lines(user, cart).filter(matcher).select_for_update(of=('self',))
+            .values_list('id', 'product__product_name')
+        )
+        _delete_lines([line_id for line_id, _ in matched])
+        if matched:
+            _changed(user, cart)
+    return [name for _, name in matched]
+
+
+def merge_session_cart(cart, user) -> int:
+    """
+    Move the anonymous `cart`'s lines to the user's cart. Lines the user already has (same product and
+    variations) get the quantities added up. Returns the number of lines merged or moved.
+    """
+    with transaction.atomic():
+        _lock_owner(user=user)
+        _lock_owner(cart=cart)
+        incoming = list(owner_lines(cart=cart).select_for_update())
+        if not incoming:
+            return 0
+        existing = {
+            (line.product_id, line.variation_signature): line
+            for line in owner_lines(user=user).select_for_update().filter(
+                product_id__in={line.product_id for line in incoming},
+                variation_signature__in={line.variation_signature for line in incoming},
+            )
+        }
+        changed, merged = [], []
+        for line in incoming:
+            target = existing.get((line.product_id, line.variation_signature))
+            if target is not None:
+                target.quantity += line.quantity
+                changed.append(target)
+                merged.append(line.id)
+            else:
+                line.user = user
+                changed.append(line)
+        CartItem.objects.bulk_update(changed, ['quantity', 'user'])
+        _delete_lines(merged)
+        _changed(user, cart)
+    return len(incoming)
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from plantae.navigation import invalidate_cart_counts_on_commit
+from .models import CartItem
+from .services import session_key_of
+from .signatures import variations_changed
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    session_key = session_key_of(instance.cart_id) if instance.cart_id else None
+    # After commit, so the new cart version is only visible once the change is (see plantae/navigation.py)
+    invalidate_cart_counts_on_commit(instance.user_id, session_key)
+
+
+m2m_changed.connect(variations_changed, sender=CartItem.variation.through, dispatch_uid='cartitem_variations_changed')
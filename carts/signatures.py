@@ -0,0 +1,53 @@
+"""
+Variation signatures of cart and order lines.
+
+A line's signature is a hash of its sorted variation ids, stored on the line
+(`variation_signature`) so "the same product with the same variations" is an
+indexed equality instead of comparing `variation.all()` of every line. The
+unique constraints on CartItem and OrderProduct make (owner, product,
+signature) identify one line.
+"""
+import hashlib
+from collections import defaultdict
+
+
+def signature_of(variations) -> str:
+    """Signature of a set of Variation instances or ids (order and duplicates do not matter)"""
+    ids = sorted({int(getattr(variation, 'pk', variation)) for variation in variations})
+    return hashlib.sha1(",".join(map(str, ids)).encode()).hexdigest()
+
+
+EMPTY_SIGNATURE = signature_of(())
+
+
+def line_variation_ids(model, line_ids) -> dict:
+    """{line id: [variation ids]} of CartItem/OrderProduct lines, in one query on the through table"""
+    through = model.variation.through
+    line_column = through._meta.get_field(model._meta.model_name).attname
+    variations = defaultdict(list)
+    for line_id, variation_id in through.objects.filter(**{f'{line_column}__in': line_ids}).values_list(line_column, 'variation_id'):
+        variations[line_id].append(variation_id)
+    return variations
+
+
+def refresh_signatures(model, line_ids):
+    """Store the current signature of `model` lines whose variations were edited directly (e.g. in the admin)"""
+    variations = line_variation_ids(model, line_ids)
+    signatures = {line_id: signature_of(variations.get(line_id, ())) for line_id in line_ids}
+    for line_id, signature in signatures.items():
+        model.objects.filter(pk=line_id).update(variation_signature=signature)
+    return signatures
+
+
+def variations_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """m2m_changed receiver for the `variation` field of CartItem and OrderProduct"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Edited from the Variation side; a clear does not say which lines it touched
+        if pk_set:
+            refresh_signatures(model, list(pk_set))
+    else:
+        # Also on the instance, so a later save() does not write the old signature back
+        instance.variation_signature = refresh_signatures(type(instance), [instance.pk])[instance.pk]
+
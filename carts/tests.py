@@ -1,3 +1,171 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import Account
+from category.models import Category
+from store.models import Product, Variation
+from . import services
+from .models import Cart, CartItem
+from .pricing import EMPTY_CART, price_cart
+from .signatures import EMPTY_SIGNATURE, signature_of
+
+
+class CartTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user('Ann', 'Lee', 'ann', 'ann@example.com', 'pw12345', '1234567890')
+        category = Category.objects.create(category_name='Plants', slug='plants')
+        cls.fern = Product.objects.create(
+            product_name='Fern', slug='fern', description='A fern', price=Decimal('10.00'), stock=10, category=category,
+        )
+        cls.cactus = Product.objects.create(
+            product_name='Cactus', slug='cactus', description='A cactus', price=Decimal('4.50'), stock=10, category=category,
+        )
+        cls.red = Variation.objects.create(product=cls.fern, variation_category='color', variation_value='Red')
+        cls.small = Variation.objects.create(product=cls.fern, variation_category='size', variation_value='Small')
+
+    def lines(self, **owner):
+        return list(services.owner_lines(**owner).order_by('id'))
+
+
+class VariationSignatureTests(CartTestCase):
+    def test_signature_ignores_order_duplicates_and_ids_vs_instances(self):
+        self.assertEqual(signature_of([self.red, self.small]), signature_of([self.small.id, self.red, self.small]))
+        self.assertNotEqual(signature_of([self.red]), signature_of([self.red, self.small]))
+        self.assertEqual(signature_of([]), EMPTY_SIGNATURE)
+
+    def test_line_is_unique_per_owner_and_signature(self):
+        CartItem.objects.create(product=self.cactus, user=self.user, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(product=self.cactus, user=self.user, quantity=1, variation_signature=EMPTY_SIGNATURE)
+        # Other variations or another owner are other lines
+        CartItem.objects.create(product=self.fern, user=self.user, quantity=1, variation_signature=signature_of([self.red]))
+        CartItem.objects.create(product=self.fern, user=self.user, quantity=1)
+        cart = Cart.objects.create(cart_id='session-a')
+        CartItem.objects.create(product=self.cactus, cart=cart, quantity=1)
+
+    def test_editing_variations_refreshes_the_signature(self):
+        item = CartItem.objects.create(product=self.fern, user=self.user, quantity=1)
+        item.variation.add(self.red, self.small)
+        item.refresh_from_db()
+        self.assertEqual(item.variation_signature, signature_of([self.red, self.small]))
+        item.variation.remove(self.small)
+        item.refresh_from_db()
+        self.assertEqual(item.variation_signature, signature_of([self.red]))
+        item.variation.clear()
+        item.refresh_from_db()
+        self.assertEqual(item.variation_signature, EMPTY_SIGNATURE)
+
+
+class CartServiceTests(CartTestCase):
+    def test_same_product_and_variations_add_up_on_one_line(self):
+        self.assertTrue(services.add_item(self.fern.id, [self.red, self.small], 1, user=self.user))
+        # Order and ids vs instances do not matter
+        self.assertFalse(services.add_item(self.fern.id, [self.small.id, self.red], 2, user=self.user))
+        lines = self.lines(user=self.user)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0].quantity, 3)
+        self.assertEqual(lines[0].variation_signature, signature_of([self.red, self.small]))
+        self.assertEqual(set(lines[0].variation.values_list('id', flat=True)), {self.red.id, self.small.id})
+
+    def test_different_variations_are_separate_lines(self):
+        services.add_item(self.fern.id, [self.red], user=self.user)
+        services.add_item(self.fern.id, [], user=self.user)
+        signatures = {line.variation_signature for line in self.lines(user=self.user)}
+        self.assertEqual(signatures, {signature_of([self.red]), EMPTY_SIGNATURE})
+
+    def test_add_items_counts_new_lines(self):
+        created = services.add_items([
+            (self.fern.id, [self.red], 1),
+            (self.fern.id, [self.red], 1),
+            (self.cactus.id, [], 2),
+        ], user=self.user)
+        self.assertEqual(created, 2)
+        self.assertEqual(
+            [(line.product_id, line.quantity) for line in self.lines(user=self.user)],
+            [(self.fern.id, 2), (self.cactus.id, 2)],
+        )
+
+    def test_set_quantity_removes_line_at_zero(self):
+        services.add_item(self.cactus.id, quantity=2, user=self.user)
+        line = self.lines(user=self.user)[0]
+        self.assertEqual(services.set_quantity(line.id, lambda quantity: quantity - 1, user=self.user), 1)
+        self.assertEqual(services.set_quantity(line.id, 0, user=self.user), 0)
+        self.assertEqual(self.lines(user=self.user), [])
+        self.assertIsNone(services.set_quantity(line.id, 1, user=self.user))
+
+    def test_remove_items_returns_product_names(self):
+        services.add_items([(self.fern.id, [self.red], 1), (self.cactus.id, [], 1)], user=self.user)
+        self.assertEqual(services.remove_items(Q(product=self.cactus), user=self.user), ['Cactus'])
+        self.assertEqual([line.product_id for line in self.lines(user=self.user)], [self.fern.id])
+
+    def test_session_cart_is_its_own_owner(self):
+        cart = Cart.objects.create(cart_id='session-b')
+        self.assertTrue(services.add_item(self.cactus.id, quantity=2, cart=cart))
+        self.assertTrue(services.add_item(self.cactus.id, user=self.user))
+        self.assertEqual([line.quantity for line in self.lines(cart=cart)], [2])
+        self.assertEqual([line.quantity for line in self.lines(user=self.user)], [1])
+
+
+class SessionCartMergeTests(CartTestCase):
+    def test_quantities_add_up_and_lines_move(self):
+        services.add_item(self.fern.id, [self.red], 1, user=self.user)
+        cart = Cart.objects.create(cart_id='session-b')
+        services.add_items([(self.fern.id, [self.red], 2), (self.cactus.id, [], 1)], cart=cart)
+
+        self.assertEqual(services.merge_session_cart(cart, self.user), 2)
+        self.assertEqual(
+            [(line.product_id, line.variation_signature, line.quantity) for line in self.lines(user=self.user)],
+            [(self.fern.id, signature_of([self.red]), 3), (self.cactus.id, EMPTY_SIGNATURE, 1)],
+        )
+        self.assertEqual(self.lines(cart=cart), [])
+        self.assertEqual(services.merge_session_cart(cart, self.user), 0)
+
+
+class CartPricingTests(CartTestCase):
+    def setUp(self):
+        # Priced carts are cached by content, and the cache outlives each test's rollback
+        cache.clear()
+
+    def test_empty_cart(self):
+        self.assertIs(price_cart(), EMPTY_CART)
+        self.assertIs(price_cart(user=self.user), EMPTY_CART)
+
+    def test_totals(self):
+        services.add_items([(self.fern.id, [self.red], 2), (self.cactus.id, [], 3)], user=self.user)
+        pricing = price_cart(user=self.user)
+        self.assertEqual(len(pricing.lines), 2)
+        self.assertEqual(pricing.quantity, 5)
+        self.assertEqual(pricing.total, Decimal('33.50'))
+        self.assertEqual(pricing.tax, Decimal('6.03'))
+        self.assertEqual(pricing.grand_total, Decimal('39.53'))
+
+    def test_inactive_lines_are_not_priced(self):
+        services.add_items([(self.fern.id, [], 1), (self.cactus.id, [], 1)], user=self.user)
+        CartItem.objects.filter(product=self.cactus).update(is_active=False)
+        self.assertEqual(price_cart(user=self.user).total, Decimal('10.00'))
+
+    def test_version_follows_quantities_and_prices(self):
+        services.add_item(self.cactus.id, quantity=2, user=self.user)
+        first = price_cart(user=self.user)
+        self.assertEqual(price_cart(user=self.user).version, first.version)
+
+        services.add_item(self.cactus.id, user=self.user)
+        second = price_cart(user=self.user)
+        self.assertNotEqual(second.version, first.version)
+        self.assertEqual(second.total, Decimal('13.50'))
+
+        Product.objects.filter(pk=self.cactus.pk).update(price=Decimal('5.00'))
+        third = price_cart(user=self.user)
+        self.assertNotEqual(third.version, second.version)
+        self.assertEqual(third.total, Decimal('15.00'))
+
+    def test_session_cart(self):
+        cart = Cart.objects.create(cart_id='session-c')
+        services.add_item(self.fern.id, quantity=1, cart=cart)
+        self.assertEqual(price_cart(cart=cart).total, Decimal('10.00'))
+        self.assertIs(price_cart(user=self.user), EMPTY_CART)
@@ -1,7 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Cart, CartItem
-from store.models import Product, Variation
-from django.core.exceptions import ObjectDoesNotExist
+from .services import add_item, remove_items, session_cart, set_quantity, variations_for
+from .pricing import EMPTY_CART, price_cart
+from store.models import Product
+from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 # Create your views here.
@@ -13,182 +14,51 @@ def _cart_id(request):
         cart = request.session.create()
     return cart
 
-def add_cart(request, product_id):
-    current_user = request.user
-    product = Product.objects.get(id=product_id)
-    # No legacy variation checks here
-    if current_user.is_authenticated:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item
-                value = request.POST[key]
-                try:
-                    variation = Variation.objects.get(product=product, variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except:
-                    pass
-        is_cart_item_exist = CartItem.objects.filter(product=product, user=current_user).exists()
-        if is_cart_item_exist:
-            cart_item = CartItem.objects.filter(product=product, user=current_user)
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variation.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-            if product_variation in ex_var_list:
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            else:
-                item = CartItem.objects.create(product=product, quantity=1, user=current_user)
-                if len(product_variation) > 0:
-                    item.variation.clear()
-                    item.variation.add(*product_variation)
-                item.save()
-        else:
-            cart_item = CartItem.objects.create(
-                product=product,
-                quantity=1,
-                user=current_user,
-            )
-            if len(product_variation) > 0:
-                cart_item.variation.clear()
-                cart_item.variation.add(*product_variation)
-            cart_item.save()
-        return redirect('cart')
-    else:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item
-                value = request.POST[key]
-                try:
-                    variation = Variation.objects.get(product=product, variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except:
-                    pass
-        try:
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-        except Cart.DoesNotExist:
-            cart = Cart.objects.create(cart_id=_cart_id(request))
-        cart.save()
-        is_cart_item_exist = CartItem.objects.filter(product=product, cart=cart).exists()
-        if is_cart_item_exist:
-            cart_item = CartItem.objects.filter(product=product, cart=cart)
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variation.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-            if product_variation in ex_var_list:
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            else:
-                item = CartItem.objects.create(product=product, quantity=1, cart=cart)
-                if len(product_variation) > 0:
-                    item.variation.clear()
-                    item.variation.add(*product_variation)
-                item.save()
-        else:
-            cart_item = CartItem.objects.create(
-                product=product,
-                quantity=1,
-                cart=cart,
-            )
-            if len(product_variation) > 0:
-                cart_item.variation.clear()
-                cart_item.variation.add(*product_variation)
-            cart_item.save()
-        return redirect('cart')
+def _cart_owner(request, create=True):
+    """Owner keyword arguments (user or cart) of the carts.services functions, None when there is no cart yet"""
+    if request.user.is_authenticated:
+        return {'user': request.user}
+    cart = session_cart(request, create=create)
+    return {'cart': cart} if cart is not None else None
 
+def add_cart(request, product_id):
+    product = get_object_or_404(Product, id=product_id)
+    # Variation choices are posted as {variation category: value}
+    product_variation = []
+    if request.method == 'POST':
+        product_variation = variations_for(product.id, request.POST)
+    add_item(product.id, product_variation, **_cart_owner(request))
+    return redirect('cart')
 
-def cart(request, total=0, quantity=0, cart_items=None):
-    tax = 0
-    grand_total = 0
-    try:
-        if request.user.is_authenticated:
-            cart_items = CartItem.objects.filter(user = request.user, is_active = True)
-        else:
-            cart = Cart.objects.get(cart_id = _cart_id(request))
-            cart_items = CartItem.objects.filter(cart=cart, is_active = True)
-        for cart_item in cart_items:
-            total += (cart_item.product.price * cart_item.quantity)
-            quantity += cart_item.quantity
-        tax = (18 * total)/100
-        grand_total = total + tax
-    except ObjectDoesNotExist:
-        pass
 
-    context = {
-        'total': total,
-        'quantity': quantity,
-        'cart_items': cart_items,
-        'tax': tax,
-        'grand_total': grand_total,
+def _pricing_context(pricing):
+    return {
+        'total': pricing.total,
+        'quantity': pricing.quantity,
+        'cart_items': pricing.lines,
+        'tax': pricing.tax,
+        'grand_total': pricing.grand_total,
     }
-    return render(request, 'store/cart.html', context)
 
-def remove_cart(request, product_id, cart_item_id):
-    product = get_object_or_404(Product, id=product_id)
-    try:
-        if request.user.is_authenticated:
-            cart_item = CartItem.objects.get(product=product, user=request.user, id = cart_item_id)
-        else:
-            cart = Cart.objects.get(cart_id = _cart_id(request))
-            cart_item = CartItem.objects.get(product=product, cart=cart, id = cart_item_id)
-        if cart_item.quantity > 1:
-            cart_item.quantity -= 1
-            cart_item.save()
-        else:
-            cart_item.delete()
-    except:
-        pass
+def cart(request):
+    owner = _cart_owner(request, create=False)
+    pricing = price_cart(**owner) if owner else EMPTY_CART
+    return render(request, 'store/cart.html', _pricing_context(pricing))
 
+def remove_cart(request, product_id, cart_item_id):
+    owner = _cart_owner(request, create=False)
+    if owner:
+        set_quantity(cart_item_id, lambda quantity: quantity - 1, **owner)
     return redirect('cart')
 
 def remove_cart_item(request, product_id, cart_item_id):
-    product = get_object_or_404(Product, id=product_id)
-    if request.user.is_authenticated:
-        cart_item = CartItem.objects.get(product=product, user=request.user, id = cart_item_id)
-    else:
-        cart = Cart.objects.get(cart_id = _cart_id(request))
-        cart_item = CartItem.objects.get(product=product, cart=cart, id = cart_item_id)
-    cart_item.delete()
+    owner = _cart_owner(request, create=False)
+    if owner:
+        remove_items(Q(id=cart_item_id, product_id=product_id), **owner)
     return redirect('cart')
 
 @login_required(login_url='login')
-def checkout(request, total=0, quantity=0, cart_items=None):
-    tax = 0
-    grand_total = 0
-    try:
-        if request.user.is_authenticated:
-            cart_items = CartItem.objects.filter(user = request.user, is_active = True)
-        else:
-            cart = Cart.objects.get(cart_id = _cart_id(request))
-            cart_items = CartItem.objects.filter(cart=cart, is_active = True)
-        for cart_item in cart_items:
-            total += (cart_item.product.price * cart_item.quantity)
-            quantity += cart_item.quantity
-        tax = (18 * total)/100
-        grand_total = total + tax
-    except ObjectDoesNotExist:
-        pass
-
-    context = {
-        'total': total,
-        'quantity': quantity,
-        'cart_items': cart_items,
-        'tax': tax,
-        'grand_total': grand_total,
-        'checkout_page': True,
-    }
+def checkout(request):
+    context = _pricing_context(price_cart(user=request.user))
+    context['checkout_page'] = True
     return render(request, 'store/checkout.html', context)
-
@@ -1,5 +1,5 @@
-from .models import Category
+from plantae.navigation import navigation
 
 def menu_links(request):
-    links = Category.objects.all()
-    return dict(links = links)
\ No newline at end of file
+    # Cached until a Category changes (plantae/navigation.py)
+    return dict(links = navigation(request)['links'])
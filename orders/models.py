@@ -2,6 +2,7 @@ from django.db import models
 from accounts.models import Account
 from store.models import Product, Variation
 from django.core.validators import RegexValidator
+from carts.signatures import EMPTY_SIGNATURE
 
 # Create your models here.
 class Payment(models.Model):
@@ -24,7 +25,7 @@ class Order(models.Model):
     )
     user = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True)
     payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True)
-    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
+    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     order_number = models.CharField(max_length=20)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
@@ -68,6 +69,13 @@ class OrderProduct(models.Model):
     ordered = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Hash of the sorted variation ids, copied from the cart line (see carts/signatures.py)
+    variation_signature = models.CharField(max_length=40, default=EMPTY_SIGNATURE, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product', 'variation_signature'], name='orders_orderproduct_line'),
+        ]
 
     def __str__(self):
         return self.product.product_name
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Order finalization after a successful payment.
+
+`finalize_order` turns the user's cart into the order's lines in one
+transaction and a fixed number of queries:
+- the order row is locked, so concurrent or repeated callbacks for the same
+  Razorpay order run one at a time, and a finalized order is returned as is;
+- order lines and their variation rows are inserted with `bulk_create`;
+- stock is decremented with one conditional `F('stock') - quantity` update
+  per product (stock is not part of the catalog snapshot, so no cache is
+  dropped); an oversold product is logged as a warning;
+- the cart lines are removed through carts.services.
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from carts.services import owner_lines, remove_items
+from carts.signatures import line_variation_ids
+from carts.models import CartItem
+from store.models import Product
+from store.rankings import record_sales
+from .models import Order, OrderProduct, Payment
+
+logger = logging.getLogger(__name__)
+
+
+def _decrement_stock(sold):
+    """Take {product_id: quantity} out of stock; oversold products stop at 0"""
+    # The payment is already captured, so the order goes through and the oversell is reported for follow-up
+    for product_id, quantity in sorted(sold.items()):
+        if not Product.objects.filter(pk=product_id, stock__gte=quantity).update(stock=F('stock') - quantity):
+            logger.warning("Product %s oversold: paid order of %s exceeds the remaining stock, stock set to 0", product_id, quantity)
+            Product.objects.filter(pk=product_id).update(stock=0)
+
+
+def finalize_order(user, razorpay_order_id, razorpay_payment_id):
+    """
+    Record the payment of the order `razorpay_order_id` and move the user's cart into it.
+    Returns (order, payment, finalized), where finalized is False when an earlier callback
+    already did it. Raises Order.DoesNotExist for an unknown order.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(razorpay_order_id=razorpay_order_id)
+        if order.is_ordered:
+            return order, order.payment, False
+
+        payment = Payment.objects.create(
+            user=user,
+            payment_id=razorpay_payment_id,
+            payment_method='Razorpay',
+            amount_paid=order.order_total,
+            status="Completed"
+        )
+        order.payment = payment
+        order.is_ordered = True
+        order.save(update_fields=['payment', 'is_ordered', 'updated_at'])
+
+        cart_items = list(owner_lines(user=user).select_related('product').order_by('id'))
+        variations = line_variation_ids(CartItem, [item.id for item in cart_items])
+        order_products = OrderProduct.objects.bulk_create([
+            OrderProduct(
+                order=order,
+                payment=payment,
+                user=user,
+                product_id=item.product_id,
+                quantity=item.quantity,
+                product_price=item.product.price,
+                variation_signature=item.variation_signature,
+                ordered=True,
+            )
+            for item in cart_items
+        ])
+        through = OrderProduct.variation.through
+        through.objects.bulk_create([
+            through(orderproduct_id=order_product.id, variation_id=variation_id)
+            for item, order_product in zip(cart_items, order_products)
+            for variation_id in variations.get(item.id, ())
+        ])
+
+        sold = Counter()
+        for item in cart_items:
+            sold[item.product_id] += item.quantity
+        _decrement_stock(sold)
+        # Count the sale towards the bestseller rankings
+        record_sales(sold.items())
+        remove_items(Q(pk__in=[item.id for item in cart_items]), user=user)
+    return order, payment, True
@@ -0,0 +1,6 @@
+from django.db.models.signals import m2m_changed
+from carts.signatures import variations_changed
+from .models import OrderProduct
+
+
+m2m_changed.connect(variations_changed, sender=OrderProduct.variation.through, dispatch_uid='orderproduct_variations_changed')
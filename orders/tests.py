@@ -1,3 +1,88 @@
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import Account
+from carts import services
+from carts.signatures import signature_of
+from category.models import Category
+from store.models import Product, ProductSales, Variation
+from .models import Order, OrderProduct, Payment
+from .services import finalize_order
+
+
+class FinalizeOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user('Ann', 'Lee', 'ann', 'ann@example.com', 'pw12345', '1234567890')
+        category = Category.objects.create(category_name='Plants', slug='plants')
+        cls.fern = Product.objects.create(
+            product_name='Fern', slug='fern', description='A fern', price=Decimal('10.00'), stock=5, category=category,
+        )
+        cls.cactus = Product.objects.create(
+            product_name='Cactus', slug='cactus', description='A cactus', price=Decimal('4.50'), stock=5, category=category,
+        )
+        cls.red = Variation.objects.create(product=cls.fern, variation_category='color', variation_value='Red')
+
+    def setUp(self):
+        cache.clear()
+        services.add_items([(self.fern.id, [self.red], 2), (self.cactus.id, [], 3)], user=self.user)
+        self.order = Order.objects.create(
+            user=self.user, razorpay_order_id='order_1', order_number='20261017001',
+            first_name='Ann', last_name='Lee', phone='1234567890', email='ann@example.com',
+            address_line_1='1 Leaf Lane', address_line_2='', pin_code='123456',
+            country='India', state='Kerala', city='Kochi', order_total=39.53, tax=6.03,
+        )
+
+    def test_finalizes_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order, payment, finalized = finalize_order(self.user, 'order_1', 'pay_1')
+        self.assertTrue(finalized)
+        self.assertTrue(order.is_ordered)
+        self.assertEqual(order.payment, payment)
+
+        again, same_payment, finalized = finalize_order(self.user, 'order_1', 'pay_2')
+        self.assertFalse(finalized)
+        self.assertEqual(again.pk, order.pk)
+        self.assertEqual(same_payment.pk, payment.pk)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_order_lines_are_created_once(self):
+        _, payment, _ = finalize_order(self.user, 'order_1', 'pay_1')
+        # A repeated callback leaves the order and anything added to the cart since alone
+        services.add_item(self.fern.id, quantity=1, user=self.user)
+        finalize_order(self.user, 'order_1', 'pay_1')
+
+        lines = list(OrderProduct.objects.order_by('product_id'))
+        self.assertEqual([(line.product_id, line.quantity) for line in lines], [(self.fern.id, 2), (self.cactus.id, 3)])
+        self.assertEqual(list(lines[0].variation.all()), [self.red])
+        self.assertEqual(lines[0].variation_signature, signature_of([self.red]))
+        self.assertEqual({(line.ordered, line.payment_id) for line in lines}, {(True, payment.pk)})
+
+    def test_stock_sales_and_cart(self):
+        finalize_order(self.user, 'order_1', 'pay_1')
+        finalize_order(self.user, 'order_1', 'pay_1')
+
+        self.fern.refresh_from_db()
+        self.cactus.refresh_from_db()
+        self.assertEqual((self.fern.stock, self.cactus.stock), (3, 2))
+        self.assertEqual(
+            dict(ProductSales.objects.values_list('product_id', 'quantity')),
+            {self.fern.id: 2, self.cactus.id: 3},
+        )
+        self.assertFalse(services.owner_lines(user=self.user).exists())
+
+    def test_oversold_product_stops_at_zero(self):
+        Product.objects.filter(pk=self.cactus.pk).update(stock=1)
+        # The payment is captured, so the order goes through and the oversell is logged
+        with self.assertLogs('orders.services', 'WARNING'):
+            _, _, finalized = finalize_order(self.user, 'order_1', 'pay_1')
+        self.assertTrue(finalized)
+        self.cactus.refresh_from_db()
+        self.assertEqual(self.cactus.stock, 0)
+
+    def test_unknown_order(self):
+        with self.assertRaises(Order.DoesNotExist):
+            finalize_order(self.user, 'order_missing', 'pay_1')
+        self.assertEqual(Payment.objects.count(), 0)
@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect
-from carts.models import CartItem
+from carts.pricing import price_cart
 from .forms import OrderForm
 import datetime
 from .models import Order, OrderProduct, Payment
@@ -8,7 +8,7 @@ import razorpay
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from store.models import Product
+from .services import finalize_order
 
 from django.template.loader import render_to_string
 from django.core.mail import EmailMessage
@@ -22,18 +22,10 @@ def payments(request):
     if not order_obj:
         return redirect('store')
 
-    cart_items = CartItem.objects.filter(user=current_user)
-    if not cart_items.exists():
+    pricing = price_cart(user=current_user)
+    if not pricing.lines:
         return redirect('store')
-
-    total = 0
-    quantity = 0
-    for item in cart_items:
-        total += item.product.price * item.quantity
-        quantity += item.quantity
-
-    tax = (18 * total) / 100
-    grand_total = total + tax
+    grand_total = pricing.grand_total
 
     client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
     DATA = {
@@ -51,9 +43,9 @@ def payments(request):
         'amount': int(grand_total * 100),
         'name': 'PLANTAE',
         'order': order_obj,
-        'cart_items': cart_items,
-        'total': total,
-        'tax': tax,
+        'cart_items': pricing.lines,
+        'total': pricing.total,
+        'tax': pricing.tax,
         'grand_total': grand_total,
         'checkout_page': True,
     }
@@ -61,24 +53,17 @@ def payments(request):
     return render(request, 'orders/payments.html', context)
 
 
-def place_order(request, total=0, quantity=0):
+def place_order(request):
     current_user = request.user
-    cart_items = CartItem.objects.filter(user=current_user)
+    pricing = price_cart(user=current_user)
 
-    if not cart_items.exists():
+    if not pricing.lines:
         return redirect('store')
 
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
             try:
-                for item in cart_items:
-                    total += item.product.price * item.quantity
-                    quantity += item.quantity
-
-                tax = (18 * total) / 100
-                grand_total = total + tax
-
                 order = Order()
                 order.user = current_user
                 order.first_name = form.cleaned_data['first_name']
@@ -92,8 +77,8 @@ def place_order(request, total=0, quantity=0):
                 order.state = form.cleaned_data['state']
                 order.country = form.cleaned_data['country']
                 order.order_note = form.cleaned_data['order_note']
-                order.order_total = grand_total
-                order.tax = tax
+                order.order_total = pricing.grand_total
+                order.tax = pricing.tax
                 order.ip = request.META.get('REMOTE_ADDR')
                 order.save()
 
@@ -135,44 +120,10 @@ def razorpay_callback(request):
             # Verify the payment signature
             client.utility.verify_payment_signature(params_dict)
 
-            order = Order.objects.get(razorpay_order_id=razorpay_order_id, is_ordered=False)
-            payment = Payment.objects.create(
-                user=request.user,
-                payment_id=razorpay_payment_id,
-                payment_method='Razorpay',
-                amount_paid=order.order_total,
-                status="Completed"
-            )
-            order.payment = payment
-            order.is_ordered = True
-            order.save()
-
-            # Move cart items to OrderProducts
-            cart_items = CartItem.objects.filter(user=request.user)
-            for item in cart_items:
-                orderproduct = OrderProduct()
-                orderproduct.order_id = order.id
-                orderproduct.payment = payment
-                orderproduct.user_id = request.user.id
-                orderproduct.product_id = item.product_id
-                orderproduct.quantity = item.quantity
-                orderproduct.product_price = item.product.price
-                orderproduct.ordered = True
-                orderproduct.save()
-
-                cart_item = CartItem.objects.get(id = item.id)
-                product_variation = cart_item.variation.all()
-                orderproduct = OrderProduct.objects.get(id=orderproduct.id)
-                orderproduct.variation.set(product_variation)
-                orderproduct.save()
-                
-                #Reduce quantity of sold products
-                product = Product.objects.get(id = item.product_id)
-                product.stock -= item.quantity
-                product.save()
-
-            # delete cart items
-            cart_items.delete()
+            # Idempotent: a repeated callback finds the order finalized and only redirects
+            order, payment, finalized = finalize_order(request.user, razorpay_order_id, razorpay_payment_id)
+            if not finalized:
+                return redirect('order_success', order_number=order.order_number, payment_id=payment.payment_id)
 
             #send order received email to user
             mail_subject = 'Order Confirmation - PLANTAE'
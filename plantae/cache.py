@@ -0,0 +1,131 @@
+"""
+Namespaced, versioned keys on top of the shared cache (settings.CACHES).
+
+A `Namespace` prefixes its keys with its name and stores each value together
+with the namespace version current when it was computed. Reads fetch the
+version in the same round trip as the values and treat entries of an older
+version as missing, so `invalidate()` (a new version) drops every key of the
+namespace on all workers at once, and a value computed while an invalidation
+happened is never served.
+
+`get_or_set` recomputes a missing value only once: threads of one process
+queue on a striped lock, and across processes a short-lived `cache.add` lock
+elects one worker to compute while the others wait for its result.
+"""
+import threading
+import time
+import uuid
+import zlib
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+MISSING = object()
+
+# Striped locks so concurrent recomputes of the same key in one process run once
+_local_locks = [threading.Lock() for _ in range(64)]
+
+
+def _local_lock(key: str) -> threading.Lock:
+    return _local_locks[zlib.crc32(key.encode()) % len(_local_locks)]
+
+
+def _new_version() -> str:
+    # Random, so a version key lost to eviction never brings old entries back
+    return uuid.uuid4().hex[:12]
+
+
+class Namespace:
+    LOCK_TIMEOUT = 30  # seconds another worker waits for a recompute before doing it itself
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, name: str, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self.version_key = f"ns:{name}:version"
+
+    def _key(self, key) -> str:
+        return f"{self.name}:{key}"
+
+    def _timeout(self, timeout):
+        return self.timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def version(self) -> str:
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, _new_version(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def invalidate(self):
+        """Drop every key of the namespace, on every worker"""
+        cache.set(self.version_key, _new_version(), None)
+
+    def read(self, keys):
+        """
+        (version, {key: value}) of the current entries among keys, in one round trip.
+        The version can be passed on to set/set_many/get_or_set for values computed from this read.
+        """
+        full_keys = {self._key(key): key for key in keys}
+        found = cache.get_many([self.version_key, *full_keys])
+        version = found.pop(self.version_key, None)
+        if version is None:
+            return self.version(), {}
+        return version, {full_keys[full]: entry[1] for full, entry in found.items() if entry[0] == version}
+
+    def get(self, key, default=None):
+        return self.read([key])[1].get(key, default)
+
+    def get_many(self, keys) -> dict:
+        """{key: value} for the keys that are cached"""
+        return self.read(keys)[1]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cache.set(self._key(key), (version or self.version(), value), self._timeout(timeout))
+
+    def set_many(self, mapping: dict, timeout=DEFAULT_TIMEOUT, version=None):
+        version = version or self.version()
+        cache.set_many({self._key(key): (version, value) for key, value in mapping.items()}, self._timeout(timeout))
+
+    def delete(self, key):
+        cache.delete(self._key(key))
+
+    def delete_many(self, keys):
+        cache.delete_many([self._key(key) for key in keys])
+
+    def get_or_set(self, key, compute, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Return the cached value of `key`, computing and storing it with `compute()` when missing.
+        Pass the `version` returned by an earlier read to skip looking it up again.
+        """
+        if version is None:
+            version, found = self.read([key])
+            if key in found:
+                return found[key]
+        full_key = self._key(key)
+
+        def current():
+            entry = cache.get(full_key)
+            return entry[1] if entry is not None and entry[0] == version else MISSING
+
+        with _local_lock(full_key):
+            value = current()
+            if value is not MISSING:
+                return value
+            lock_key = f"{full_key}:lock:{version}"
+            if not cache.add(lock_key, 1, self.LOCK_TIMEOUT):
+                # Another worker is computing it, wait for its result
+                deadline = time.monotonic() + self.LOCK_TIMEOUT
+                while time.monotonic() < deadline:
+                    time.sleep(self.POLL_INTERVAL)
+                    value = current()
+                    if value is not MISSING:
+                        return value
+                    if cache.get(lock_key) is None:
+                        break  # it gave up without storing a value
+            try:
+                value = compute()
+                cache.set(full_key, (version, value), self._timeout(timeout))
+            finally:
+                cache.delete(lock_key)
+            return value
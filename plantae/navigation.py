@@ -0,0 +1,137 @@
+"""
+Cached navigation context: the category menu and the cart counter shown on every page.
+
+Both come from the shared "nav" cache namespace in a single round trip per request
+(see plantae/cache.py), so a page render usually runs no query for them. The menu is
+kept until a Category changes; a cart count is one Sum aggregate, cached per user or
+session cart. Each cart also has a version key, bumped when one of its CartItems is
+saved or deleted (see the signals in category/ and carts/). A count is stored with
+the cart version read before it was computed and only served while that version is
+current, so a count computed while the cart changed is never kept. Anonymous
+visitors without a session get a count of 0 without creating a session.
+"""
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from .cache import Namespace
+
+nav_cache = Namespace('nav')
+
+MENU_LINKS_KEY = 'menu_links'
+CART_COUNT_TIMEOUT = 10 * 60
+CART_VERSION_TIMEOUT = 24 * 60 * 60
+
+
+def user_cart_key(user_id) -> str:
+    return f"cart_count:user:{user_id}"
+
+
+def session_cart_key(session_key) -> str:
+    return f"cart_count:session:{session_key}"
+
+
+def cart_version_key(cart_key) -> str:
+    return f"{cart_key}:version"
+
+
+def _new_cart_version() -> str:
+    # Random, so a version key lost to eviction never brings an old count back
+    return uuid.uuid4().hex[:12]
+
+
+def _load_menu_links():
+    from category.models import Category
+    return list(Category.objects.all())
+
+
+def _load_cart_count(request) -> int:
+    from carts.models import CartItem
+    if request.user.is_authenticated:
+        items = CartItem.objects.filter(user_id=request.user.id)
+    else:
+        items = CartItem.objects.filter(cart__cart_id=request.session.session_key)
+    return items.aggregate(count=Sum('quantity'))['count'] or 0
+
+
+def navigation(request) -> dict:
+    """{'links': categories, 'cart_count': int} for this request, computed once per request"""
+    context = getattr(request, '_navigation', None)
+    if context is not None:
+        return context
+    if request.user.is_authenticated:
+        cart_key = user_cart_key(request.user.id)
+    elif request.session.session_key:
+        cart_key = session_cart_key(request.session.session_key)
+    else:
+        cart_key = None
+
+    keys = [MENU_LINKS_KEY, cart_key, cart_version_key(cart_key)] if cart_key else [MENU_LINKS_KEY]
+    version, found = nav_cache.read(keys)
+    links = found.get(MENU_LINKS_KEY)
+    if links is None:
+        links = nav_cache.get_or_set(MENU_LINKS_KEY, _load_menu_links, timeout=None, version=version)
+    cart_count = 0
+    if cart_key:
+        cart_version = found.get(cart_version_key(cart_key))
+        entry = found.get(cart_key)
+        if cart_version is not None and entry is not None and entry[0] == cart_version:
+            cart_count = entry[1]
+        else:
+            if cart_version is None:
+                # Set before counting: a change committed after this point bumps it again
+                cart_version = _new_cart_version()
+                nav_cache.set(cart_version_key(cart_key), cart_version, CART_VERSION_TIMEOUT, version=version)
+            cart_count = _load_cart_count(request)
+            nav_cache.set(cart_key, (cart_version, cart_count), CART_COUNT_TIMEOUT, version=version)
+    context = request._navigation = {'links': links, 'cart_count': cart_count}
+    return context
+
+
+def invalidate_menu_links():
+    nav_cache.delete(MENU_LINKS_KEY)
+
+
+def _bump_cart_versions(cart_keys):
+    # A new version rather than a delete, so a count computed before the change and
+    # stored after it is never served
+    if cart_keys:
+        nav_cache.set_many({cart_version_key(key): _new_cart_version() for key in cart_keys}, CART_VERSION_TIMEOUT)
+
+
+def invalidate_cart_counts(user_id=None, session_key=None):
+    keys = []
+    if user_id:
+        keys.append(user_cart_key(user_id))
+    if session_key:
+        keys.append(session_cart_key(session_key))
+    _bump_cart_versions(keys)
+
+
+class _PendingCartCounts:
+    def __init__(self):
+        self.user_ids = set()
+        self.session_keys = set()
+
+    def flush(self):
+        keys = [user_cart_key(user_id) for user_id in self.user_ids if user_id]
+        keys += [session_cart_key(session_key) for session_key in self.session_keys if session_key]
+        _bump_cart_versions(keys)
+
+
+def invalidate_cart_counts_on_commit(user_id=None, session_key=None):
+    """
+    Invalidate cart counts once the current transaction commits (right away outside one), with one
+    cache call per transaction however many cart lines it changed.
+    """
+    if not connection.in_atomic_block:
+        invalidate_cart_counts(user_id, session_key)
+        return
+    pending = getattr(connection, '_pending_cart_counts', None)
+    # A rolled back transaction discards its callbacks, start over when ours is gone
+    if pending is None or not any(entry[1] == pending.flush for entry in connection.run_on_commit):
+        pending = connection._pending_cart_counts = _PendingCartCounts()
+        transaction.on_commit(pending.flush)
+    pending.user_ids.add(user_id)
+    pending.session_keys.add(session_key)
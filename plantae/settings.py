@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "category",
     "accounts",
     "store",
@@ -77,7 +78,8 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
                 "category.context_processors.menu_links",
                 "carts.context_processors.counter",
-                "accounts.context_processors.user_context"
+                "accounts.context_processors.user_context",
+                "agent.context_processors.chat_widget",
             ],
         },
     },
@@ -104,6 +106,25 @@ DATABASES = {
     }
 }
 
+# Shared cache for all workers (see plantae/cache.py for namespaced keys).
+# 'db' (default) needs `python manage.py createcachetable`; 'file' suits a single host; 'locmem' is per process.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'db')
+CACHE_BACKENDS = {
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'plantae_cache'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'plantae'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+# Sessions are read through the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -165,4 +186,40 @@ EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
-RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
\ No newline at end of file
+RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
+
+# Agent conversation memory (LangGraph checkpointer)
+# 'postgres' stores checkpoints in the default database, 'memory' keeps them per process
+AGENT_CHECKPOINTER = os.getenv('AGENT_CHECKPOINTER', 'postgres')
+AGENT_CHECKPOINT_TTL = int(os.getenv('AGENT_CHECKPOINT_TTL', 7 * 24 * 60 * 60))  # seconds
+AGENT_CHECKPOINT_KEEP = 3  # checkpoints retained per thread
+AGENT_CHECKPOINT_POOL_SIZE = int(os.getenv('AGENT_CHECKPOINT_POOL_SIZE', 8))
+AGENT_HISTORY_WINDOW = 20  # messages replayed when rebuilding a cold thread
+AGENT_FAST_ROUTE_THRESHOLD = 0.75  # rule/classifier confidence needed to skip the routing LLM
+AGENT_RESEARCH_CACHE_TTL = 24 * 60 * 60  # seconds a cached care answer / search result stays valid
+AGENT_RESEARCH_CACHE_SIZE = 1000  # entries per worker
+AGENT_ASYNC_WORKERS = int(os.getenv('AGENT_ASYNC_WORKERS', 8))  # threads for blocking work of streamed chat turns
+AGENT_STREAMING = os.getenv('AGENT_STREAMING', 'true') == 'true'  # chat widget streams replies when the site is served over ASGI
+AGENT_MULTI_INTENT = True  # fan compound messages out to parallel agent branches
+AGENT_BRANCH_TIMEOUTS = {'recommendation': 30, 'research': 45}  # seconds per read-only agent branch (cart/order never time out)
+AGENT_PLANT_ID_MAX_DISTANCE = 3  # dHash bits two uploads may differ by to share an identification (at most 3)
+AGENT_IMAGE_MAX_SIZE = 1024  # longest side (px) of stored chat images and the vision model payload
+AGENT_IMAGE_MODEL_FORMAT = os.getenv('AGENT_IMAGE_MODEL_FORMAT', 'webp')  # 'webp', 'avif' or '' to send the stored image as is
+AGENT_IMAGE_MODEL_QUALITY = 80
+AGENT_PLANT_ID_TIMEOUT = 60  # seconds a node waits for the background plant identification
+AGENT_TASK_INLINE_AFTER = int(os.getenv('AGENT_TASK_INLINE_AFTER', 10))  # seconds a needed task may stay unclaimed before the waiting request runs it itself
+AGENT_TRACE_KEEP = 50000  # chat turns kept in the AgentTrace table, 0 disables tracing
+AGENT_TOKEN_PRICES = {'gpt-4.1-nano': (0.10, 0.40)}  # USD per 1M input/output tokens, by model name prefix
+# Sliding-window rate limits as (requests, window seconds), counted in the database (agent/ratelimit.py)
+AGENT_RATE_LIMITS = {  # per user (or IP) and endpoint
+    'ask': (10, 60 * 60),
+    'variation_selection': (20, 60 * 60),
+    'stt': (10, 60),
+    'tts': (20, 60),
+}
+AGENT_TURN_LLM_CALLS = 3  # OpenAI calls a chat turn is charged for upstream (routing and agent steps), +1 with an image
+AGENT_UPSTREAM_RATE_LIMITS = {  # per upstream API across all users, in calls
+    'openai': (120, 60),
+    'elevenlabs': (60, 60),
+    'tavily': (60, 60),
+}
@@ -142,6 +142,50 @@ if (imageBtn && imageIcon && imageInput && imagePreview) {
   });
 }
 
+// Status shown while the agent works, keyed by the graph node that just finished
+const AGENT_PROGRESS_LABELS = {
+  supervisor: "Agent is thinking...",
+  cart_agent: "Checking your cart...",
+  order_agent: "Looking up your orders...",
+  research_agent: "Researching...",
+  recommendation_agent: "Finding products...",
+};
+
+// Read a Server-Sent Events response from /agent/ask/stream/, calling onEvent for
+// progress and token events. Resolves with the payload of the "done" event as soon as it
+// arrives (the server may keep the stream open briefly for follow-up work).
+function readAgentStream(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  return new Promise((resolve, reject) => {
+    function pump() {
+      reader.read().then(({ value, done: finished }) => {
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !finished });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          const dataLine = block.split("\n").find(line => line.startsWith("data: "));
+          if (!dataLine) continue;
+          const event = JSON.parse(dataLine.slice(6));
+          if (event.type === "done") {
+            resolve(event);
+          } else {
+            onEvent(event);
+          }
+        }
+        if (finished) {
+          resolve(null);
+        } else {
+          pump();
+        }
+      }).catch(reject);
+    }
+    pump();
+  });
+}
+
 const sendBtn = document.getElementById('sendBtn');
 const sendIcon = document.getElementById('sendIcon');
 
@@ -193,19 +237,37 @@ function sendMessage() {
   // Set send icon to active
   if (sendIcon) sendIcon.src = SEND_ACTIVE_SRC;
 
-  fetch("/agent/ask/", {
+  // Over ASGI, stream the reply (Server-Sent Events): progress and tokens first, then one "done" event.
+  // Under WSGI the stream would be buffered, so ask for the whole reply instead.
+  const askUrl = (typeof AGENT_STREAMING !== "undefined" && AGENT_STREAMING) ? "/agent/ask/stream/" : "/agent/ask/";
+  const streamedText = {};  // answer tokens per agent node
+  fetch(askUrl, {
     method: "POST",
     headers: { "X-CSRFToken": getCSRFToken() },
     credentials: "same-origin",
     body: formData
   })
   .then(res => {
-    console.log('[ChatWidget] /agent/ask/ response:', res);
+    console.log(`[ChatWidget] ${askUrl} response:`, res);
     if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
-    return res.json();
+    if (askUrl === "/agent/ask/") return res.json();
+    return readAgentStream(res, event => {
+      const replyEl = document.getElementById(loadingId);
+      if (!replyEl) return;
+      if (event.type === "progress") {
+        const status = replyEl.querySelector("em");
+        if (status && AGENT_PROGRESS_LABELS[event.node]) status.textContent = AGENT_PROGRESS_LABELS[event.node];
+      } else if (event.type === "token") {
+        streamedText[event.node] = (streamedText[event.node] || "") + event.text;
+        const preview = Object.values(streamedText).join("\n\n");
+        replyEl.innerHTML = `<div class="bg-light rounded-3 p-2 px-3" style="max-width: 70%;">${DOMPurify.sanitize(marked.parse(preview))}</div>`;
+        chatBox.scrollTop = chatBox.scrollHeight;
+      }
+    });
   })
   .then(data => {
-    console.log('[ChatWidget] /agent/ask/ data:', data);
+    console.log(`[ChatWidget] ${askUrl} data:`, data);
+    if (!data) throw new Error("Stream ended without a reply");
     const reply = data.response;
     const replyEl = document.getElementById(loadingId);
     if (replyEl) {
@@ -119,8 +119,33 @@ document.addEventListener('DOMContentLoaded', function() {
         const urlParams = new URLSearchParams(window.location.search);
         urlParams.set('min_price', minPrice);
         urlParams.set('max_price', maxPrice);
+        urlParams.delete('page');
+        urlParams.delete('after');
+        urlParams.delete('before');
         
         // Redirect with new parameters
         window.location.href = window.location.pathname + '?' + urlParams.toString();
     };
+
+    // Rating filter and sort order, back to the first page
+    function applyListingParam(name, value) {
+        const urlParams = new URLSearchParams(window.location.search);
+        if (value) {
+            urlParams.set(name, value);
+        } else {
+            urlParams.delete(name);
+        }
+        urlParams.delete('page');
+        urlParams.delete('after');
+        urlParams.delete('before');
+        window.location.href = window.location.pathname + '?' + urlParams.toString();
+    }
+
+    window.applyRatingFilter = function(minRating) {
+        applyListingParam('min_rating', minRating);
+    };
+
+    window.applySort = function(sort) {
+        applyListingParam('sort', sort);
+    };
 });
\ No newline at end of file
@@ -1,22 +1,10 @@
 from django.shortcuts import render
-from django.db.models import Sum
-from store.models import Product
-from django.utils import timezone
-from datetime import timedelta
+from store.rankings import bestsellers, new_arrivals
 
 def home(request):
-    #bestsellers
-    bestsellers = Product.objects.annotate(
-        total_sales=Sum('orderproduct__quantity')
-    ).order_by('-total_sales', '-id')[:4]
-
-    #new arrivals
-    new_arrivals = Product.objects.filter(
-        is_available=True
-    ).order_by('-created_date')[:8]
-
+    # Pre-ranked lists, see store/rankings.py
     context = {
-        'bestsellers': bestsellers,
-        'new_arrivals': new_arrivals,
+        'bestsellers': bestsellers(limit=4),
+        'new_arrivals': new_arrivals(limit=8),
     }
-    return render(request, 'home.html', context)
\ No newline at end of file
+    return render(request, 'home.html', context)
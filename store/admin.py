@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
-from .models import Product, Variation, ReviewRating, ProductGallery
+from .models import Product, Variation, ReviewRating, ProductGallery, ProductSales
 from .plant_descriptions import format_plant_help_text, PLANT_DESCRIPTIONS
+from .ratings import RATING_FIELDS
 import admin_thumbnails
 
 # Register your models here.
@@ -14,6 +15,8 @@ class ProductGalleryInline(admin.TabularInline):
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('product_name', 'price', 'stock', 'category', 'modified_date', 'is_available')
     prepopulated_fields = {'slug': ('product_name',)}
+    # Maintained from the reviews (store/ratings.py), shown for reference only
+    readonly_fields = RATING_FIELDS
     inlines = [ProductGalleryInline]
     
     def formfield_for_dbfield(self, db_field, **kwargs):
@@ -49,7 +52,14 @@ class VariationAdmin(admin.ModelAdmin):
     list_editable = ('is_active',)
     list_filter = ('product', 'variation_category', 'variation_value',)
 
+class ProductSalesAdmin(admin.ModelAdmin):
+    list_display = ('product', 'day', 'quantity')
+    list_filter = ('day',)
+    date_hierarchy = 'day'
+    readonly_fields = ('product', 'day', 'quantity')
+
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Variation, VariationAdmin)
 admin.site.register(ReviewRating)
-admin.site.register(ProductGallery)
\ No newline at end of file
+admin.site.register(ProductGallery)
+admin.site.register(ProductSales, ProductSalesAdmin)
@@ -0,0 +1,196 @@
+"""
+Read-mostly, in-process snapshot of the product catalog.
+
+The agent tools resolve product names, categories and variations many times
+per chat turn. Instead of querying for each lookup they read this snapshot,
+which is built with three queries and rebuilt after a Product, Variation or
+Category change has committed (see store/signals.py). The snapshot is tied to
+the version of the shared "catalog" cache namespace, so every worker notices a
+change, not only the one that saved it. That version is looked up at most
+every CATALOG_VERSION_CHECK seconds, so a lookup normally costs no cache round
+trip either.
+"""
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import cached_property
+
+from plantae.cache import Namespace
+
+from .matcher import ProductMatcher
+
+# Other catalog-derived cache entries live in this namespace too and are dropped with the snapshot
+catalog_cache = Namespace('catalog')
+# Safety net for changes that bypass signals (e.g. queryset.update)
+CATALOG_MAX_AGE = 5 * 60
+# Seconds another worker's change may take to reach this one
+CATALOG_VERSION_CHECK = 5
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+CategoryEntry = namedtuple('CategoryEntry', ['id', 'category_name', 'slug'])
+ProductEntry = namedtuple('ProductEntry', [
+    'id', 'product_name', 'slug', 'description', 'price', 'is_available',
+    'category_id', 'category_name', 'allowed_variations', 'variations',
+])
+# Stock is left out on purpose: it changes with every paid order and is read live from Product
+# variations: {variation_category (lowercase): ((variation_id, variation_value), ...)} for active values
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall(text.lower())
+
+
+class Catalog:
+    def __init__(self, categories, products, variations):
+        # variations: Product.variation_matrix() output
+        self.categories = {c['id']: CategoryEntry(c['id'], c['category_name'], c['slug']) for c in categories}
+        self.categories_by_name = {c.category_name.lower(): c for c in self.categories.values()}
+
+        self.products = {}
+        self.by_name = {}
+        self.by_token = {}
+        self.by_category = {}
+        for p in products:
+            allowed = tuple(x.strip() for x in (p['allowed_variations'] or '').split(',') if x.strip())
+            entry = ProductEntry(
+                p['id'], p['product_name'], p['slug'], p['description'], p['price'], p['is_available'],
+                p['category_id'], self.categories[p['category_id']].category_name, allowed,
+                {k: tuple(v) for k, v in variations.get(p['product_name'], {}).items()},
+            )
+            self.products[entry.id] = entry
+            self.by_name[entry.product_name.lower()] = entry
+            self.by_category.setdefault(entry.category_id, []).append(entry)
+            for token in set(tokenize(entry.product_name)):
+                self.by_token.setdefault(token, []).append(entry)
+        self.names = sorted(self.by_name)
+
+    @cached_property
+    def matcher(self) -> ProductMatcher:
+        """Fuzzy name matcher over this snapshot, built on first use"""
+        return ProductMatcher((p.id, p.product_name) for p in self.products.values())
+
+    def get(self, name: str):
+        """Exact, case-insensitive product name lookup"""
+        return self.by_name.get((name or '').strip().lower())
+
+    def filter_name(self, fragment: str) -> list:
+        """Products whose name contains `fragment` (case-insensitive), ordered by id like the ORM default"""
+        fragment = (fragment or '').strip().lower()
+        if not fragment:
+            return list(self.products.values())
+        tokens = tokenize(fragment)
+        # Whole-word fragments narrow down through the token index first
+        if tokens and all(t in self.by_token for t in tokens):
+            candidates = min((self.by_token[t] for t in tokens), key=len)
+        else:
+            candidates = self.products.values()
+        return sorted((p for p in candidates if fragment in p.product_name.lower()), key=lambda p: p.id)
+
+    def resolve(self, name: str):
+        """
+        Resolve a user supplied product name: exact match first, else the first partial match.
+        Returns (product or None, partial matches).
+        """
+        exact = self.get(name)
+        if exact:
+            return exact, [exact]
+        matches = self.filter_name(name)
+        return (matches[0] if matches else None), matches
+
+    def category(self, name: str):
+        return self.categories_by_name.get((name or '').strip().lower())
+
+    def in_categories(self, names, available_only=True) -> list:
+        products = []
+        for name in names:
+            category = self.category(name)
+            if category:
+                products.extend(self.by_category.get(category.id, []))
+        return sorted((p for p in products if p.is_available or not available_only), key=lambda p: p.id)
+
+    def required_variations(self, product) -> list:
+        """Allowed variation types of a product that have at least one active value"""
+        return [t for t in product.allowed_variations if product.variations.get(t.lower())]
+
+    def variation_values(self, product) -> dict:
+        """{variation type (lowercase): [active values]} for the product's allowed types"""
+        return {
+            t.lower(): [value for _, value in product.variations[t.lower()]]
+            for t in product.allowed_variations
+            if product.variations.get(t.lower())
+        }
+
+    def variation_matrix(self, names) -> dict:
+        """
+        Snapshot counterpart of Product.variation_matrix for the agent: resolves many product
+        names at once and returns {name as given: {variation type (lowercase): [active values]}}
+        for the products that need a variation selected. Unknown names are left out.
+        """
+        matrix = {}
+        for name in names:
+            product = self.get(name)
+            if product and name not in matrix:
+                values = self.variation_values(product)
+                if values:
+                    matrix[name] = values
+        return matrix
+
+    def find_variation(self, product, category: str, value: str):
+        """Id of the active variation matching category/value (case-insensitive), else None"""
+        for variation_id, variation_value in product.variations.get((category or '').lower(), ()):
+            if variation_value.lower() == str(value).strip().lower():
+                return variation_id
+        return None
+
+
+_lock = threading.Lock()
+_snapshot = None  # (version, built_at, Catalog)
+_version_seen = None  # (version, checked_at)
+
+
+def _build() -> Catalog:
+    from category.models import Category
+    from .models import Product
+    categories = list(Category.objects.values('id', 'category_name', 'slug'))
+    products = list(Product.objects.order_by('id').values(
+        'id', 'product_name', 'slug', 'description', 'price', 'is_available', 'category_id', 'allowed_variations',
+    ))
+    return Catalog(categories, products, Product.variation_matrix())
+
+
+def _current_version() -> str:
+    """The catalog namespace version, read from the shared cache at most every CATALOG_VERSION_CHECK seconds"""
+    global _version_seen
+    seen = _version_seen
+    now = time.monotonic()
+    if seen and now - seen[1] < CATALOG_VERSION_CHECK:
+        return seen[0]
+    version = catalog_cache.version()
+    _version_seen = (version, now)
+    return version
+
+
+def get_catalog() -> Catalog:
+    """Return the current catalog snapshot, rebuilding it when it is stale"""
+    global _snapshot
+    version = _current_version()
+    current = _snapshot
+    if current and current[0] == version and time.monotonic() - current[1] < CATALOG_MAX_AGE:
+        return current[2]
+    with _lock:
+        current = _snapshot
+        if current and current[0] == version and time.monotonic() - current[1] < CATALOG_MAX_AGE:
+            return current[2]
+        catalog = _build()
+        _snapshot = (version, time.monotonic(), catalog)
+        return catalog
+
+
+def invalidate_catalog():
+    """Drop the local snapshot and tell other workers to rebuild theirs"""
+    global _snapshot, _version_seen
+    catalog_cache.invalidate()
+    _snapshot = None
+    _version_seen = None
@@ -0,0 +1,161 @@
+"""
+Store listing with keyset (cursor) pagination.
+
+Pages are fetched with `WHERE (sort columns) > (last row's values) ... LIMIT n`
+instead of OFFSET, so every page costs the same however deep it is, and rows
+added or removed meanwhile never shift a page. The listing filters match the
+composite indexes on Product (`is_available, category, price, id` and
+`is_available, price, id`), so price ranges and price sorts read the index
+in order and stop after one page.
+
+Cursors are opaque tokens of the sort values of the row a page starts after
+(`?after=`) or ends before (`?before=`). The total count is cached per filter
+set in the catalog namespace, which product changes invalidate, and rows are
+loaded with only the fields the listing cards show.
+"""
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.db.models import Prefetch, Q
+
+from .catalog import catalog_cache
+from .models import Product, Variation
+
+# Listing sort options (?sort=...), every one ends with a unique column so the keyset is total
+SORT_ORDERS = {
+    'rating': ('-rating_avg', '-rating_count', 'id'),
+    'reviews': ('-rating_count', '-rating_avg', 'id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', 'id'),
+    'newest': ('-created_date', '-id'),
+}
+DEFAULT_ORDER = ('id',)
+PER_PAGE = 12
+COUNT_TIMEOUT = 5 * 60  # rating changes do not invalidate the catalog, so counts by rating expire
+
+# Fields of a listing card (templates/store/store.html)
+CARD_FIELDS = (
+    'id', 'product_name', 'slug', 'price', 'product_images', 'rating_avg', 'rating_count', 'created_date',
+    'category__slug',
+)
+
+
+def default_variations():
+    """Prefetch of the default variations the card's "Add to cart" form submits"""
+    return Prefetch(
+        'variation_set',
+        queryset=Variation.objects.filter(is_default=True).only('id', 'product_id', 'variation_category', 'variation_value', 'is_default'),
+    )
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(product, order) -> str:
+    values = [_plain(getattr(product, field.lstrip('-'))) for field in order]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, order):
+    """Sort values encoded in `token`, None when it is not a valid cursor for `order`"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(order):
+            return None
+        return [Product._meta.get_field(field.lstrip('-')).to_python(value) for field, value in zip(order, values)]
+    except Exception:
+        return None
+
+
+def _beyond(order, values) -> Q:
+    """Rows after `values` in `order` (the OR-expanded form of a row comparison)"""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(order, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    # Redundant bound on the leading column, so the index range scan starts at the cursor
+    first = order[0]
+    return Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]}) & condition
+
+
+def _reverse(order):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in order)
+
+
+class ListingPage:
+    """One page of the listing; iterates over its products"""
+
+    def __init__(self, object_list, count, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.count = count
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def listing_count(products, category, min_price, max_price, min_rating) -> int:
+    key = f"listing_count:{category.id if category else '*'}:{min_price}:{max_price}:{min_rating}"
+    return catalog_cache.get_or_set(key, products.count, timeout=COUNT_TIMEOUT)
+
+
+def store_listing(category=None, min_price=None, max_price=None, min_rating=0, sort='',
+                  after=None, before=None, per_page=PER_PAGE) -> ListingPage:
+    """
+    Available products of `category` (all when None) within the price range and minimum rating,
+    in SORT_ORDERS[sort] order, from the `after` or `before` cursor (the first page when neither).
+    """
+    order = SORT_ORDERS.get(sort, DEFAULT_ORDER)
+    products = Product.objects.filter(is_available=True)
+    if category is not None:
+        products = products.filter(category=category)
+    if min_price is not None:
+        products = products.filter(price__gte=min_price)
+    if max_price is not None:
+        products = products.filter(price__lte=max_price)
+    if min_rating:
+        products = products.filter(rating_avg__gte=min_rating)
+    count = listing_count(products, category, min_price, max_price, min_rating)
+
+    cards = products.select_related('category').only(*CARD_FIELDS).prefetch_related(default_variations())
+    after_values = decode_cursor(after, order) if after else None
+    before_values = decode_cursor(before, order) if before and after_values is None else None
+    if before_values is not None:
+        # Walk backwards from the cursor, then restore the listing order
+        rows = list(cards.filter(_beyond(_reverse(order), before_values)).order_by(*_reverse(order))[:per_page + 1])
+        more_before = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        next_cursor = encode_cursor(rows[-1], order) if rows else None
+        previous_cursor = encode_cursor(rows[0], order) if rows and more_before else None
+    else:
+        if after_values is not None:
+            cards = cards.filter(_beyond(order, after_values))
+        rows = list(cards.order_by(*order)[:per_page + 1])
+        more_after = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1], order) if more_after else None
+        previous_cursor = encode_cursor(rows[0], order) if rows and after_values is not None else None
+    return ListingPage(rows, count, next_cursor, previous_cursor)
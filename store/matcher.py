@@ -0,0 +1,160 @@
+"""
+Fuzzy product-name matching.
+
+`ProductMatcher` indexes product names (and simple aliases such as "rose" for
+"Rose Plant") once, then answers "closest names to this text" queries without
+scanning the catalog:
+
+- a trigram posting index collects candidates that share character trigrams
+  with the query, rarest trigrams first so common ones do not flood it;
+- a symmetric-delete index over name words finds words within a small edit
+  distance of each query word, which rescues short or badly misspelt queries;
+- only the best few candidates are scored with difflib's ratio, the same
+  measure `difflib.get_close_matches` used before, so cutoffs keep their meaning.
+"""
+import difflib
+import re
+from collections import Counter
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+# Words that describe the product type rather than name it
+GENERIC_WORDS = {"plant", "plants", "seed", "seeds", "pot", "pots", "planter", "planters"}
+
+
+def normalize(text: str) -> str:
+    return " ".join(WORD_RE.findall((text or "").lower()))
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, returning limit + 1 as soon as it is exceeded"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def deletes(word: str) -> set:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class DeletionIndex:
+    """
+    Symmetric-delete index over words (as used by SymSpell). A word and every
+    single-character deletion of it point back to the word, so two words that
+    are one edit apart share a key. Lookups cost O(len(word)) dict probes, no
+    matter how large the vocabulary is.
+    """
+
+    def __init__(self, words=()):
+        self.index = {}
+        for word in words:
+            for key in deletes(word) | {word}:
+                self.index.setdefault(key, []).append(word)
+
+    def search(self, word: str, max_distance: int = 2) -> list:
+        """Return (distance, vocabulary word) pairs within max_distance (at most 2)"""
+        found = set()
+        for key in deletes(word) | {word}:
+            found.update(self.index.get(key, ()))
+        matches = []
+        for candidate in found:
+            distance = edit_distance(word, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+        return matches
+
+
+class ProductMatcher:
+    """
+    Build once from (product_id, product_name) pairs, then query with `top_k` / `best`.
+    Instances are immutable after construction and safe to share between threads.
+    """
+
+    # Candidates rescored with difflib after the index lookup
+    RESCORE_LIMIT = 25
+
+    def __init__(self, products, aliases=None):
+        self.keys = []  # normalized name or alias
+        self.key_products = []  # product id for each key
+        self.names = {}  # product id -> display name
+        for product_id, name in products:
+            self.names[product_id] = name
+            normalized = normalize(name)
+            forms = {normalized}
+            stripped = " ".join(w for w in normalized.split() if w not in GENERIC_WORDS)
+            if stripped:
+                forms.add(stripped)
+            forms.update(normalize(alias) for alias in (aliases or {}).get(product_id, ()))
+            for form in forms:
+                if form:
+                    self.keys.append(form)
+                    self.key_products.append(product_id)
+
+        self.postings = {}
+        self.words = {}
+        for key_id, key in enumerate(self.keys):
+            for gram in trigrams(key):
+                self.postings.setdefault(gram, []).append(key_id)
+            for word in key.split():
+                self.words.setdefault(word, []).append(key_id)
+        self.word_index = DeletionIndex(self.words)
+        # Trigrams shared by more keys than this are skipped while collecting candidates
+        self.common_limit = max(100, len(self.keys) // 200)
+
+    def _candidates(self, query: str) -> Counter:
+        counts = Counter()
+        grams = sorted(trigrams(query), key=lambda g: len(self.postings.get(g, ())))
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if not posting:
+                continue
+            if len(posting) > self.common_limit and counts:
+                break
+            counts.update(posting)
+        # Typo-tolerant word matches; a hit counts like several shared trigrams
+        for word in query.split():
+            if len(word) < 3:
+                continue
+            max_distance = 1 if len(word) <= 5 else 2
+            for distance, match in self.word_index.search(word, max_distance):
+                key_ids = self.words[match]
+                if len(key_ids) <= self.common_limit:
+                    counts.update(dict.fromkeys(key_ids, 3 - distance))
+        return counts
+
+    def top_k(self, query: str, k: int = 5, cutoff: float = 0.0) -> list:
+        """Return up to k (score, product_id, product_name) tuples, best first"""
+        query = normalize(query)
+        if not query or not self.keys:
+            return []
+        best = {}
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(query)  # difflib caches analysis of seq2
+        for key_id, _ in self._candidates(query).most_common(self.RESCORE_LIMIT):
+            product_id = self.key_products[key_id]
+            matcher.set_seq1(self.keys[key_id])
+            floor = max(cutoff, best.get(product_id, -1.0))
+            if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+                continue
+            score = matcher.ratio()
+            if score >= cutoff and score > best.get(product_id, -1.0):
+                best[product_id] = score
+        ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(score, product_id, self.names[product_id]) for product_id, score in ranked]
+
+    def best(self, query: str, cutoff: float = 0.6):
+        """Return the single best (score, product_id, product_name) or None"""
+        matches = self.top_k(query, k=1, cutoff=cutoff)
+        return matches[0] if matches else None
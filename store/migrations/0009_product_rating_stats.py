@@ -0,0 +1,82 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:06
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_stats(apps, schema_editor):
+    # Self-contained copy of store.ratings.recompute_rating_stats as of this migration
+    Product = apps.get_model("store", "Product")
+    ReviewRating = apps.get_model("store", "ReviewRating")
+    stars = (1, 2, 3, 4, 5)
+    stats = {
+        row['product_id']: row
+        for row in ReviewRating.objects.filter(status=True).values('product_id').annotate(
+            count=Count('id'),
+            total=Sum('rating'),
+            **{f'star_{star}': Count('id', filter=Q(rating__gt=star - 1, rating__lte=star) if star > 1 else Q(rating__lte=1)) for star in stars},
+        )
+    }
+    changed = []
+    for product in Product.objects.only('id'):
+        row = stats.get(product.id, {})
+        product.rating_count = row.get('count', 0)
+        product.rating_sum = row.get('total') or 0.0
+        product.rating_avg = product.rating_sum / product.rating_count if product.rating_count else 0.0
+        for star in stars:
+            setattr(product, f'rating_{star}', row.get(f'star_{star}', 0))
+        changed.append(product)
+    Product.objects.bulk_update(
+        changed, ['rating_count', 'rating_sum', 'rating_avg'] + [f'rating_{star}' for star in stars], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_variation_is_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
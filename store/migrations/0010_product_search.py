@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# Django 4.2 cannot declare generated columns, so the search column and its indexes
+# live outside the model state (see store/search.py). Other databases skip them.
+CREATE_SEARCH = [
+    """
+    ALTER TABLE store_product ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(product_name, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS store_product_search_idx ON store_product USING gin (search_vector)",
+]
+# Typo tolerance needs the pg_trgm contrib extension; search works without it when the server lacks it
+CREATE_TRIGRAM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS store_product_name_trgm_idx ON store_product USING gin (product_name gin_trgm_ops)",
+]
+DROP_SEARCH = [
+    "DROP INDEX IF EXISTS store_product_name_trgm_idx",
+    "DROP INDEX IF EXISTS store_product_search_idx",
+    "ALTER TABLE store_product DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def create_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    statements = list(CREATE_SEARCH)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone():
+            statements += CREATE_TRIGRAM
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in DROP_SEARCH:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_rating_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:14
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_sales(apps, schema_editor):
+    # Self-contained copy of store.rankings.rebuild_sales as of this migration
+    OrderProduct = apps.get_model("orders", "OrderProduct")
+    ProductSales = apps.get_model("store", "ProductSales")
+    daily = (
+        OrderProduct.objects.filter(ordered=True).annotate(day=TruncDate('created_at'))
+        .values('product_id', 'day').annotate(total=Sum('quantity')).order_by()
+    )
+    ProductSales.objects.all().delete()
+    ProductSales.objects.bulk_create(
+        [ProductSales(product_id=row['product_id'], day=row['day'], quantity=row['total']) for row in daily if row['total'] > 0],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_listing_indexes'),
+        ('orders', '0007_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='store.product')),
+            ],
+            options={
+                'verbose_name_plural': 'product sales',
+                'indexes': [models.Index(fields=['day', 'product'], name='store_productsales_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productsales',
+            constraint=models.UniqueConstraint(fields=('product', 'day'), name='store_productsales_unique'),
+        ),
+        migrations.RunPython(backfill_sales, migrations.RunPython.noop),
+    ]
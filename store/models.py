@@ -2,8 +2,8 @@ from django.db import models
 from category.models import Category
 from django.urls import reverse
 from accounts.models import Account
-from django.db.models import Avg, Count
 from PIL import Image
+from .ratings import RATING_FIELDS, rating_state
 
 # Create your models here.
 
@@ -27,6 +27,22 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     created_date = models.DateTimeField(auto_now_add=True)
     modified_date = models.DateTimeField(auto_now=True)
+    # Published review statistics, kept up to date by store/signals.py (see store/ratings.py)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.FloatField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, db_index=True, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)  # reviews per star, half stars rounded up
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the store listing (see store/listing.py)
+            models.Index(fields=['is_available', 'category', 'price', 'id'], name='store_product_listing_idx'),
+            models.Index(fields=['is_available', 'price', 'id'], name='store_product_price_idx'),
+        ]
     
     def get_url(self):
         return reverse('product_detail', args=[self.category.slug, self.slug])
@@ -35,18 +51,17 @@ class Product(models.Model):
         return self.product_name
     
     def averageRating(self):
-        reviews = ReviewRating.objects.filter(product=self, status=True).aggregate(average=Avg('rating'))
-        avg = 0
-        if reviews['average'] is not None:
-            avg = float(reviews['average'])
-        return avg
+        return self.rating_avg
     
     def countReview(self):
-        reviews = ReviewRating.objects.filter(product=self, status=True).aggregate(count=Count('id'))
-        count = 0
-        if reviews['count'] is not None:
-            count = int(reviews['count'])
-        return count
+        return self.rating_count
+
+    def rating_histogram(self):
+        """[(star, review count, percent of reviews)] from 5 stars down to 1"""
+        return [
+            (star, getattr(self, f'rating_{star}'), round(100 * getattr(self, f'rating_{star}') / self.rating_count) if self.rating_count else 0)
+            for star in (5, 4, 3, 2, 1)
+        ]
     
     def get_allowed_variations(self):
         """Returns a queryset of Variation objects for this product that match allowed types"""
@@ -55,6 +70,22 @@ class Product(models.Model):
             return Variation.objects.filter(product=self, variation_category__in=allowed, is_active=True)
         return Variation.objects.none()
     
+    @classmethod
+    def variation_matrix(cls):
+        """
+        Active variation values of all products in a single query, grouped by product and category:
+        {product_name: {variation_category (lowercase): [(variation_id, variation_value), ...]}}.
+        Values are distinct per category; a repeated value keeps its oldest variation.
+        """
+        matrix = {}
+        for product_name, category, variation_id, value in Variation.objects.filter(is_active=True).order_by('id').values_list(
+            'product__product_name', 'variation_category', 'id', 'variation_value',
+        ):
+            values = matrix.setdefault(product_name, {}).setdefault(category.lower(), [])
+            if all(value != seen for _, seen in values):
+                values.append((variation_id, value))
+        return matrix
+
     def get_plant_info(self):
         """Check if this product matches any plant in PLANT_DESCRIPTIONS and return plant info"""
         from .plant_descriptions import PLANT_DESCRIPTIONS
@@ -70,6 +101,13 @@ class Product(models.Model):
         return None
     
     def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            # Rating statistics only change through F() updates (store/ratings.py); writing the
+            # loaded values back would undo reviews saved since this instance was read
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in RATING_FIELDS
+            ]
         super().save(*args, **kwargs)
         if self.product_images:
             img = Image.open(self.product_images.path)
@@ -124,9 +162,35 @@ class ReviewRating(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateField(auto_now=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the product statistics currently count for this review (see store/signals.py)
+        instance._counted = rating_state(instance)
+        return instance
+
     def __str__(self):
         return self.subject
     
+class ProductSales(models.Model):
+    """Units of a product sold on a day, maintained incrementally by store/rankings.py"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='store_productsales_unique'),
+        ]
+        indexes = [
+            # Time-windowed bestsellers (day >= today - window)
+            models.Index(fields=['day', 'product'], name='store_productsales_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.quantity}"
+
 class ProductGallery(models.Model):
     product = models.ForeignKey(Product, default=None, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='store/products', max_length=255)
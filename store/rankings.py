@@ -0,0 +1,150 @@
+"""
+Precomputed product rankings: bestsellers and new arrivals.
+
+Sales are materialized in `ProductSales`, one row per product and day,
+incremented with a single upsert by `record_sales` when an order is paid
+(orders.services.finalize_order). Bestsellers over the last 7 or 30 days,
+or all time, are sums over that small table instead of the order lines, and
+each ranking (optionally per category) is cached as a list of product ids in
+the "rankings" namespace. Recording a sale or changing a product drops the
+cached lists, and they expire hourly so the time windows roll over.
+
+Readers (the home page, the agent's recommendations) get a pre-ranked list
+from the cache in one round trip, plus one query for the listed products.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from plantae.cache import Namespace
+
+rankings_cache = Namespace('rankings')
+
+WINDOWS = (7, 30, None)  # days, None for all time
+RANKING_SIZE = 24
+RANKING_TIMEOUT = 60 * 60
+
+
+def _upsert(rows):
+    """Add (product_id, day, quantity) rows to ProductSales in one statement"""
+    from .models import ProductSales
+    qn = connection.ops.quote_name
+    table, product_col, day_col, quantity_col = (
+        qn(name) for name in (ProductSales._meta.db_table, 'product_id', 'day', 'quantity')
+    )
+    values = ", ".join(["(%s, %s, %s)"] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({product_col}, {day_col}, {quantity_col}) VALUES {values} "
+            f"ON CONFLICT ({product_col}, {day_col}) DO UPDATE SET {quantity_col} = {table}.{quantity_col} + EXCLUDED.{quantity_col}",
+            [value for row in rows for value in row],
+        )
+
+
+def record_sales(lines, day=None):
+    """
+    Count sold (product_id, quantity) lines towards today's (or `day`'s) sales,
+    and drop the cached rankings once the transaction commits.
+    """
+    totals = Counter()
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+    rows = [(product_id, day or timezone.localdate(), quantity) for product_id, quantity in sorted(totals.items()) if quantity > 0]
+    if not rows:
+        return
+    _upsert(rows)
+    transaction.on_commit(invalidate_rankings)
+
+
+def rebuild_sales(order_lines, sales):
+    """
+    Rebuild `sales` (the ProductSales manager) from the `order_lines` (OrderProduct queryset)
+    in one aggregate query plus one bulk insert (for backfills and repairs).
+    """
+    daily = (
+        order_lines.filter(ordered=True).annotate(day=TruncDate('created_at'))
+        .values('product_id', 'day').annotate(total=Sum('quantity')).order_by()
+    )
+    sales.all().delete()
+    sales.bulk_create(
+        [sales.model(product_id=row['product_id'], day=row['day'], quantity=row['total']) for row in daily if row['total'] > 0],
+        batch_size=500,
+    )
+
+
+def invalidate_rankings():
+    rankings_cache.invalidate()
+
+
+def _ranking_key(name, window=None, category_id=None) -> str:
+    return f"{name}:{window or 'all'}:{category_id or '*'}"
+
+
+def _available(category_id=None):
+    from .models import Product
+    products = Product.objects.filter(is_available=True)
+    if category_id:
+        products = products.filter(category_id=category_id)
+    return products
+
+
+def _load_bestseller_ids(window, category_id):
+    from .models import ProductSales
+    sales = ProductSales.objects.filter(product__is_available=True)
+    if window:
+        sales = sales.filter(day__gte=timezone.localdate() - timedelta(days=window - 1))
+    if category_id:
+        sales = sales.filter(product__category_id=category_id)
+    ranked = list(
+        sales.values('product_id').annotate(sold=Sum('quantity')).order_by('-sold', '-product_id')
+        .values_list('product_id', flat=True)[:RANKING_SIZE]
+    )
+    if len(ranked) < RANKING_SIZE:
+        # Not enough sales yet, fill up with the latest unsold products
+        ranked += list(
+            _available(category_id).exclude(id__in=ranked).order_by('-id')
+            .values_list('id', flat=True)[:RANKING_SIZE - len(ranked)]
+        )
+    return ranked
+
+
+def bestseller_ids(window=None, category_id=None) -> list:
+    """Product ids, best selling first, over the last `window` days (one of WINDOWS) in a category or overall"""
+    if window not in WINDOWS:
+        raise ValueError(f"Unsupported bestseller window: {window}")
+    return rankings_cache.get_or_set(
+        _ranking_key('bestsellers', window, category_id),
+        lambda: _load_bestseller_ids(window, category_id),
+        timeout=RANKING_TIMEOUT,
+    )
+
+
+def new_arrival_ids(category_id=None) -> list:
+    """Product ids, newest first"""
+    return rankings_cache.get_or_set(
+        _ranking_key('new_arrivals', category_id=category_id),
+        lambda: list(_available(category_id).order_by('-created_date', '-id').values_list('id', flat=True)[:RANKING_SIZE]),
+        timeout=RANKING_TIMEOUT,
+    )
+
+
+def ranked_products(ids, limit=None) -> list:
+    """Listing cards of the products `ids`, in that order"""
+    from .listing import CARD_FIELDS, default_variations
+    from .models import Product
+    ids = ids[:limit] if limit else ids
+    products = Product.objects.filter(id__in=ids).select_related('category').only(*CARD_FIELDS).prefetch_related(default_variations())
+    by_id = {product.id: product for product in products}
+    return [by_id[product_id] for product_id in ids if product_id in by_id]
+
+
+def bestsellers(limit=8, window=None, category_id=None) -> list:
+    return ranked_products(bestseller_ids(window, category_id), limit)
+
+
+def new_arrivals(limit=8, category_id=None) -> list:
+    return ranked_products(new_arrival_ids(category_id), limit)
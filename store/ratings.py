@@ -0,0 +1,91 @@
+"""
+Denormalized review statistics on Product.
+
+Each product carries its number of published reviews, their rating sum and
+average, and a 1-5 star histogram, so pages and listings read ratings without
+aggregating ReviewRating. The signals in store/signals.py call
+`apply_rating_change` with what a review counted for before and after each
+save or delete, and the product row is adjusted with F() expressions.
+"""
+import math
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+
+STARS = (1, 2, 3, 4, 5)
+# Product columns owned by this module: never part of a full Product.save() or an admin form
+RATING_FIELDS = ('rating_count', 'rating_sum', 'rating_avg') + tuple(f'rating_{star}' for star in STARS)
+
+
+def rating_bucket(rating) -> int:
+    """Histogram star of a rating (half stars round up, e.g. 3.5 -> 4)"""
+    return min(5, max(1, math.ceil(rating)))
+
+
+def rating_state(review):
+    """(product_id, rating) a review counts for in the statistics, None when it is not published"""
+    if not review.status:
+        return None
+    return review.product_id, float(review.rating)
+
+
+def average_expression():
+    return Case(
+        When(rating_count__gt=0, then=F('rating_sum') / F('rating_count')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating_change(old, new):
+    """Move a review's contribution from `old` to `new` (rating_state values, None for nothing)"""
+    if old == new:
+        return
+    from .models import Product
+    deltas = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        product_id, rating = state
+        delta = deltas.setdefault(product_id, Counter())
+        delta['rating_count'] += sign
+        delta['rating_sum'] += sign * rating
+        delta[f'rating_{rating_bucket(rating)}'] += sign
+    with transaction.atomic():
+        for product_id, delta in deltas.items():
+            changes = {field: F(field) + value for field, value in delta.items() if value}
+            if not changes:
+                continue
+            products = Product.objects.filter(pk=product_id)
+            products.update(**changes)
+            # Separate statement: the average must see the updated sum and count
+            products.update(rating_avg=average_expression())
+
+
+def recompute_rating_stats(products, reviews):
+    """
+    Rebuild the statistics of the `products` queryset from the `reviews` queryset in one
+    aggregate query plus one bulk update (for backfills and repairs).
+    """
+    from django.db.models import Count, Q, Sum
+    stats = {
+        row['product_id']: row
+        for row in reviews.filter(status=True).values('product_id').annotate(
+            count=Count('id'),
+            total=Sum('rating'),
+            **{f'star_{star}': Count('id', filter=Q(rating__gt=star - 1, rating__lte=star) if star > 1 else Q(rating__lte=1)) for star in STARS},
+        )
+    }
+    changed = []
+    for product in products.only('id'):
+        row = stats.get(product.id, {})
+        product.rating_count = row.get('count', 0)
+        product.rating_sum = row.get('total') or 0.0
+        product.rating_avg = product.rating_sum / product.rating_count if product.rating_count else 0.0
+        for star in STARS:
+            setattr(product, f'rating_{star}', row.get(f'star_{star}', 0))
+        changed.append(product)
+    products.model.objects.bulk_update(
+        changed, list(RATING_FIELDS), batch_size=500,
+    )
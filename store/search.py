@@ -0,0 +1,138 @@
+"""
+Product search engine for the storefront and the agent.
+
+On PostgreSQL, products are matched against `store_product.search_vector`, a
+stored generated tsvector column (product name weighted above description)
+with a GIN index, plus a pg_trgm similarity match on the product name for
+typos. Both are created by migration 0010, outside the model, because Django
+4.2 cannot declare generated columns. Results are ranked by ts_rank plus name
+similarity.
+
+Other databases (SQLite in tests and local setups) fall back to matching every
+query word with icontains and ranking name matches above description matches.
+
+`search_products` returns one page of results together with category and
+price facets, counted over every match before the category/price filters.
+"""
+from collections import namedtuple
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorExact, SearchVectorField, TrigramSimilarity
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Case, Count, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+SEARCH_CONFIG = 'english'
+# Weight of product-name trigram similarity (typo matches, pg_trgm's default 0.3 threshold) in the rank
+TRIGRAM_WEIGHT = 0.5
+PRICE_FACETS = ((0, 250), (250, 500), (500, 1000), (1000, None))
+
+SearchResults = namedtuple('SearchResults', ['page', 'count', 'category_facets', 'price_facets'])
+# category_facets: [{'category__id', 'category__category_name', 'category__slug', 'count'}]
+# price_facets: [{'min', 'max', 'count'}] (max is None for the open-ended bucket)
+
+
+def uses_postgres() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+_trigram = None
+
+
+def has_trigram() -> bool:
+    """Whether pg_trgm is installed (migration 0010 skips it on servers without the extension)"""
+    global _trigram
+    if _trigram is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram = cursor.fetchone() is not None
+    return _trigram
+
+
+def _postgres_match(text):
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    document = RawSQL('"store_product"."search_vector"', [], output_field=SearchVectorField())
+    condition = Q(SearchVectorExact(document, query))
+    rank = SearchRank(document, query)
+    if has_trigram():
+        # Both conditions can use their GIN index (`@@` and pg_trgm's `%`)
+        condition |= Q(product_name__trigram_similar=text)
+        rank = rank + TrigramSimilarity('product_name', text) * TRIGRAM_WEIGHT
+    return condition, rank
+
+
+def _fallback_match(text):
+    words = text.split()
+    condition = Q()
+    for word in words:
+        condition &= Q(product_name__icontains=word) | Q(description__icontains=word)
+    rank = Case(
+        When(product_name__icontains=text, then=Value(3.0)),
+        When(product_name__icontains=words[0], then=Value(2.0)),
+        default=Value(1.0),
+        output_field=FloatField(),
+    )
+    return condition, rank
+
+
+def match(text: str):
+    """(filter condition, rank expression) for `text`; higher rank is better, blank text matches everything"""
+    text = (text or '').strip()
+    if not text:
+        return Q(), Value(0.0, output_field=FloatField())
+    if uses_postgres():
+        return _postgres_match(text)
+    return _fallback_match(text)
+
+
+def price_facets(matches) -> list:
+    buckets = {}
+    for i, (low, high) in enumerate(PRICE_FACETS):
+        condition = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        buckets[f'bucket_{i}'] = Count('id', filter=condition)
+    counts = matches.order_by().aggregate(**buckets)
+    return [
+        {'min': low, 'max': high, 'count': counts[f'bucket_{i}']}
+        for i, (low, high) in enumerate(PRICE_FACETS)
+        if counts[f'bucket_{i}']
+    ]
+
+
+def category_facets(matches) -> list:
+    return list(
+        matches.order_by().values('category__id', 'category__category_name', 'category__slug')
+        .annotate(count=Count('id')).order_by('-count', 'category__category_name')
+    )
+
+
+def search_products(text, category=None, min_price=None, max_price=None, min_rating=0,
+                    order_by=None, page=1, per_page=12, available_only=False, facets=True) -> SearchResults:
+    """
+    Search products by relevance. `category` is a Category id or slug. `order_by` overrides
+    relevance ordering (e.g. store.views.SORT_ORDERS values).
+    """
+    condition, rank = match(text)
+    matches = Product.objects.filter(condition)
+    if available_only:
+        matches = matches.filter(is_available=True)
+
+    category_counts = category_facets(matches) if facets else []
+    price_counts = price_facets(matches) if facets else []
+
+    filtered = matches
+    if category:
+        filtered = filtered.filter(**{'category_id' if isinstance(category, int) else 'category__slug': category})
+    if min_price is not None:
+        filtered = filtered.filter(price__gte=min_price)
+    if max_price is not None:
+        filtered = filtered.filter(price__lte=max_price)
+    if min_rating:
+        filtered = filtered.filter(rating_avg__gte=min_rating)
+    filtered = filtered.select_related('category').annotate(rank=rank).order_by(*(order_by or ('-rank', 'id')))
+
+    paginator = Paginator(filtered, per_page)
+    result_page = paginator.get_page(page)
+    return SearchResults(result_page, paginator.count, category_counts, price_counts)
+
@@ -0,0 +1,47 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from category.models import Category
+from .models import Product, Variation, ReviewRating
+from .catalog import invalidate_catalog
+from .ratings import apply_rating_change, rating_state
+from .rankings import invalidate_rankings
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    # After commit, so no worker rebuilds its snapshot from data the change has not committed yet
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs):
+    # Availability and new products change the rankings
+    transaction.on_commit(invalidate_rankings)
+
+
+@receiver(pre_save, sender=ReviewRating)
+def review_loading(sender, instance, **kwargs):
+    # Instances not loaded from the database (e.g. built with a pk) still need their stored state
+    if not hasattr(instance, '_counted'):
+        stored = ReviewRating.objects.filter(pk=instance.pk).first() if instance.pk else None
+        instance._counted = stored._counted if stored else None
+
+
+@receiver(post_save, sender=ReviewRating)
+def review_saved(sender, instance, **kwargs):
+    state = rating_state(instance)
+    apply_rating_change(instance._counted, state)
+    instance._counted = state
+
+
+@receiver(post_delete, sender=ReviewRating)
+def review_deleted(sender, instance, **kwargs):
+    apply_rating_change(getattr(instance, '_counted', rating_state(instance)), None)
+    instance._counted = None
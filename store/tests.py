@@ -1,3 +1,173 @@
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import Account
+from category.models import Category
+from .listing import store_listing
+from .models import Product, ReviewRating
+from .ratings import RATING_FIELDS
+
+
+class RatingCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ann = Account.objects.create_user('Ann', 'Lee', 'ann', 'ann@example.com', 'pw12345', '1234567890')
+        cls.bob = Account.objects.create_user('Bob', 'Ray', 'bob', 'bob@example.com', 'pw12345', '1234567891')
+        category = Category.objects.create(category_name='Plants', slug='plants')
+        cls.fern = Product.objects.create(
+            product_name='Fern', slug='fern', description='A fern', price=Decimal('10.00'), stock=5, category=category,
+        )
+        cls.cactus = Product.objects.create(
+            product_name='Cactus', slug='cactus', description='A cactus', price=Decimal('4.50'), stock=5, category=category,
+        )
+
+    def review(self, user, rating, product=None, **fields):
+        return ReviewRating.objects.create(product=product or self.fern, user=user, subject='Nice', rating=rating, **fields)
+
+    def stats(self, product=None):
+        return Product.objects.values(*RATING_FIELDS).get(pk=(product or self.fern).pk)
+
+    def assertStats(self, count, total, histogram, product=None):
+        stats = self.stats(product)
+        self.assertEqual(stats['rating_count'], count)
+        self.assertAlmostEqual(stats['rating_sum'], total)
+        self.assertAlmostEqual(stats['rating_avg'], total / count if count else 0)
+        self.assertEqual([stats[f'rating_{star}'] for star in range(1, 6)], histogram)
+
+    def test_create(self):
+        self.review(self.ann, 4)
+        self.review(self.bob, 2.5)
+        self.assertStats(2, 6.5, [0, 0, 1, 1, 0])
+        self.assertStats(0, 0, [0, 0, 0, 0, 0], product=self.cactus)
+
+    def test_unpublished_reviews_are_not_counted(self):
+        self.review(self.ann, 5, status=False)
+        self.assertStats(0, 0, [0, 0, 0, 0, 0])
+
+    def test_update_rating_and_status(self):
+        review = self.review(self.ann, 4)
+        self.review(self.bob, 2)
+
+        review.rating = 1
+        review.save()
+        self.assertStats(2, 3, [1, 1, 0, 0, 0])
+
+        review.status = False
+        review.save()
+        self.assertStats(1, 2, [0, 1, 0, 0, 0])
+
+        # Saving again without a change does not count twice
+        review.save()
+        self.assertStats(1, 2, [0, 1, 0, 0, 0])
+
+        review.status = True
+        review.save()
+        self.assertStats(2, 3, [1, 1, 0, 0, 0])
+
+    def test_update_of_a_fresh_instance(self):
+        review = self.review(self.ann, 4)
+        ReviewRating(
+            pk=review.pk, product=self.fern, user=self.ann, subject='Nice', rating=5, created_at=review.created_at,
+        ).save()
+        self.assertStats(1, 5, [0, 0, 0, 0, 1])
+
+    def test_move_to_another_product(self):
+        review = self.review(self.ann, 3)
+        review.product = self.cactus
+        review.save()
+        self.assertStats(0, 0, [0, 0, 0, 0, 0])
+        self.assertStats(1, 3, [0, 0, 1, 0, 0], product=self.cactus)
+
+    def test_delete(self):
+        review = self.review(self.ann, 4)
+        self.review(self.bob, 5)
+        review.delete()
+        self.assertStats(1, 5, [0, 0, 0, 0, 1])
+        ReviewRating.objects.filter(user=self.bob).delete()
+        self.assertStats(0, 0, [0, 0, 0, 0, 0])
+
+    def test_product_save_keeps_counters(self):
+        product = Product.objects.get(pk=self.fern.pk)
+        self.review(self.ann, 4)
+        # A stale instance saved afterwards must not write its old counters back
+        product.description = 'A lush fern'
+        product.save()
+        self.assertStats(1, 4, [0, 0, 0, 1, 0])
+
+
+class ListingPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(category_name='Plants', slug='plants')
+        prices = ['5.00', '3.00', '5.00', '1.00', '5.00', '2.00', '4.00']
+        cls.products = [
+            Product.objects.create(
+                product_name=f'Plant {index}', slug=f'plant-{index}', description='A plant',
+                price=Decimal(price), stock=5, category=category,
+            )
+            for index, price in enumerate(prices)
+        ]
+        Product.objects.create(
+            product_name='Sold out', slug='sold-out', description='A plant', price=Decimal('1.00'), stock=0,
+            category=category, is_available=False,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def walk_forward(self, **filters):
+        pages = [store_listing(per_page=3, **filters)]
+        while pages[-1].has_next():
+            pages.append(store_listing(per_page=3, after=pages[-1].next_cursor, **filters))
+        return pages
+
+    def ids(self, page):
+        return [product.id for product in page]
+
+    def test_default_order_pages(self):
+        pages = self.walk_forward()
+        expected = [product.id for product in self.products]
+        self.assertEqual([self.ids(page) for page in pages], [expected[:3], expected[3:6], expected[6:]])
+        self.assertEqual({page.count for page in pages}, {7})
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[1].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_backwards_returns_the_same_pages(self):
+        pages = self.walk_forward(sort='price_asc')
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(store_listing(per_page=3, sort='price_asc', before=back[-1].previous_cursor))
+        self.assertEqual([self.ids(page) for page in back[::-1]], [self.ids(page) for page in pages])
+        self.assertFalse(back[-1].has_previous())
+        self.assertTrue(back[-1].has_next())
+
+    def test_ties_are_ordered_by_id(self):
+        pages = self.walk_forward(sort='price_asc')
+        listed = [product.id for page in pages for product in page]
+        expected = [product.id for product in sorted(self.products, key=lambda product: (product.price, product.id))]
+        self.assertEqual(listed, expected)
+        self.assertEqual(len(set(listed)), len(listed))
+
+        pages = self.walk_forward(sort='price_desc')
+        listed = [product.id for page in pages for product in page]
+        expected = [product.id for product in sorted(self.products, key=lambda product: (-product.price, product.id))]
+        self.assertEqual(listed, expected)
+
+    def test_exact_page_boundary(self):
+        page = store_listing(per_page=7)
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.has_other_pages())
+        last = store_listing(per_page=6, after=store_listing(per_page=6).next_cursor)
+        self.assertEqual(self.ids(last), [self.products[-1].id])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+    def test_filters_and_invalid_cursor(self):
+        page = store_listing(min_price=Decimal('2.00'), max_price=Decimal('4.00'), sort='price_asc')
+        self.assertEqual([product.price for product in page], [Decimal('2.00'), Decimal('3.00'), Decimal('4.00')])
+        self.assertEqual(page.count, 3)
+        # A garbled cursor falls back to the first page
+        self.assertEqual(self.ids(store_listing(per_page=3, after='not-a-cursor')), self.ids(store_listing(per_page=3)))
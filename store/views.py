@@ -4,42 +4,83 @@ from category.models import Category
 from carts.views import _cart_id
 from carts.models import CartItem
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.db.models import Q
+from django.db.models import prefetch_related_objects
 from .forms import ReviewForm
 from django.contrib import messages
 from orders.models import OrderProduct
 from .plant_descriptions import PLANT_DESCRIPTIONS
+from .catalog import get_catalog
+from .search import search_products
+from .listing import SORT_ORDERS, store_listing, default_variations
 
-# Create your views here.
-def store(request, category_slug=None):
-    categories = None
-    products = None
+GLOBAL_MIN_PRICE = 0
+GLOBAL_MAX_PRICE = 5000
 
-    GLOBAL_MIN_PRICE = 0
-    GLOBAL_MAX_PRICE = 5000
+def _price_params(request):
+    """?min_price= and ?max_price=, defaulting to the slider's full range"""
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     min_price = int(min_price) if min_price and min_price.isdigit() else GLOBAL_MIN_PRICE
     max_price = int(max_price) if max_price and max_price.isdigit() else GLOBAL_MAX_PRICE
+    return min_price, max_price
+
+def _rating_params(request):
+    """?min_rating= (0-5) and ?sort= (a SORT_ORDERS key or '')"""
+    try:
+        min_rating = float(request.GET.get('min_rating', 0))
+    except ValueError:
+        min_rating = 0
+    min_rating = min(max(min_rating, 0), 5)
+    sort = request.GET.get('sort', '')
+    if sort not in SORT_ORDERS:
+        sort = ''
+    return min_rating, sort
+
+def _query_string(request):
+    """Current filters without the page number, for pagination links"""
+    params = request.GET.copy()
+    params.pop('page', None)
+    encoded = params.urlencode()
+    return f"{encoded}&" if encoded else ""
+
+def _with_params(request, **params):
+    """Current filters with `params` replaced (None removes one), back on the first page"""
+    query = request.GET.copy()
+    for name in ('page', 'after', 'before'):
+        query.pop(name, None)
+    for name, value in params.items():
+        query.pop(name, None)
+        if value is not None:
+            query[name] = value
+    return query.urlencode()
+
+# Create your views here.
+def store(request, category_slug=None):
+    categories = None
+    min_price, max_price = _price_params(request)
+    min_rating, sort = _rating_params(request)
 
     if category_slug != None:
         categories = get_object_or_404(Category, slug=category_slug)
-        products = Product.objects.filter(category=categories, is_available=True)
-        
-    else:
-        products = Product.objects.all().filter(is_available=True).order_by('id')
-        
-    products = products.filter(price__gte=min_price, price__lte=max_price)
-
-    paginator = Paginator(products, 12)
-    page = request.GET.get('page')
-    paged_products = paginator.get_page(page)
-    product_count = products.count()
+
+    products = store_listing(
+        category=categories,
+        min_price=min_price,
+        max_price=max_price,
+        min_rating=min_rating,
+        sort=sort,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
     context = {
-        'products': paged_products,
-        'product_count': product_count,
+        'products': products,
+        'product_count': products.count,
         'min_price': min_price,
         'max_price': max_price,
+        'min_rating': min_rating,
+        'sort': sort,
+        'next_query': _with_params(request, after=products.next_cursor) if products.has_next() else None,
+        'previous_query': _with_params(request, before=products.previous_cursor) if products.has_previous() else None,
     }
     return render(request, 'store/store.html', context)
 
@@ -80,18 +121,51 @@ def product_detail(request, category_slug, product_slug):
 def search(request):
     products = []
     product_count = 0
-    
-    if 'keyword' in request.GET:
-        keyword = request.GET['keyword']
-        if keyword:
-            products = Product.objects.order_by('-created_date').filter(
-                Q(description__icontains=keyword) | Q(product_name__icontains=keyword)
-            )
-            product_count = products.count()
+    category_facets, price_facets = [], []
+    min_price, max_price = _price_params(request)
+    min_rating, sort = _rating_params(request)
+    category_slug = request.GET.get('category', '')
+    keyword = request.GET.get('keyword', '').strip()
+
+    if keyword:
+        results = search_products(
+            keyword,
+            category=category_slug or None,
+            min_price=min_price if min_price > GLOBAL_MIN_PRICE else None,
+            max_price=max_price if max_price < GLOBAL_MAX_PRICE else None,
+            min_rating=min_rating,
+            order_by=SORT_ORDERS.get(sort),
+            page=request.GET.get('page'),
+        )
+        products, product_count = results.page, results.count
+        products.object_list = list(products.object_list)
+        prefetch_related_objects(products.object_list, default_variations())
+        for facet in results.category_facets:
+            facet['query'] = _with_params(request, category=facet['category__slug'])
+        for facet in results.price_facets:
+            facet['query'] = _with_params(request, min_price=facet['min'], max_price=facet['max'])
+        category_facets, price_facets = results.category_facets, results.price_facets
+        if not product_count and not category_facets:
+            # Nothing matched at all, fall back to the catalog's fuzzy name matcher
+            matches = get_catalog().matcher.top_k(keyword, k=12, cutoff=0.6)
+            ranked_ids = [product_id for _, product_id, _ in matches]
+            matched = Product.objects.filter(id__in=ranked_ids).select_related('category').prefetch_related(default_variations())
+            products = sorted(matched, key=lambda p: ranked_ids.index(p.id))
+            product_count = len(products)
 
     context = {
         'products': products,
         'product_count': product_count,
+        'keyword': keyword,
+        'min_price': min_price,
+        'max_price': max_price,
+        'min_rating': min_rating,
+        'sort': sort,
+        'query_string': _query_string(request),
+        'category_facets': category_facets,
+        'price_facets': price_facets,
+        'selected_category': category_slug,
+        'clear_facets_query': _with_params(request, category=None, min_price=None, max_price=None),
     }
     return render(request, 'store/store.html', context)
 